@@ -0,0 +1,12 @@
+"""Performance benchmarks, run as modules e.g `python -m benchmarks.startup`
+Budgets the benchmarks are checked against live in budgets.json
+"""
+import json
+import os
+
+
+def load_budget(name):
+    """Returns the budget dict for one benchmark"""
+    path = os.path.join(os.path.dirname(__file__), 'budgets.json')
+    with open(path) as f:
+        return json.load(f)[name]
@@ -0,0 +1,189 @@
+"""Latency of date range entry queries as the table grows
+Appends entries at a constant rate (--per-day, created_at increasing
+with id like production data) and, each time the table reaches one of
+--sizes, times --queries random --window-days windows with the queries
+the entry listings run for ?from=&to=:
+    all     every entry of the window, ordered by created_at
+    diary   the same for one diary
+A window holds the same number of rows at every size, so with the
+created_at indexes latency should stay flat while the table grows.
+--no-index drops them to compare against a full scan.
+
+Only ids are fetched, serializing the rows costs the same at every size.
+On Postgres the shared buffers touched by one query of each kind (from
+EXPLAIN (ANALYZE, BUFFERS)) are reported too, they stay flat when only
+the block ranges of the window are read.
+
+    python -m benchmarks.date_range --sizes 100000,1000000,10000000
+    python -m benchmarks.date_range --database-url postgresql:///bench \\
+        --sizes 1000000,10000000,30000000
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.load import percentile
+
+EPOCH = datetime.datetime(2000, 1, 1)
+
+
+def grow(db, Entry, first_id, count, per_day, diaries, users, rng):
+    """Appends count entries after first_id"""
+    from versions.bulk import write_rows
+    step = 86400.0 / per_day
+
+    def rows():
+        for entry_id in range(first_id, first_id + count):
+            yield (entry_id, 'entry', 'text', rng.choice(users),
+                   rng.choice(diaries),
+                   EPOCH + datetime.timedelta(seconds=entry_id * step))
+
+    write_rows(Entry.__table__, (
+        'id', 'title', 'desc', 'user_id', 'diary_id', 'created_at'),
+        rows(), 50000)
+    with db.engine.begin() as conn:
+        conn.execute('ANALYZE')
+
+
+def queries(db, Entry, size, per_day, window, diaries, count, rng):
+    """Returns {kind: [(ms, rows)]} of count random windows"""
+    span = size / float(per_day)
+    results = {'all': [], 'diary': []}
+    for _ in range(count):
+        start = EPOCH + datetime.timedelta(
+            days=rng.uniform(0, max(span - window, 0)))
+        end = start + datetime.timedelta(days=window)
+        in_window = db.session.query(Entry.id).filter(
+            Entry.created_at >= start, Entry.created_at < end)
+        for kind, query in (
+                ('all', in_window),
+                ('diary', in_window.filter(
+                    Entry.diary_id == rng.choice(diaries)))):
+            began = time.perf_counter()
+            rows = query.order_by(Entry.created_at, Entry.id).all()
+            results[kind].append(
+                ((time.perf_counter() - began) * 1000, len(rows)))
+        db.session.rollback()
+    return results
+
+
+def buffers(db, Entry, size, per_day, window, diary):
+    """Shared buffers read by one query of each kind, Postgres only"""
+    if db.engine.dialect.name != 'postgresql':
+        return {}
+    start = EPOCH + datetime.timedelta(days=size / float(per_day) / 2)
+    end = start + datetime.timedelta(days=window)
+    touched = {}
+    for kind, extra in (('all', ''), ('diary', ' AND diary_id = %(diary)s')):
+        plan = db.session.execute(
+            'EXPLAIN (ANALYZE, BUFFERS) SELECT id FROM entries '
+            'WHERE created_at >= %(start)s AND created_at < %(end)s' + extra +
+            ' ORDER BY created_at, id',
+            {'start': start, 'end': end, 'diary': diary}).fetchall()
+        found = re.search(r'Buffers: shared (?:hit=(\d+))? ?(?:read=(\d+))?',
+                          '\n'.join(row[0] for row in plan))
+        touched[kind] = sum(int(n) for n in found.groups() if n) if found else 0
+    db.session.rollback()
+    return touched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100000,1000000,10000000',
+                        help='comma separated table sizes to measure at')
+    parser.add_argument('--per-day', type=int, default=1000,
+                        help='entries created per day')
+    parser.add_argument('--window-days', type=float, default=30)
+    parser.add_argument('--diaries', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=30,
+                        help='random windows timed per size')
+    parser.add_argument('--no-index', action='store_true',
+                        help='drop the created_at indexes first')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database-url',
+                        help='must hold no entries, defaults to a new sqlite '
+                             'file')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as json')
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+
+    folder = None
+    url = args.database_url
+    if not url:
+        folder = tempfile.mkdtemp()
+        url = 'sqlite:///' + os.path.join(folder, 'date_range.db')
+    os.environ.setdefault('ENVIRON', 'Testing')
+    os.environ.setdefault('SECRET', 'benchmark-secret')
+    os.environ['DATABASE_URL'] = os.environ['DATABASE_URL_TEST'] = url
+
+    from versions import app, db, seed
+    from versions.v2.models import Entry
+
+    rng = random.Random(args.seed)
+    report = {}
+    try:
+        db.create_all()
+        if db.session.query(Entry.id).first() is not None:
+            raise SystemExit('{} already holds entries'.format(url))
+        if args.no_index:
+            for index in list(Entry.__table__.indexes):
+                if 'created_at' in index.columns:
+                    index.drop(db.engine)
+        ids = seed.generate(args.diaries // 10 or 1, args.diaries, 0, 0,
+                            seed=args.seed)
+        diaries, users = list(ids['diaries']), list(ids['users'])
+
+        rows = 0
+        for size in sizes:
+            began = time.time()
+            grow(db, Entry, rows + 1, size - rows, args.per_day, diaries,
+                 users, rng)
+            grown = time.time() - began
+            rows = size
+            timings = queries(db, Entry, size, args.per_day, args.window_days,
+                              diaries, args.queries, rng)
+            touched = buffers(db, Entry, size, args.per_day,
+                              args.window_days, diaries[0])
+            report[size] = {'grow_seconds': round(grown, 1)}
+            for kind, samples in timings.items():
+                ms = sorted(sample[0] for sample in samples)
+                report[size][kind] = {
+                    'p50': round(percentile(ms, 50), 2),
+                    'p95': round(percentile(ms, 95), 2),
+                    'rows': int(sum(sample[1] for sample in samples) /
+                                len(samples)),
+                    'buffers': touched.get(kind),
+                }
+            if not args.json:
+                print('{:>10} rows  all p50 {:>8} ms p95 {:>8} ms ({} rows)  '
+                      'diary p50 {:>8} ms p95 {:>8} ms ({} rows){}'.format(
+                          size, report[size]['all']['p50'],
+                          report[size]['all']['p95'],
+                          report[size]['all']['rows'],
+                          report[size]['diary']['p50'],
+                          report[size]['diary']['p95'],
+                          report[size]['diary']['rows'],
+                          '  buffers {all}/{diary}'.format(**touched)
+                          if touched else ''))
+                sys.stdout.flush()
+    finally:
+        db.session.remove()
+        if folder:
+            db.dispose_engines(app)
+            shutil.rmtree(folder)
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
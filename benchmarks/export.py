@@ -0,0 +1,119 @@
+"""Throughput of GET /api/v2/users/<id>/export
+Seeds one user owning --diaries diaries and writing --entries entries,
+then downloads their export in each format through the test client,
+reading the body chunk by chunk like a client would. Reports rows and
+megabytes per second, time to the first chunk, and how much the peak
+RSS of the process grew while exporting, which stays flat when the
+export is streamed.
+
+    python -m benchmarks.export --entries 100000
+    python -m benchmarks.export --database-url postgresql:///bench \\
+        --entries 500000 --batch-size 2000
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+
+def peak_rss_mb():
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def download(client, url, headers):
+    """Returns (bytes, seconds to first chunk, seconds) of one export"""
+    start = time.perf_counter()
+    first = None
+    size = 0
+    response = client.get(url, headers=headers, buffered=False)
+    if response.status_code != 200:
+        raise SystemExit('{} returned {}'.format(url, response.status_code))
+    for chunk in response.response:
+        if first is None:
+            first = time.perf_counter() - start
+        size += len(chunk)
+    response.close()
+    return size, first or 0.0, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--diaries', type=int, default=200)
+    parser.add_argument('--batch-size', type=int,
+                        help='EXPORT_BATCH_SIZE, defaults to app config')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--database-url',
+                        help='seeded here, defaults to a new sqlite file')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as json')
+    args = parser.parse_args()
+
+    folder = None
+    url = args.database_url
+    if not url:
+        folder = tempfile.mkdtemp()
+        url = 'sqlite:///' + os.path.join(folder, 'export.db')
+    os.environ.setdefault('ENVIRON', 'Testing')
+    os.environ.setdefault('SECRET', 'benchmark-secret')
+    os.environ['DATABASE_URL'] = os.environ['DATABASE_URL_TEST'] = url
+
+    import jwt
+    from versions import app, db, seed
+
+    app.config['COMPRESS_ENABLED'] = False
+    if args.batch_size:
+        app.config['EXPORT_BATCH_SIZE'] = args.batch_size
+    results = {}
+    try:
+        db.create_all()
+        ids = seed.generate(1, args.diaries, args.entries, 0, seed=0)
+        user_id = ids['users'][0]
+        token = jwt.encode({'id': user_id}, app.config['SECRET_KEY'])
+        headers = {'x-access-token': token.decode()}
+        rows = args.diaries + args.entries
+        client = app.test_client()
+
+        for fmt in ('ndjson', 'csv'):
+            export_url = '/api/v2/users/{}/export?format={}'.format(
+                user_id, fmt)
+            rss = peak_rss_mb()
+            runs = [download(client, export_url, headers)
+                    for _ in range(args.repeat)]
+            size, first, seconds = min(runs, key=lambda run: run[2])
+            results[fmt] = {
+                'rows': rows,
+                'mb': round(size / 2.0 ** 20, 2),
+                'seconds': round(seconds, 3),
+                'rows_per_second': int(rows / seconds),
+                'mb_per_second': round(size / 2.0 ** 20 / seconds, 2),
+                'first_chunk_ms': round(first * 1000, 2),
+                'peak_rss_growth_mb': round(peak_rss_mb() - rss, 1),
+            }
+    finally:
+        db.session.remove()
+        if folder:
+            db.dispose_engines(app)
+            shutil.rmtree(folder)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return 0
+    print('{:<8} {:>9} {:>9} {:>9} {:>11} {:>9} {:>12} {:>10}'.format(
+        'format', 'rows', 'MB', 'seconds', 'rows/s', 'MB/s',
+        'first chunk', 'RSS grew'))
+    for fmt, r in sorted(results.items()):
+        print('{:<8} {:>9} {:>9} {:>9} {:>11} {:>9} {:>9} ms {:>7} MB'.format(
+            fmt, r['rows'], r['mb'], r['seconds'], r['rows_per_second'],
+            r['mb_per_second'], r['first_chunk_ms'],
+            r['peak_rss_growth_mb']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
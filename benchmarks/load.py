@@ -0,0 +1,275 @@
+"""HTTP load test of the v2 API
+Seeds a database, boots the app on it with gunicorn (or the werkzeug
+server with --server werkzeug) and runs CONCURRENCY virtual users for
+DURATION seconds. Each user logs in then loops over a weighted mix of
+    diaries.search         GET  /api/v2/diaries/?q=&location=
+    diaries.read           GET  /api/v2/diaries/<id>
+    entries.list           GET  /api/v2/diaries/<id>/entries
+    entries.create         POST /api/v2/diaries/<id>/entries
+    notifications.unread   GET  /api/v2/notifications/unread-count
+    notifications.list     GET  /api/v2/notifications
+    auth.register          POST /api/v2/auth/register, then auth.login
+Latency p50/p95/p99 (ms), throughput and errors are reported per
+operation, --output saves them as json for comparing runs.
+
+Data comes from versions.seed, the generator behind `flask seed`. The
+database defaults to a new sqlite file, pass --database-url for
+Postgres. Tables are created if missing, --reset drops them first.
+
+    python -m benchmarks.load --concurrency 8 --duration 30 --output a.json
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'bench2018'
+
+MIX = [
+    ('diaries.search', 30),
+    ('diaries.read', 10),
+    ('entries.list', 15),
+    ('entries.create', 10),
+    ('notifications.unread', 20),
+    ('notifications.list', 10),
+    ('auth.register', 5),
+]
+
+
+def percentile(ordered, p):
+    """Nearest rank percentile of a sorted list"""
+    rank = int(math.ceil(p / 100.0 * len(ordered)))
+    return ordered[max(rank, 1) - 1]
+
+
+class VirtualUser(threading.Thread):
+    """Logs in as one seeded user and runs the MIX until `deadline`"""
+
+    def __init__(self, index, port, user_id, diary_ids, deadline, results):
+        from versions import seed
+        super(VirtualUser, self).__init__()
+        self.index = index
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        self.username = 'seed{}'.format(user_id)
+        self.words = seed.WORDS
+        self.locations = seed.LOCATIONS
+        self.diary_ids = diary_ids
+        self.deadline = deadline
+        self.results = results
+        self.random = random.Random(index)
+        self.token = None
+        self.registered = 0
+
+    def call(self, name, method, path, body=None):
+        headers = {'content-type': 'application/json'}
+        if self.token:
+            headers['x-access-token'] = self.token
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, path, body and json.dumps(body), headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            data, status = b'', 599
+        elapsed = (time.perf_counter() - start) * 1000
+        self.results.setdefault(name, []).append((elapsed, status))
+        return status, data
+
+    def login(self, username):
+        status, data = self.call('auth.login', 'POST', '/api/v2/auth/login', {
+            'username': username, 'password': PASSWORD})
+        if status == 200:
+            self.token = json.loads(data.decode())['token']
+
+    def run(self):
+        self.login(self.username)
+        names = [name for name, weight in MIX for _ in range(weight)]
+        while time.time() < self.deadline:
+            getattr(self, self.random.choice(names).replace('.', '_'))()
+
+    def diaries_search(self):
+        self.call('diaries.search', 'GET', '/api/v2/diaries/?q={}&location={}'
+                  .format(self.random.choice(self.words),
+                          self.random.choice(self.locations)))
+
+    def diaries_read(self):
+        self.call('diaries.read', 'GET', '/api/v2/diaries/{}'.format(
+            self.random.choice(self.diary_ids)))
+
+    def entries_list(self):
+        self.call('entries.list', 'GET', '/api/v2/diaries/{}/entries'.format(
+            self.random.choice(self.diary_ids)))
+
+    def entries_create(self):
+        self.call('entries.create', 'POST', '/api/v2/diaries/{}/entries'
+                  .format(self.random.choice(self.diary_ids)),
+                  {'title': 'load test', 'desc': 'written by benchmarks.load'})
+
+    def notifications_unread(self):
+        self.call('notifications.unread', 'GET',
+                  '/api/v2/notifications/unread-count')
+
+    def notifications_list(self):
+        self.call('notifications.list', 'GET', '/api/v2/notifications')
+
+    def auth_register(self):
+        self.registered += 1
+        username = 'lt{}x{}x{}'.format(
+            self.index, self.registered, uuid.uuid4().hex[:4])
+        self.token = None
+        self.call('auth.register', 'POST', '/api/v2/auth/register', {
+            'username': username, 'fullname': 'load test',
+            'email': username + '@example.com', 'password': PASSWORD})
+        self.login(username)
+
+
+def start_server(kind, port, workers):
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(workers))
+    if kind == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                   '--log-level', 'warning', 'app:app']
+    else:
+        command = [sys.executable, '-c',
+                   'from werkzeug.serving import run_simple; from app import '
+                   'app; run_simple("127.0.0.1", {}, app, threaded=True)'
+                   .format(port)]
+    server = subprocess.Popen(command, cwd=ROOT, env=env,
+                              stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError('server did not start on port {}'.format(port))
+
+
+def summarize(results, duration):
+    report = {}
+    for name, samples in sorted(results.items()):
+        ordered = sorted(elapsed for elapsed, _ in samples)
+        report[name] = {
+            'count': len(samples),
+            'errors': sum(1 for _, status in samples if status >= 400),
+            'rps': round(len(samples) / duration, 1),
+            'mean': round(sum(ordered) / len(ordered), 2),
+            'p50': round(percentile(ordered, 50), 2),
+            'p95': round(percentile(ordered, 95), 2),
+            'p99': round(percentile(ordered, 99), 2),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--workers', type=int, default=2,
+                        help='gunicorn workers')
+    parser.add_argument('--server', choices=['gunicorn', 'werkzeug'],
+                        default='gunicorn')
+    parser.add_argument('--port', type=int, default=8734)
+    parser.add_argument('--database-url')
+    parser.add_argument('--reset', action='store_true',
+                        help='drop and recreate the tables first')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--diaries', type=int, default=600)
+    parser.add_argument('--entries', type=int, default=6000)
+    parser.add_argument('--notifications', type=int, default=4000)
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help='see versions.seed')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as json')
+    parser.add_argument('--output', help='write results as json to a file')
+    args = parser.parse_args()
+
+    folder = None
+    url = args.database_url
+    if not url:
+        folder = tempfile.mkdtemp()
+        url = 'sqlite:///' + os.path.join(folder, 'bench.db')
+    os.environ.setdefault('ENVIRON', 'Testing')
+    os.environ.setdefault('SECRET', 'benchmark-secret')
+    os.environ['DATABASE_URL'] = os.environ['DATABASE_URL_TEST'] = url
+
+    from versions import db, seed
+    if args.reset:
+        db.drop_all()
+    db.create_all()
+    ids = seed.generate(
+        args.users, args.diaries, args.entries, args.notifications,
+        skew=args.skew, password=PASSWORD, seed=0)
+    user_ids, diary_ids = list(ids['users']), list(ids['diaries'])
+    db.session.remove()
+    db.dispose_engines(db.app)
+
+    server = start_server(args.server, args.port, args.workers)
+    try:
+        results = {}
+        deadline = time.time() + args.duration
+        threads = [
+            VirtualUser(i, args.port, user_ids[i % len(user_ids)], diary_ids,
+                        deadline, results.setdefault(i, {}))
+            for i in range(args.concurrency)
+        ]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.time() - start
+    finally:
+        server.terminate()
+        server.wait()
+        if folder:
+            shutil.rmtree(folder)
+
+    merged = {}
+    for per_thread in results.values():
+        for name, samples in per_thread.items():
+            merged.setdefault(name, []).extend(samples)
+    report = {
+        'config': dict(
+            (key, getattr(args, key)) for key in
+            ('concurrency', 'duration', 'workers', 'server', 'users',
+             'diaries', 'entries', 'notifications', 'skew')),
+        'database': url.split(':', 1)[0],
+        'total': summarize(
+            {'all': [s for samples in merged.values() for s in samples]},
+            duration)['all'],
+        'operations': summarize(merged, duration),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print('{:<22} {:>7} {:>6} {:>8} {:>8} {:>8} {:>8}'.format(
+            'operation', 'count', 'errors', 'rps', 'p50', 'p95', 'p99'))
+        for name, r in sorted(report['operations'].items()) + [
+                ('all', report['total'])]:
+            print('{:<22} {:>7} {:>6} {:>8} {:>8} {:>8} {:>8}'.format(
+                name, r['count'], r['errors'], r['rps'], r['p50'], r['p95'],
+                r['p99']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
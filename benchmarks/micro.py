@@ -0,0 +1,214 @@
+"""Microbenchmarks of the hot paths
+    search.*            Diary.Search for every filter combination
+    auth.*              login_required around an empty view,
+                        sha256_crypt.verify of a stored hash
+    serialize.*         versions.v2.serializers.dump_many of 100 rows
+    validate.*          check_keys and the regexes in versions/utils.py
+Every benchmark is warmed up, then timed in REPEAT samples of enough
+calls to last at least MIN_TIME seconds each. Results are per call, in
+microseconds: median, mean, stdev, min and the interquartile range.
+
+--save writes the results as a baseline, --compare checks them against
+one and exits with 1 when a benchmark is more than THRESHOLD slower,
+in both its median and its fastest sample so one noisy sample does not
+fail the run. Baselines are only comparable on the same machine.
+
+    python -m benchmarks.micro --save before.json
+    python -m benchmarks.micro --compare before.json --threshold 0.1
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+SEARCHES = [
+    ('search.all', {}),
+    ('search.q', {'_query': 'food'}),
+    ('search.location', {'location': 'NBO'}),
+    ('search.category', {'category': 'Travel'}),
+    ('search.q_location', {'_query': 'food', 'location': 'NBO'}),
+    ('search.q_category', {'_query': 'food', 'category': 'Travel'}),
+    ('search.location_category', {'location': 'NBO', 'category': 'Travel'}),
+    ('search.q_location_category',
+     {'_query': 'food', 'location': 'NBO', 'category': 'Travel'}),
+]
+
+
+def collect():
+    """Returns (name, function) pairs, the database must be seeded"""
+    import jwt
+    from passlib.hash import sha256_crypt
+    from versions import app, login_required
+    from versions.utils import (
+        check_keys, username_regex, email_regex, password_regex)
+    from versions.v2.models import Diary, User
+    from benchmarks.serialization import make_rows
+
+    benchmarks = []
+    for name, filters in SEARCHES:
+        params = dict(page=1, limit=5, location=None, category=None,
+                      _query=None)
+        params.update(filters)
+        benchmarks.append(
+            (name, lambda params=params: Diary().Search(params)))
+
+    user = User.query.first()
+    token = jwt.encode({'id': user.id}, app.config['SECRET_KEY']).decode()
+    view = login_required(lambda current_user: None)
+    benchmarks.append(('auth.login_required', view))
+    benchmarks.append(('auth.sha256_verify', lambda: sha256_crypt.verify(
+        'bench2018', user.password)))
+
+    rows = make_rows(100)
+    for name in ('diaries', 'entries', 'notifications'):
+        items, _, serializer = rows[name]
+        benchmarks.append(('serialize.' + name,
+                           lambda items=items, serializer=serializer:
+                           serializer.dump_many(items)))
+
+    signup = {'username': 'koitoror', 'fullname': 'daniel jambo',
+              'email': 'daniel.kamar@gmail.com', 'password': 'kamarster2018'}
+    benchmarks.extend([
+        ('validate.check_keys', lambda: check_keys(signup, 4)),
+        ('validate.username', lambda: username_regex.match('koitoror')),
+        ('validate.email', lambda: email_regex.match(signup['email'])),
+        ('validate.password', lambda: password_regex.match('kamarster2018')),
+    ])
+    return benchmarks, {'x-access-token': token}
+
+
+def measure(func, warmup, repeat, min_time):
+    """Per call times in microseconds of `repeat` samples"""
+    for _ in range(warmup):
+        func()
+
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(
+            2, int(min_time / elapsed * 1.2))
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number * 1e6)
+    return samples, number
+
+
+def summarize(samples, number):
+    ordered = sorted(samples)
+    quarter = len(ordered) // 4
+    return {
+        'median': round(statistics.median(ordered), 3),
+        'mean': round(statistics.mean(ordered), 3),
+        'stdev': round(statistics.stdev(ordered), 3)
+        if len(ordered) > 1 else 0.0,
+        'min': round(ordered[0], 3),
+        'iqr': round(ordered[-quarter - 1] - ordered[quarter], 3),
+        'calls': number,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Returns the names whose median and min regressed past threshold"""
+    regressed = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            print('{:<30} no baseline'.format(name))
+            continue
+        before = baseline[name]['median']
+        change = (result['median'] - before) / before if before else 0
+        fastest = result['min'] > before * (1 + threshold)
+        flag = ''
+        if change > threshold and fastest:
+            flag = 'REGRESSED'
+            regressed.append(name)
+        print('{:<30} {:>12.3f} -> {:>12.3f} us {:>+7.1%} {}'.format(
+            name, before, result['median'], change, flag))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filter', default='',
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.05)
+    parser.add_argument('--database-url',
+                        help='seeded here, defaults to a new sqlite file')
+    parser.add_argument('--diaries', type=int, default=2000)
+    parser.add_argument('--json', action='store_true',
+                        help='print results as json')
+    parser.add_argument('--save', help='write results as a baseline file')
+    parser.add_argument('--compare', help='baseline file to check against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='allowed slowdown of the median, 0.1 is 10%%')
+    args = parser.parse_args()
+
+    folder = None
+    url = args.database_url
+    if not url:
+        folder = tempfile.mkdtemp()
+        url = 'sqlite:///' + os.path.join(folder, 'micro.db')
+    os.environ.setdefault('ENVIRON', 'Testing')
+    os.environ.setdefault('SECRET', 'benchmark-secret')
+    os.environ['DATABASE_URL'] = os.environ['DATABASE_URL_TEST'] = url
+
+    from versions import app, db, seed
+    try:
+        db.create_all()
+        seed.generate(args.diaries // 10 or 1, args.diaries,
+                      args.diaries * 2, 0, seed=0)
+        benchmarks, headers = collect()
+        results = {}
+        with app.test_request_context(headers=headers):
+            for name, func in benchmarks:
+                if args.filter not in name:
+                    continue
+                samples, number = measure(
+                    func, args.warmup, args.repeat, args.min_time)
+                results[name] = summarize(samples, number)
+                db.session.rollback()
+    finally:
+        db.session.remove()
+        if folder:
+            db.dispose_engines(app)
+            shutil.rmtree(folder)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    elif not args.compare:
+        print('{:<30} {:>12} {:>12} {:>10} {:>12} {:>10}'.format(
+            'benchmark (us/call)', 'median', 'mean', 'stdev', 'min', 'iqr'))
+        for name, r in sorted(results.items()):
+            print('{:<30} {:>12.3f} {:>12.3f} {:>10.3f} {:>12.3f} '
+                  '{:>10.3f}'.format(name, r['median'], r['mean'],
+                                     r['stdev'], r['min'], r['iqr']))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(results, json.load(f), args.threshold)
+        if regressed:
+            print('regressed: ' + ', '.join(regressed), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""Replays traffic captured by versions.capture against an instance
+Requests are sent at their captured pace divided by --speed (0 sends
+them as fast as --concurrency allows). Json bodies are rebuilt from
+their recorded shape with placeholder values of the same types and
+lengths, and requests that were authenticated get the token of
+--username/--password, logged in on the target first.
+
+Paths are replayed as captured, so the target should hold a copy of the
+data (or a `flask seed` data set) for ids to resolve.
+
+Latency per endpoint is reported next to what was captured. --output
+saves the report as json, --compare prints the change against a report
+of another build.
+
+    python -m benchmarks.replay capture.log --url http://127.0.0.1:8000 \\
+        --speed 4 --username seed1 --password bench2018 --output new.json
+"""
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks.load import summarize
+
+
+def placeholder(shape):
+    """A json value matching a shape recorded by versions.capture"""
+    if isinstance(shape, dict):
+        return dict((key, placeholder(item)) for key, item in shape.items())
+    if isinstance(shape, list):
+        return [placeholder(item) for item in shape]
+    if shape.startswith('str:'):
+        length = int(shape[4:])
+        return ('a1' * length)[:length]
+    return {'int': 1, 'float': 1.0, 'bool': True}.get(shape)
+
+
+def load(path):
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sorted(records, key=lambda record: record['t'])
+
+
+class Replayer(object):
+    """Sends records to `url`, one connection per thread"""
+
+    def __init__(self, url, token=None):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.token = token
+        self.local = threading.local()
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def connection(self):
+        if not hasattr(self.local, 'conn'):
+            self.local.conn = http.client.HTTPConnection(
+                self.host, self.port, timeout=60)
+        return self.local.conn
+
+    def request(self, method, path, body=None, headers=None):
+        conn = self.connection()
+        try:
+            conn.request(method, path, body, headers or {})
+            response = conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            return 599, b''
+
+    def send(self, record):
+        path = record['p']
+        if record['q']:
+            path += '?' + urlencode(record['q'])
+        headers, body = {}, None
+        if record['b'] is not None:
+            headers['content-type'] = 'application/json'
+            body = '{' if record['b'] == 'invalid' else json.dumps(
+                placeholder(record['b']))
+        if record['a'] and self.token:
+            headers['x-access-token'] = self.token
+
+        start = time.perf_counter()
+        status, _ = self.request(record['m'], path, body, headers)
+        elapsed = (time.perf_counter() - start) * 1000
+        name = record['r'] or '{} {}'.format(record['m'], record['p'])
+        with self.lock:
+            self.results.setdefault(name, []).append((elapsed, status))
+
+    def login(self, username, password):
+        status, data = self.request(
+            'POST', '/api/v2/auth/login',
+            json.dumps({'username': username, 'password': password}),
+            {'content-type': 'application/json'})
+        if status != 200:
+            raise SystemExit('login as {} failed with {}'.format(
+                username, status))
+        self.token = json.loads(data.decode())['token']
+
+
+def replay(records, replayer, speed, concurrency):
+    """Sends every record at its captured offset / speed"""
+    first = records[0]['t']
+    start = time.time()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for record in records:
+            if speed:
+                delay = start + (record['t'] - first) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(replayer.send, record)
+    return time.time() - start
+
+
+def compare(report, other):
+    print('{:<36} {:>10} {:>10} {:>8} {:>10} {:>10} {:>8}'.format(
+        'endpoint', 'p50 was', 'p50 now', 'change', 'p95 was', 'p95 now',
+        'change'))
+    for name, now in sorted(report['operations'].items()):
+        was = other['operations'].get(name)
+        if not was:
+            print('{:<36} not in the other report'.format(name))
+            continue
+        print('{:<36} {:>10} {:>10} {:>+8.1%} {:>10} {:>10} {:>+8.1%}'.format(
+            name, was['p50'], now['p50'], now['p50'] / was['p50'] - 1,
+            was['p95'], now['p95'], now['p95'] / was['p95'] - 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('capture', help='file written through CAPTURE_FILE')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='2 replays twice as fast, 0 without pauses')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as json')
+    parser.add_argument('--output', help='write the report as json')
+    parser.add_argument('--compare', help='report of another build')
+    args = parser.parse_args()
+
+    records = load(args.capture)
+    if not records:
+        raise SystemExit('no requests in {}'.format(args.capture))
+    replayer = Replayer(args.url)
+    if args.username:
+        replayer.login(args.username, args.password)
+
+    duration = replay(records, replayer, args.speed, args.concurrency)
+    captured = {}
+    for record in records:
+        name = record['r'] or '{} {}'.format(record['m'], record['p'])
+        captured.setdefault(name, []).append((record['d'], record['s']))
+    span = (records[-1]['t'] - records[0]['t']) or 1
+    report = {
+        'requests': len(records),
+        'speed': args.speed,
+        'operations': summarize(replayer.results, duration),
+        'captured': summarize(captured, span),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    elif args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    else:
+        print('{:<36} {:>7} {:>6} {:>10} {:>10} {:>10} {:>10}'.format(
+            'endpoint', 'count', 'errors', 'p50', 'p95', 'p99',
+            'captured p50'))
+        for name, r in sorted(report['operations'].items()):
+            print('{:<36} {:>7} {:>6} {:>10} {:>10} {:>10} {:>10}'.format(
+                name, r['count'], r['errors'], r['p50'], r['p95'], r['p99'],
+                report['captured'][name]['p50']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Serialization microbenchmark
+Times building the json body for ROWS diaries, entries and notifications
+the way the handlers used to (dict literal per row + jsonify) against
+versions.v2.serializers (precompiled field lists + JSON_BACKEND).
+Reports milliseconds per 1k rows.
+
+    python -m benchmarks.serialization --rows 1000 --repeat 20
+"""
+import argparse
+import datetime
+import sys
+import timeit
+
+from flask import jsonify
+from versions import app
+from versions.v2 import serializers
+from versions.v2.models import Diary, Entry, Notification, User
+
+
+def legacy_diary(diary):
+    return {
+        'id': diary.id,
+        'name': diary.name,
+        'logo': diary.logo,
+        'location': diary.location,
+        'category': diary.category,
+        'bio': diary.bio,
+        'owner': diary.owner.username,
+        'created_at': diary.created_at,
+        'updated_at': diary.updated_at
+    }
+
+
+def legacy_entry(entry):
+    return {
+        'id': entry.id,
+        'title': entry.title,
+        'desc': entry.desc,
+        'entryer': entry.entryer.username,
+        'diary': entry.diary.name,
+        'created_at': entry.created_at,
+        'updated_at': entry.updated_at
+    }
+
+
+def legacy_notification(notification):
+    return {
+        'id': notification.id,
+        'recipient_id': notification.recipient.username,
+        'actor': notification.actor,
+        'diary_id': notification.diary_id,
+        'entry_id': notification.entry_id,
+        'action': notification.action,
+        'created_at': notification.created_at,
+        'read_at': notification.read_at,
+        'act': notification.actor + notification.action,
+        'url': '/diary/{}#entry-{}'.format(
+            notification.diary_id, notification.entry_id)
+    }
+
+
+def make_rows(count):
+    """Transient rows, nothing touches the database"""
+    now = datetime.datetime.utcnow()
+    owner = User('owner', 'diary owner', 'owner@gmail.com', 'benchmark1')
+    diaries, entries, notifications = [], [], []
+    for i in range(count):
+        diary = Diary(
+            name='diary {}'.format(i), logo='url', location='NBO',
+            category='Technology', bio='bio ' * 10, owner=owner)
+        diary.id, diary.created_at, diary.updated_at = i, now, now
+        entry = Entry('title {}'.format(i), 'lorem ipsum ' * 20, diary, owner)
+        entry.id, entry.created_at, entry.updated_at = i, now, now
+        notification = Notification(owner, 'actor', i, i, read_at=now)
+        notification.id, notification.created_at = i, now
+        diaries.append(diary)
+        entries.append(entry)
+        notifications.append(notification)
+    return {
+        'diaries': (diaries, legacy_diary, serializers.diary),
+        'entries': (entries, legacy_entry, serializers.entry),
+        'notifications': (
+            notifications, legacy_notification, serializers.notification),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--backend', default=None,
+                        help='JSON_BACKEND to use, defaults to app config')
+    args = parser.parse_args()
+
+    if args.backend:
+        app.config['JSON_BACKEND'] = args.backend
+    app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+    scale = 1000.0 / args.rows * 1000
+
+    with app.test_request_context():
+        for name, (rows, legacy, serializer) in sorted(
+                make_rows(args.rows).items()):
+            before = min(timeit.repeat(
+                lambda: jsonify({name: [legacy(row) for row in rows]}),
+                number=1, repeat=args.repeat)) * scale
+            after = min(timeit.repeat(
+                lambda: serializers.json_response(
+                    {name: serializer.dump_many(rows)}),
+                number=1, repeat=args.repeat)) * scale
+            print('{:<14} legacy {:>7.2f} ms/1k  serializer {:>7.2f} ms/1k  '
+                  '{:>5.2f}x'.format(name, before, after, before / after))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
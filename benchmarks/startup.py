@@ -0,0 +1,101 @@
+"""Cold start benchmark
+Every run is a fresh interpreter, measures
+    import_ms: cumulative `python -X importtime` of `import app`
+    first_response_ms: from interpreter start until the first response
+        to PATH through the test client has been built
+Medians are compared against the "startup" budget in budgets.json,
+exits with 1 when over budget.
+
+    ENVIRON=Production python -m benchmarks.startup --runs 5 --path /
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from benchmarks import load_budget
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_RESPONSE = '''
+import time
+start = time.perf_counter()
+from app import app
+app.test_client().get({path!r})
+print((time.perf_counter() - start) * 1000)
+'''
+
+IMPORT_WALL = '''
+import time
+start = time.perf_counter()
+import app
+print((time.perf_counter() - start) * 1000)
+'''
+
+
+def import_ms():
+    """Cumulative import time of the app module in ms"""
+    if sys.version_info < (3, 7):
+        # no -X importtime, fall back to wall time of the import
+        return run(IMPORT_WALL)
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=ROOT, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    match = re.search(r'\|\s*(\d+) \| app$', result.stderr, re.M)
+    return int(match.group(1)) / 1000.0
+
+
+def run(code):
+    result = subprocess.run(
+        [sys.executable, '-c', code], cwd=ROOT,
+        stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as json')
+    args = parser.parse_args()
+
+    samples = {
+        'import_ms': [import_ms() for _ in range(args.runs)],
+        'first_response_ms': [
+            run(FIRST_RESPONSE.format(path=args.path))
+            for _ in range(args.runs)
+        ],
+    }
+    budget = load_budget('startup')
+    results = dict(
+        (name, {
+            'median': round(statistics.median(values), 1),
+            'min': round(min(values), 1),
+            'max': round(max(values), 1),
+            'budget': budget[name],
+        }) for name, values in samples.items()
+    )
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        for name in sorted(results):
+            r = results[name]
+            print('{:<20} median {:>8.1f} min {:>8.1f} max {:>8.1f} '
+                  'budget {:>6}'.format(
+                      name, r['median'], r['min'], r['max'], r['budget']))
+
+    over = [name for name, r in results.items() if r['median'] > r['budget']]
+    if over:
+        print('over budget: ' + ', '.join(sorted(over)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,11 +10,96 @@ class Config(object):
     SECRET_KEY = os.getenv('SECRET')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
+    # connection pool, see versions/database.py
+    DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', 5))
+    DATABASE_MAX_OVERFLOW = int(os.getenv('DATABASE_MAX_OVERFLOW', 10))
+    DATABASE_POOL_TIMEOUT = int(os.getenv('DATABASE_POOL_TIMEOUT', 30))
+    DATABASE_POOL_RECYCLE = int(os.getenv('DATABASE_POOL_RECYCLE', 1800))
+    DATABASE_POOL_PRE_PING = True
+    DATABASE_STATEMENT_TIMEOUT = int(
+        os.getenv('DATABASE_STATEMENT_TIMEOUT', 30000))
+    DATABASE_PGBOUNCER = os.getenv(
+        'DATABASE_PGBOUNCER', 'false').lower() == 'true'
+    # comma separated read replica urls for GET requests
+    DATABASE_REPLICA_URLS = [
+        url for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url
+    ]
+    DATABASE_REPLICA_HEALTH_INTERVAL = 10
+    DATABASE_READ_YOUR_WRITES = 5
+    # commit once per request instead of on every model save()
+    SQLALCHEMY_REQUEST_TRANSACTION = os.getenv(
+        'SQLALCHEMY_REQUEST_TRANSACTION', 'false').lower() == 'true'
+    # read notifications older than this are archived (or deleted)
+    NOTIFICATION_RETENTION_DAYS = int(
+        os.getenv('NOTIFICATION_RETENTION_DAYS', 90))
+    NOTIFICATION_RETENTION_BATCH_SIZE = int(
+        os.getenv('NOTIFICATION_RETENTION_BATCH_SIZE', 1000))
+    NOTIFICATION_RETENTION_ARCHIVE = os.getenv(
+        'NOTIFICATION_RETENTION_ARCHIVE', 'true').lower() == 'true'
+    # json encoder for api responses, see versions/v2/serializers.py
+    JSON_BACKEND = os.getenv('JSON_BACKEND', 'json')
+    # rows per yield_per batch of streamed listings
+    STREAM_BATCH_SIZE = 500
+    # rows per server side cursor fetch of user exports
+    EXPORT_BATCH_SIZE = 1000
+    # bulk imports, see versions/v2/importer.py
+    IMPORT_ASYNC = True
+    IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', 2))
+    IMPORT_BATCH_SIZE = 5000
+    IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', 512 * 2 ** 20))
+    IMPORT_MAX_ERRORS = 100
+    # response compression, see versions/compression.py
+    COMPRESS_ENABLED = True
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+    COMPRESS_BR_QUALITY = 4
+    COMPRESS_MIMETYPES = [
+        'application/json', 'text/html', 'text/css', 'text/plain',
+        'application/javascript', 'text/javascript',
+        'application/x-ndjson', 'text/csv'
+    ]
+    # names of the blueprints to serve, None serves all of them
+    BLUEPRINTS = None
+    # page size for GET /api/v2/users, ?limit= is capped at the max
+    USERS_PAGE_SIZE = 20
+    USERS_PAGE_SIZE_MAX = 100
+    # same for GET /api/v2/diaries/entries/search
+    SEARCH_PAGE_SIZE = 20
+    SEARCH_PAGE_SIZE_MAX = 100
+    # shared by the gunicorn workers so /metrics covers all of them,
+    # see versions/metrics.py
+    METRICS_DIR = os.getenv('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = 1.0
+    # log requests running more SQL statements than this, 0 disables,
+    # see versions/instrumentation.py
+    SQL_STATEMENT_THRESHOLD = int(os.getenv('SQL_STATEMENT_THRESHOLD', 50))
+    # one JSON line per request on stderr
+    ACCESS_LOG = os.getenv('ACCESS_LOG', 'false').lower() == 'true'
+    # profile requests sent with X-Profile or sampled at random,
+    # see versions/profiling.py
+    PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', 'false').lower() == 'true'
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_MODE = os.getenv('PROFILE_MODE', 'deterministic')
+    PROFILE_INTERVAL = 0.005
+    # peak memory per request with tracemalloc, see versions/memory.py
+    MEMORY_TRACKING = os.getenv('MEMORY_TRACKING', 'false').lower() == 'true'
+    MEMORY_TRACE_FRAMES = 10
+    MEMORY_REPORT_BYTES = int(os.getenv('MEMORY_REPORT_BYTES', 50 * 2 ** 20))
+    MEMORY_TOP_SITES = 5
+    # requests holding more than this get a 503, 0 disables
+    MEMORY_BUDGET_BYTES = int(os.getenv('MEMORY_BUDGET_BYTES', 0))
+    # append sanitized request records here for benchmarks/replay.py,
+    # see versions/capture.py
+    CAPTURE_FILE = os.getenv('CAPTURE_FILE')
+    CAPTURE_SAMPLE_RATE = float(os.getenv('CAPTURE_SAMPLE_RATE', 1))
 
 
 class Development(Config):
     """Sets Debug mode in Development to True"""
     DEBUG = True
+    DATABASE_POOL_SIZE = 2
+    DATABASE_MAX_OVERFLOW = 2
 
 
 class Testing(Config):
@@ -22,6 +107,11 @@ class Testing(Config):
     DEBUG = True
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL_TEST')
+    DATABASE_POOL_SIZE = 2
+    DATABASE_MAX_OVERFLOW = 0
+    DATABASE_POOL_PRE_PING = False
+    # imports finish within the request that uploaded them
+    IMPORT_ASYNC = False
 
 
 class Production(Config):
@@ -29,3 +119,11 @@ class Production(Config):
     DEBUG = False
     TESTING = False
     MAIL_SUPPRESS_SEND = False
+    JSONIFY_PRETTYPRINT_REGULAR = False
+    # sized per gunicorn worker: workers * (size + overflow)
+    # must stay below the server's max_connections
+    DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', 10))
+    DATABASE_MAX_OVERFLOW = int(os.getenv('DATABASE_MAX_OVERFLOW', 5))
+    DATABASE_POOL_RECYCLE = int(os.getenv('DATABASE_POOL_RECYCLE', 300))
+    DATABASE_STATEMENT_TIMEOUT = int(
+        os.getenv('DATABASE_STATEMENT_TIMEOUT', 10000))
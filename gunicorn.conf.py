@@ -0,0 +1,38 @@
+"""gunicorn settings, `gunicorn -c gunicorn.conf.py app:app`
+The app is imported once in the master (preload_app) and workers are
+forked from it, sharing its memory copy-on-write. The master closes its
+database connections before forking so no worker inherits a socket.
+Set METRICS_DIR so /metrics reports the requests of every worker.
+"""
+import gc
+import os
+
+bind = '0.0.0.0:{}'.format(os.getenv('PORT', '8000'))
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+preload_app = True
+
+
+def on_starting(server):
+    """Drops the metric files left by the workers of the last run"""
+    path = os.getenv('METRICS_DIR')
+    if path and os.path.isdir(path):
+        for filename in os.listdir(path):
+            if filename.endswith('.json'):
+                os.remove(os.path.join(path, filename))
+
+
+def when_ready(server):
+    """Runs in the master once the app is loaded, before any fork"""
+    from versions import app, db
+
+    # compile templates once instead of in every worker
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    db.dispose_engines(app)
+
+    # keep the garbage collector from touching, and so copying,
+    # the pages holding objects loaded in the master
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
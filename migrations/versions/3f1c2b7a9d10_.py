@@ -0,0 +1,32 @@
+"""add unread_count counter cache to users
+
+Revision ID: 3f1c2b7a9d10
+Revises: 859b56bcdc32
+Create Date: 2026-10-19 09:12:41.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2b7a9d10'
+down_revision = '859b56bcdc32'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column(
+        'unread_count', sa.Integer(), server_default='0', nullable=False))
+    # backfill counter from existing unread notifications
+    op.execute(
+        'UPDATE users SET unread_count = ('
+        'SELECT count(*) FROM notifications '
+        'WHERE notifications.recipient_id = users.id '
+        'AND notifications.read_at IS NULL)'
+    )
+
+
+def downgrade():
+    op.drop_column('users', 'unread_count')
@@ -0,0 +1,26 @@
+"""index user_id of diaries and entries for per user exports
+
+Revision ID: 5d2e8f1a3c47
+Revises: c4a81f2e7b93
+Create Date: 2026-10-19 15:02:41.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2e8f1a3c47'
+down_revision = 'c4a81f2e7b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_diaries_user_id'), 'diaries', ['user_id'], unique=False)
+    op.create_index(op.f('ix_entries_user_id'), 'entries', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_entries_user_id'), table_name='entries')
+    op.drop_index(op.f('ix_diaries_user_id'), table_name='diaries')
@@ -0,0 +1,36 @@
+"""GIN full-text index over entry titles and texts
+
+Revision ID: 7e4a1c9b2f60
+Revises: 9b3f6c2d1e58
+Create Date: 2026-10-19 18:12:37.240511
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e4a1c9b2f60'
+down_revision = '9b3f6c2d1e58'
+branch_labels = None
+depends_on = None
+
+# must stay identical to versions.v2.search.document()
+DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(\"desc\", '')), 'B')"
+)
+
+
+def upgrade():
+    # sqlite searches with the in process index instead
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE INDEX ix_entries_search ON entries USING gin (({}))'
+               .format(DOCUMENT))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_entries_search', table_name='entries')
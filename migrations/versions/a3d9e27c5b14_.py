@@ -0,0 +1,27 @@
+"""created_at indexes for date range entry listings
+
+Revision ID: a3d9e27c5b14
+Revises: 7e4a1c9b2f60
+Create Date: 2026-10-19 19:31:08.917264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d9e27c5b14'
+down_revision = '7e4a1c9b2f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # BRIN on Postgres, a btree elsewhere
+    op.create_index('ix_entries_created_at', 'entries', ['created_at'], unique=False, postgresql_using='brin', postgresql_with={'pages_per_range': 32})
+    op.create_index('ix_entries_diary_id_created_at', 'entries', ['diary_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_entries_diary_id_created_at', table_name='entries')
+    op.drop_index('ix_entries_created_at', table_name='entries')
@@ -0,0 +1,39 @@
+"""add notifications_archive for notification retention
+
+Revision ID: b6e0d41c58a2
+Revises: 3f1c2b7a9d10
+Create Date: 2026-10-19 10:03:18.550921
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e0d41c58a2'
+down_revision = '3f1c2b7a9d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notifications_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('recipient_id', sa.Integer(), nullable=False),
+    sa.Column('actor', sa.String(), nullable=False),
+    sa.Column('diary_id', sa.Integer(), nullable=False),
+    sa.Column('entry_id', sa.Integer(), nullable=False),
+    sa.Column('action', sa.String(), nullable=False),
+    sa.Column('read_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_notifications_archive_recipient_id'), 'notifications_archive', ['recipient_id'], unique=False)
+    op.create_index(op.f('ix_notifications_read_at'), 'notifications', ['read_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_notifications_read_at'), table_name='notifications')
+    op.drop_index(op.f('ix_notifications_archive_recipient_id'), table_name='notifications_archive')
+    op.drop_table('notifications_archive')
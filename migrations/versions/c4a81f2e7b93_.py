@@ -0,0 +1,41 @@
+"""server side defaults for created_at and updated_at
+
+Revision ID: c4a81f2e7b93
+Revises: b6e0d41c58a2
+Create Date: 2026-10-19 11:26:05.731842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a81f2e7b93'
+down_revision = 'b6e0d41c58a2'
+branch_labels = None
+depends_on = None
+
+timestamps = {
+    'users': ['created_at', 'updated_at'],
+    'diaries': ['created_at', 'updated_at'],
+    'entries': ['created_at', 'updated_at'],
+    'notifications': ['created_at'],
+}
+
+
+def upgrade():
+    for table, columns in timestamps.items():
+        for column in columns:
+            op.alter_column(
+                table, column,
+                existing_type=sa.DateTime(),
+                server_default=sa.text('CURRENT_TIMESTAMP'))
+
+
+def downgrade():
+    for table, columns in timestamps.items():
+        for column in columns:
+            op.alter_column(
+                table, column,
+                existing_type=sa.DateTime(),
+                server_default=None)
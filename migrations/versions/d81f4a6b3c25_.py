@@ -0,0 +1,43 @@
+"""diary and entry counter caches
+
+Revision ID: d81f4a6b3c25
+Revises: a3d9e27c5b14
+Create Date: 2026-10-19 21:04:52.318640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81f4a6b3c25'
+down_revision = 'a3d9e27c5b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column(
+        'diary_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('diaries', sa.Column(
+        'entry_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('diaries', sa.Column(
+        'last_entry_at', sa.DateTime(), nullable=True))
+    # backfill counters from existing diaries and entries
+    op.execute(
+        'UPDATE users SET diary_count = ('
+        'SELECT count(*) FROM diaries WHERE diaries.user_id = users.id)'
+    )
+    op.execute(
+        'UPDATE diaries SET entry_count = ('
+        'SELECT count(*) FROM entries WHERE entries.diary_id = diaries.id), '
+        'last_entry_at = ('
+        'SELECT max(created_at) FROM entries '
+        'WHERE entries.diary_id = diaries.id)'
+    )
+
+
+def downgrade():
+    op.drop_column('diaries', 'last_entry_at')
+    op.drop_column('diaries', 'entry_count')
+    op.drop_column('users', 'diary_count')
@@ -0,0 +1,29 @@
+"""read your writes marker on access tokens, token lookup index
+
+Revision ID: e6b2c8d4f019
+Revises: d81f4a6b3c25
+Create Date: 2026-10-20 10:12:37.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b2c8d4f019'
+down_revision = 'd81f4a6b3c25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('authtokens', sa.Column(
+        'primary_until', sa.DateTime(), nullable=True))
+    # every authenticated request looks its token up
+    op.create_index(op.f('ix_authtokens_token'), 'authtokens', ['token'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_authtokens_token'), table_name='authtokens')
+    op.drop_column('authtokens', 'primary_until')
@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+import unittest
+from sqlalchemy import create_engine
+from versions import app, create_app
+from versions.database import TimedQueuePool
+
+
+class TestAppFactory(unittest.TestCase):
+    def test_create_app(self):
+        """Test factory builds a separate app with all routes"""
+        new_app = create_app('config.Testing')
+        self.assertIsNot(new_app, app)
+        self.assertTrue(new_app.config['TESTING'])
+
+        rules = set(rule.rule for rule in new_app.url_map.iter_rules())
+        self.assertIn('/api/v2/diaries/', rules)
+        self.assertIn('/api/v2/notifications/unread-count', rules)
+        self.assertIn('prune-notifications', new_app.cli.commands)
+
+        response = new_app.test_client().get('/api/v2/users/100')
+        self.assertEqual(response.status_code, 404)
+
+    def test_blueprints_from_config(self):
+        """Test only blueprints listed in config are registered"""
+        class OnlyUsers(object):
+            BLUEPRINTS = ['users_v2']
+            SQLALCHEMY_DATABASE_URI = app.config['SQLALCHEMY_DATABASE_URI']
+
+        new_app = create_app(OnlyUsers)
+        self.assertEqual(list(new_app.blueprints), ['users_v2'])
+
+    def test_lazy_extensions(self):
+        """Test importing the app does not load Alembic or Flask-Mail"""
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, app; '
+            'print(sorted(set(["flask_migrate", "alembic", "flask_mail"]) '
+            '& set(sys.modules)))'
+        ], universal_newlines=True)
+        self.assertEqual(output.strip(), '[]')
+
+    def test_inherited_connection_is_replaced(self):
+        """Test a pooled connection from another process is not reused"""
+        engine = create_engine(
+            'sqlite://', poolclass=TimedQueuePool, pool_size=1)
+        with engine.connect() as conn:
+            inherited = conn.connection.connection
+            conn.connection._connection_record.info['pid'] = os.getpid() + 1
+        with engine.connect() as conn:
+            self.assertIsNot(conn.connection.connection, inherited)
+            self.assertEqual(
+                conn.connection._connection_record.info['pid'], os.getpid())
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+import unittest
+import config
+from versions import create_app
+from versions.v2.models import User, db
+
+
+class TestCapture(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mktemp(suffix='.log')
+
+        class Captured(config.Testing):
+            CAPTURE_FILE = self.path
+
+        self.app = create_app(Captured).test_client()
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def records(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_request_is_recorded_without_secrets(self):
+        """Test bodies are kept as shapes and secrets are dropped"""
+        response = self.app.post(
+            '/api/v2/auth/login?token=abc&page=2',
+            data=json.dumps({'username': 'nobody', 'password': 'secret123'}),
+            headers={'content-type': 'application/json',
+                     'x-access-token': 'jwt-value'})
+        # the app still got the body
+        self.assertEqual(response.status_code, 401)
+        # the record is written once the body has been sent
+        response.close()
+
+        record, = self.records()
+        self.assertEqual(record['m'], 'POST')
+        self.assertEqual(record['p'], '/api/v2/auth/login')
+        self.assertEqual(record['r'], 'auth_v2.login')
+        self.assertEqual(record['q'], {'token': '***', 'page': '2'})
+        self.assertEqual(
+            record['b'], {'username': 'str:6', 'password': 'str:9'})
+        self.assertEqual(record['a'], 1)
+        self.assertEqual(record['s'], 401)
+        self.assertEqual(record['n'], len(response.data))
+        self.assertGreaterEqual(record['d'], 0)
+
+        with open(self.path) as f:
+            text = f.read()
+        for secret in ('secret123', 'jwt-value', 'abc', 'nobody'):
+            self.assertNotIn(secret, text)
+
+    def test_verify_key_is_masked(self):
+        """Test the account verification secret is not written"""
+        user = User('verified', 'to verify', 'verify@gmail.com', 'x')
+        user.save()
+        os.environ['DESTINATION_URL'] = 'http://localhost/'
+        try:
+            response = self.app.get('/api/v2/auth/verify?key={}&name={}'
+                                    .format(user.hash_key, user.username))
+            response.close()
+        finally:
+            del os.environ['DESTINATION_URL']
+            db.session.delete(user)
+            db.session.commit()
+
+        record, = self.records()
+        self.assertEqual(record['r'], 'auth_v2.verify')
+        self.assertEqual(record['s'], 301)
+        self.assertEqual(record['q'], {'key': '***', 'name': '***'})
+        with open(self.path) as f:
+            self.assertNotIn(user.hash_key, f.read())
+
+    def test_unmatched_route(self):
+        """Test requests to unknown paths are recorded without endpoint"""
+        self.app.get('/no/such/page').close()
+        record, = self.records()
+        self.assertIsNone(record['r'])
+        self.assertEqual(record['s'], 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import gzip
+import json
+import unittest
+import zlib
+from versions import app, compression
+from versions.v2.models import User, db
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object('config.Testing')
+        self.app = app.test_client()
+
+    def test_large_json_is_gzipped(self):
+        """Test responses over the threshold are compressed"""
+        db.session.execute(User.__table__.insert(), [
+            {
+                'username': 'user_{}'.format(i),
+                'fullname': 'user', 'email': 'user_{}@gmail.com'.format(i),
+                'password': 'x', 'hash_key': str(i), 'activate': False
+            } for i in range(20)
+        ])
+        db.session.commit()
+
+        response = self.app.get(
+            '/api/v2/users', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        users = json.loads(gzip.decompress(response.data).decode('utf-8'))
+        self.assertEqual(len(users), 20)
+
+    def test_small_or_unaccepted_is_not_compressed(self):
+        """Test small bodies and clients without gzip get plain json"""
+        response = self.app.get(
+            '/api/v2/users/100', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+        response = self.app.get('/api/v2/users')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_streamed_response_is_compressed(self):
+        """Test streamed bodies are compressed chunk by chunk"""
+        chunks = [b'{"a": [', b'1,' * 10, b'1]}']
+        with app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+            response = app.response_class(
+                iter(chunks), mimetype='application/json')
+            response = compression.compress_response(response)
+            body = b''.join(response.response)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), b''.join(chunks))
+
+    def test_streamed_chunks_are_flushed(self):
+        """Test each streamed chunk can be decoded as soon as it is sent"""
+        chunks = [b'{"a": [', b'1,' * 10, b'1]}']
+        with app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+            response = app.response_class(
+                iter(chunks), mimetype='application/json')
+            body = compression.compress_response(response).response
+            decoder = zlib.decompressobj(31)
+            for chunk in chunks:
+                self.assertEqual(decoder.decompress(next(body)), chunk)
+            decoder.decompress(b''.join(body))
+        self.assertTrue(decoder.eof)
+
+    def test_static_precompressed(self):
+        """Test static files are sent from their .gz variant"""
+        response = self.app.get(
+            '/static/swagger_v2.json', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.mimetype, 'application/json')
+        with open(app.static_folder + '/swagger_v2.json', 'rb') as f:
+            self.assertEqual(gzip.decompress(response.data), f.read())
+        response.close()
+
+        response = self.app.get('/static/swagger_v2.json')
+        self.assertNotIn('Content-Encoding', response.headers)
+        response.close()
+
+    def tearDown(self):
+        """Clean-up db"""
+        db.session.query(User).delete()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    unittest.main()
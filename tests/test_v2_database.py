@@ -0,0 +1,170 @@
+import os
+import json
+import tempfile
+import unittest
+import jwt
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+import config
+from versions import app, db
+from versions.v2.models import User, AuthToken, Diary
+from versions.database import engine_options, TimedQueuePool
+
+
+class TestEngineOptions(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.url = make_url('postgresql://diary@localhost/diary')
+
+    def options(self, config_class, **overrides):
+        settings = dict(
+            (key, getattr(config_class, key)) for key in dir(config_class)
+            if key.isupper()
+        )
+        settings.update(overrides)
+        return engine_options(settings, self.url)
+
+    def test_pool_options_per_config(self):
+        """Test pool sizing comes from the config class"""
+        options = self.options(config.Production)
+        self.assertIs(options['poolclass'], TimedQueuePool)
+        self.assertEqual(
+            options['pool_size'], config.Production.DATABASE_POOL_SIZE)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertIn('statement_timeout', options['connect_args']['options'])
+
+        options = self.options(config.Testing)
+        self.assertEqual(options['max_overflow'], 0)
+        self.assertFalse(options['pool_pre_ping'])
+
+    def test_pgbouncer_mode(self):
+        """Test no startup options are sent to PgBouncer"""
+        options = self.options(config.Production, DATABASE_PGBOUNCER=True)
+        self.assertNotIn('connect_args', options)
+
+    def test_sqlite_has_no_pool_options(self):
+        """Test sqlite keeps its own pool"""
+        self.assertEqual(
+            engine_options({}, make_url('sqlite:////tmp/diary.db')), {})
+
+    def test_metrics_endpoint(self):
+        """Test pool metrics are exported"""
+        self.app.get('/api/v2/diaries/')
+        response = self.app.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db_pool_checkouts_total', response.get_data(as_text=True))
+
+
+class TestReplicaRouting(unittest.TestCase):
+    def setUp(self):
+        """Uses a second sqlite database as the read replica
+        the replica has a user the primary does not know about
+        """
+        app.config.from_object('config.Testing')
+        self.app = app.test_client()
+        self.replica_dir = tempfile.mkdtemp()
+        self.replica_url = 'sqlite:///' + os.path.join(
+            self.replica_dir, 'replica.db')
+        replica = create_engine(self.replica_url)
+        db.metadata.create_all(replica)
+        replica.execute(User.__table__.insert().values(
+            id=999, username='replica', fullname='replica',
+            email='replica@gmail.com', password='x',
+            hash_key='x', activate=False))
+        replica.dispose()
+        app.config['DATABASE_REPLICA_URLS'] = [self.replica_url]
+        self.new_user_info = {
+            'username': 'primary',
+            'fullname': 'primary user',
+            'email': 'primary@gmail.com',
+            'password': 'kamarster2018'
+        }
+
+    def test_get_reads_from_replica(self):
+        """Test GET requests are served by the replica"""
+        response = self.app.get('/api/v2/users/999')
+        self.assertEqual(response.status_code, 200)
+
+    def test_unhealthy_replica_is_skipped(self):
+        """Test a replica that cannot connect is not used"""
+        app.config['DATABASE_REPLICA_URLS'] = [
+            'sqlite:////nonexistent/dir/replica.db', self.replica_url]
+        for _ in range(3):
+            response = self.app.get('/api/v2/users/999')
+            self.assertEqual(response.status_code, 200)
+
+    def test_read_your_writes(self):
+        """Test a client that wrote reads from the primary"""
+        response = self.app.post(
+            '/api/v2/auth/register',
+            data=json.dumps(self.new_user_info),
+            content_type='application/json'
+        )
+        user_id = json.loads(response.get_data(as_text=True))['success']['id']
+
+        response = self.app.get('/api/v2/users/{}'.format(user_id))
+        self.assertEqual(response.status_code, 200)
+        response = self.app.get('/api/v2/users/999')
+        self.assertEqual(response.status_code, 404)
+
+    def token_user(self):
+        """A user on the primary only, with a logged in token"""
+        user = User('primary', 'primary user', 'primary@gmail.com', 'x')
+        user.save()
+        token = jwt.encode(
+            {'id': user.id}, app.config['SECRET_KEY']).decode()
+        AuthToken(token).save()
+        return user, token
+
+    def test_token_check_reads_primary(self):
+        """Test a logged out token is refused even if the replica
+        still has it valid
+        """
+        user, token = self.token_user()
+        AuthToken.query.filter_by(token=token).update({'valid': False})
+        db.session.commit()
+        replica = create_engine(self.replica_url)
+        replica.execute(AuthToken.__table__.insert().values(
+            token=token, valid=True))
+        replica.dispose()
+
+        response = self.app.get('/api/v2/diaries/entries',
+                                headers={'x-access-token': token})
+        self.assertEqual(response.status_code, 401)
+
+    def test_read_your_writes_by_token(self):
+        """Test a client sending no cookies reads from the primary
+        after it wrote, through its access token
+        """
+        user, token = self.token_user()
+        client = app.test_client(use_cookies=False)
+        headers = {'x-access-token': token}
+        url = '/api/v2/users/{}'.format(user.id)
+        self.assertEqual(client.get(url, headers=headers).status_code, 404)
+
+        response = client.post(
+            '/api/v2/diaries/',
+            data=json.dumps({'name': 'Crown', 'logo': 'url',
+                             'category': 'Construction', 'location': 'NBO',
+                             'bio': 'if you like it crown it'}),
+            headers=dict(headers, **{'content-type': 'application/json'}))
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(client.get(url, headers=headers).status_code, 200)
+        # other clients still read from the replica
+        self.assertEqual(client.get(url).status_code, 404)
+
+    def tearDown(self):
+        """Clean-up db and drop the replica"""
+        app.config['DATABASE_REPLICA_URLS'] = []
+        db.get_replicas(app)
+        db.session.query(AuthToken).delete()
+        db.session.query(Diary).delete()
+        db.session.query(User).delete()
+        db.session.commit()
+        os.remove(os.path.join(self.replica_dir, 'replica.db'))
+        os.rmdir(self.replica_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
 import unittest
 import json
-from versions import app
-from versions.v2.models import User, db, Diary
+import datetime
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+from versions import app, commands
+from versions.v2.models import User, db, Diary, Entry
 
 
 class TestDiaryV2(unittest.TestCase):
@@ -198,6 +201,89 @@ class TestDiaryV2(unittest.TestCase):
         self.assertEqual(response.status_code, 404)
         self.assertIn('Diary Not Found', str(response.data))
 
+    def test_no_reload_after_save(self):
+        """Test saved diary attributes are readable without new queries
+        """
+        owner = User('robert', 'robert jambo', 'robert@gmail.com', 'robert2018')
+        owner.save()
+        diary = Diary(name='Crown', owner=owner)
+        diary.save()
+
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        db.event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            self.assertIsNotNone(diary.id)
+            self.assertIsNotNone(diary.created_at)
+            self.assertIsNotNone(diary.updated_at)
+            self.assertEqual(diary.owner.username, 'robert')
+        finally:
+            db.event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(statements, [])
+
+    def test_counter_cache(self):
+        """v2 Test entry and diary counts follow creates and deletes"""
+        user = User('owner', 'diary owner', 'owner@gmail.com', 'x')
+        diary = Diary(name='Counted', owner=user)
+        other = Diary(name='Other', owner=user)
+        db.session.add_all([diary, other])
+        db.session.commit()
+        self.assertEqual(user.diary_count, 2)
+        self.assertEqual((diary.entry_count, diary.last_entry_at), (0, None))
+
+        older = Entry('older', 'text', diary, user)
+        older.created_at = datetime.datetime(2018, 1, 1)
+        newer = Entry('newer', 'text', diary, user)
+        newer.created_at = datetime.datetime(2018, 2, 1)
+        db.session.add_all([older, newer])
+        db.session.commit()
+        self.assertEqual(diary.entry_count, 2)
+        self.assertEqual(diary.last_entry_at, newer.created_at)
+
+        newer.delete()
+        db.session.commit()
+        self.assertEqual(diary.entry_count, 1)
+        self.assertEqual(diary.last_entry_at, older.created_at)
+        other.delete()
+        db.session.commit()
+        self.assertEqual(user.diary_count, 1)
+
+        response = self.app.get('/api/v2/users/{}'.format(user.id))
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual(data['user']['diary_count'], 1)
+        response = self.app.get('/api/v2/users/{}/diaries'.format(user.id))
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual(data[0]['entry_count'], 1)
+        self.assertEqual(data[0]['last_entry_at'],
+                         'Mon, 01 Jan 2018 00:00:00 GMT')
+
+    def test_reconcile_counts(self):
+        """v2 Test reconciliation fixes drifted counters"""
+        user = User('owner', 'diary owner', 'owner@gmail.com', 'x')
+        diary = Diary(name='Counted', owner=user)
+        db.session.add(Entry('entry', 'text', diary, user))
+        db.session.commit()
+        Diary.query.update({Diary.entry_count: 5, Diary.last_entry_at: None})
+        User.query.update({User.diary_count: 0})
+        db.session.commit()
+
+        self.assertEqual(Diary.reconcile_counts(), (1, 1))
+        self.assertEqual(Diary.reconcile_counts(), (0, 0))
+        db.session.expire_all()
+        self.assertEqual(diary.entry_count, 1)
+        self.assertIsNotNone(diary.last_entry_at)
+        self.assertEqual(user.diary_count, 1)
+
+        # app.test_cli_runner() is Flask 1.0+
+        result = CliRunner().invoke(
+            commands.reconcile_counts,
+            obj=ScriptInfo(create_app=lambda info: app))
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('0 diary(s) and 0 user(s)', result.output)
+
     def register_user(self):
         return self.app.post(
             '/api/v2/auth/register',
@@ -230,6 +316,7 @@ class TestDiaryV2(unittest.TestCase):
 
     def tearDown(self):
         """Clean-up db"""
+        db.session.query(Entry).delete()
         db.session.query(Diary).delete()
         db.session.query(User).delete()
         db.session.commit()
@@ -1,5 +1,7 @@
+import datetime
 import json
 import unittest
+import jwt
 from versions import app
 from versions.v2.models import User, db, Diary, Entry
 
@@ -104,6 +106,52 @@ class TestEntryV2(unittest.TestCase):
             db.exists().where(Entry.title == self.new_entry['title']))
         self.assertTrue(exists)
 
+    def test_read_entries_by_date(self):
+        """Get entries created in a date range, oldest first
+        """
+        user = User('oliver', 'oliver kamar', 'oliver@maseno.com', 'x')
+        diary = Diary(name='Crown paints', owner=user)
+        db.session.add_all([user, diary])
+        for day in [31, 1, 15]:
+            entry = Entry('march {}'.format(day), 'text', diary, user)
+            entry.created_at = datetime.datetime(2018, 3, day, 23, 59)
+            db.session.add(entry)
+        april = Entry('april', 'text', diary, user)
+        april.created_at = datetime.datetime(2018, 4, 1)
+        db.session.add(april)
+        db.session.commit()
+
+        resp = self.app.get('/api/v2/diaries/{}/entries'
+                            '?from=2018-03-01&to=2018-03-31'.format(diary.id))
+        titles = [entry['title'] for entry in
+                  json.loads(resp.get_data(as_text=True))['entries']]
+        self.assertEqual(titles, ['march 1', 'march 15', 'march 31'])
+
+        token = jwt.encode({'id': user.id}, app.config['SECRET_KEY'])
+        resp = self.app.get(
+            '/api/v2/diaries/entries?from=2018-03-15T12:00:00%2B03:00',
+            headers={"x-access-token": token.decode()})
+        titles = [entry['title'] for entry in
+                  json.loads(resp.get_data(as_text=True))['Entries']]
+        self.assertEqual(titles, ['march 15', 'march 31', 'april'])
+
+        resp = self.app.get(
+            '/api/v2/diaries/{}/entries?to=March'.format(diary.id))
+        self.assertEqual(resp.status_code, 400)
+        resp = self.app.get('/api/v2/diaries/{}/entries'
+                            '?from=2018-03-10&to=2018-03-01'.format(diary.id))
+        self.assertEqual(resp.status_code, 400)
+        resp = self.app.get('/api/v2/diaries/{}/entries'
+                            '?from=2018-03-01T10:00&to=2018-03-01T10:00'
+                            .format(diary.id))
+        self.assertEqual(resp.status_code, 400)
+        # a date alone as to is the whole day, the same day is a range
+        resp = self.app.get('/api/v2/diaries/{}/entries'
+                            '?from=2018-03-31&to=2018-03-31'.format(diary.id))
+        titles = [entry['title'] for entry in
+                  json.loads(resp.get_data(as_text=True))['entries']]
+        self.assertEqual(titles, ['march 31'])
+
     def register_user(self):
         return self.app.post(
             '/api/v2/auth/register',
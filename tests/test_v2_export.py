@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+import unittest
+import jwt
+from versions import app
+from versions.v2.models import User, db, Diary, Entry
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object('config.Testing')
+        self.app = app.test_client()
+        self.user = User('owner', 'diary owner', 'owner@gmail.com', 'x')
+        other = User('other', 'other user', 'other@gmail.com', 'x')
+        db.session.add_all([self.user, other])
+        db.session.commit()
+        diary = Diary(name='Crown', location='NBO', owner=self.user)
+        db.session.add(diary)
+        db.session.add(Diary(name='Other', owner=other))
+        for i in range(5):
+            db.session.add(Entry('entry {}'.format(i), 'text', diary,
+                                 self.user))
+        db.session.add(Entry('not mine', 'text', diary, other))
+        db.session.commit()
+        self.url = '/api/v2/users/{}/export'.format(self.user.id)
+        self.headers = {'x-access-token': jwt.encode(
+            {'id': self.user.id}, app.config['SECRET_KEY']).decode()}
+
+    def get(self, url=None, **headers):
+        headers.update(self.headers)
+        response = self.app.get(url or self.url, headers=headers)
+        self.streamed = response.is_streamed
+        data = response.get_data(as_text=True)
+        response.close()
+        return response, data
+
+    def test_ndjson(self):
+        """Test the export holds the user's diaries then entries"""
+        app.config['EXPORT_BATCH_SIZE'] = 2
+        response, data = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.streamed)
+        records = [json.loads(line) for line in data.splitlines()]
+        self.assertEqual([r['kind'] for r in records], ['diary'] + ['entry'] * 5)
+        self.assertEqual(records[0]['title'], 'Crown')
+        self.assertEqual(records[1]['diary_id'], records[0]['id'])
+        self.assertEqual(response.headers['X-Total-Count'], '6')
+
+    def test_csv(self):
+        """Test csv has a header and one row per record"""
+        response, data = self.get(self.url + '?format=csv')
+        self.assertEqual(response.mimetype, 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(data)))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]['location'], 'NBO')
+
+    def test_resume(self):
+        """Test Range: rows skips what was received"""
+        response, data = self.get()
+        lines = data.splitlines()
+        etag = response.headers['ETag']
+
+        response, rest = self.get(Range='rows=4-', **{'If-Range': etag})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['Content-Range'], 'rows 4-5/6')
+        self.assertEqual(rest.splitlines(), lines[4:])
+
+        response, _ = self.get(Range='rows=6-')
+        self.assertEqual(response.status_code, 416)
+
+        Entry.query.filter_by(title='entry 0').delete()
+        db.session.commit()
+        response, _ = self.get(Range='rows=4-', **{'If-Range': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_owner(self):
+        """Test only the user can export their data"""
+        response, _ = self.get('/api/v2/users/{}/export'.format(
+            self.user.id + 1))
+        self.assertEqual(response.status_code, 401)
+        response, _ = self.get(self.url + '?format=xml')
+        self.assertEqual(response.status_code, 400)
+
+    def tearDown(self):
+        """Clean-up db"""
+        db.session.query(Entry).delete()
+        db.session.query(Diary).delete()
+        db.session.query(User).delete()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import json
+import time
+import unittest
+from unittest import mock
+import jwt
+from versions import app
+from versions.v2 import importer
+from versions.v2.models import User, db, Diary, Entry, ImportJob, ImportRow
+
+
+class TestImports(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object('config.Testing')
+        self.app = app.test_client()
+        self.user = User('owner', 'diary owner', 'owner@gmail.com', 'x')
+        self.other = User('other', 'other user', 'other@gmail.com', 'x')
+        db.session.add_all([self.user, self.other])
+        db.session.commit()
+        self.mine = Diary(name='Mine', owner=self.user)
+        self.theirs = Diary(name='Theirs', owner=self.other)
+        db.session.add_all([self.mine, self.theirs])
+        db.session.commit()
+        self.headers = {'x-access-token': jwt.encode(
+            {'id': self.user.id}, app.config['SECRET_KEY']).decode()}
+
+    def upload(self, body, content_type='application/x-ndjson'):
+        headers = dict(self.headers)
+        headers['content-type'] = content_type
+        return self.app.post('/api/v2/imports', data=body, headers=headers)
+
+    def ndjson(self, *records):
+        return '\n'.join(json.dumps(record) for record in records)
+
+    def test_ndjson_import(self):
+        """Test diaries and entries are created, entries find their diary"""
+        body = self.ndjson(
+            {'kind': 'entry', 'diary_id': 'a', 'title': 'first',
+             'text': 'hello', 'created_at': '2018-03-09T07:05:03'},
+            {'kind': 'diary', 'id': 'a', 'title': 'Imported',
+             'location': 'NBO'},
+            {'kind': 'entry', 'diary_id': str(self.mine.id), 'title': 'second',
+             'text': 'world'})
+        response = self.upload(body)
+        self.assertEqual(response.status_code, 202)
+        job = json.loads(response.get_data(as_text=True))['job']
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual((job['rows'], job['diaries'], job['entries']),
+                         (3, 1, 2))
+
+        imported = Diary.query.filter_by(name='Imported').one()
+        self.assertEqual(imported.user_id, self.user.id)
+        first = Entry.query.filter_by(title='first').one()
+        self.assertEqual(first.diary_id, imported.id)
+        self.assertEqual(first.created_at.year, 2018)
+        self.assertEqual(
+            Entry.query.filter_by(title='second').one().diary_id, self.mine.id)
+        self.assertEqual(ImportRow.query.count(), 0)
+        # merged without the ORM, the session still holds the old counts
+        db.session.expire_all()
+        self.assertEqual(imported.entry_count, 1)
+        self.assertEqual(imported.last_entry_at, first.created_at)
+        self.assertEqual(Diary.query.get(self.mine.id).entry_count, 1)
+        self.assertEqual(User.query.get(self.user.id).diary_count, 2)
+
+        status = self.app.get(response.headers['Location'],
+                              headers=self.headers)
+        self.assertEqual(
+            json.loads(status.get_data(as_text=True))['job']['status'], 'done')
+
+    def test_csv_import(self):
+        """Test a csv upload, as written by the export"""
+        body = ('kind,id,diary_id,title,text,location\n'
+                'diary,7,,Csv diary,bio,MSA\n'
+                'entry,,7,csv entry,text,\n')
+        response = self.upload(body, 'text/csv')
+        job = json.loads(response.get_data(as_text=True))['job']
+        self.assertEqual(job['status'], 'done', job['errors'])
+        self.assertEqual(
+            Diary.query.filter_by(name='Csv diary').one().location, 'MSA')
+        self.assertEqual(Entry.query.count(), 1)
+
+    def test_invalid_rows_fail_the_job(self):
+        """Test nothing is created when any record is invalid"""
+        body = self.ndjson(
+            {'kind': 'diary', 'id': 'a', 'title': 'Imported'},
+            {'kind': 'entry', 'diary_id': 'a', 'title': 'no text'},
+            {'kind': 'entry', 'diary_id': str(self.theirs.id),
+             'title': 'theirs', 'text': 'x'},
+            {'kind': 'diary', 'id': 'b', 'title': 'Mine'}) + '\n{'
+        response = self.upload(body)
+        job = json.loads(response.get_data(as_text=True))['job']
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['errors'][0],
+                         {'line': 2, 'error': 'text is required'})
+        self.assertEqual(job['errors'][1],
+                         {'line': 5, 'error': 'not valid json'})
+        self.assertEqual(Diary.query.count(), 2)
+        self.assertEqual(Entry.query.count(), 0)
+        self.assertEqual(ImportRow.query.count(), 0)
+
+        # references are only checked once every record is valid
+        body = self.ndjson(
+            {'kind': 'entry', 'diary_id': str(self.theirs.id),
+             'title': 'theirs', 'text': 'x'},
+            {'kind': 'diary', 'id': 'b', 'title': 'Mine'})
+        job = json.loads(self.upload(body).get_data(as_text=True))['job']
+        self.assertEqual([error['error'] for error in job['errors']], [
+            'diary {} is not in the file or not yours'.format(self.theirs.id),
+            'diary name Mine is already taken'])
+
+    def test_name_taken_during_import(self):
+        """Test a diary name taken by another user after the checks
+        fails the job instead of linking entries to that user's diary
+        """
+        check_references = importer.check_references
+
+        def race(*args):
+            check_references(*args)
+            db.session.add(Diary(name='Imported', owner=self.other))
+            db.session.commit()
+
+        body = self.ndjson(
+            {'kind': 'diary', 'id': 'a', 'title': 'Imported'},
+            {'kind': 'entry', 'diary_id': 'a', 'title': 'first', 'text': 'x'})
+        with mock.patch.object(importer, 'check_references', race):
+            job = json.loads(self.upload(body).get_data(as_text=True))['job']
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['errors'],
+                         [{'line': None,
+                           'error': 'diary name Imported is already taken'}])
+        self.assertEqual(Entry.query.count(), 0)
+        self.assertEqual(Diary.query.filter_by(name='Imported').one().user_id,
+                         self.other.id)
+        self.assertEqual(ImportRow.query.count(), 0)
+
+    def test_background_job(self):
+        """Test an async import is reported through the status endpoint"""
+        app.config['IMPORT_ASYNC'] = True
+        body = self.ndjson({'kind': 'diary', 'id': 'a', 'title': 'Later'})
+        response = self.upload(body)
+        self.assertEqual(response.status_code, 202)
+        url = response.headers['Location']
+
+        for _ in range(100):
+            status = self.app.get(url, headers=self.headers)
+            job = json.loads(status.get_data(as_text=True))['job']
+            if job['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.05)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['diaries'], 1)
+
+    def test_rejected_uploads(self):
+        """Test format, size and ownership checks"""
+        self.assertEqual(self.upload('x', 'text/plain').status_code, 400)
+        app.config['IMPORT_MAX_BYTES'] = 10
+        self.assertEqual(self.upload('x' * 11).status_code, 413)
+
+        job = ImportJob(self.other.id, 'csv')
+        job.save()
+        response = self.app.get('/api/v2/imports/{}'.format(job.id),
+                                headers=self.headers)
+        self.assertEqual(response.status_code, 401)
+
+    def tearDown(self):
+        """Clean-up db"""
+        db.session.remove()
+        db.session.query(ImportRow).delete()
+        db.session.query(ImportJob).delete()
+        db.session.query(Entry).delete()
+        db.session.query(Diary).delete()
+        db.session.query(User).delete()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    unittest.main()
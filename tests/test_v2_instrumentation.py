@@ -0,0 +1,76 @@
+import json
+import unittest
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from versions import app, metrics
+from versions.v2.models import User, db
+
+
+class TestStatementCounting(unittest.TestCase):
+    def setUp(self):
+        """Creates the app as test client with two users"""
+        app.config.from_object('config.Testing')
+        self.app = app.test_client()
+        for name in ['user_a', 'user_b']:
+            User(name, name, name + '@gmail.com', 'kamarster2018').save()
+        metrics.reset()
+
+    def tearDown(self):
+        app.config.from_object('config.Testing')
+        metrics.reset()
+        db.session.query(User).delete()
+        db.session.commit()
+
+    def test_debug_headers(self):
+        """Test statements and time are reported in debug mode"""
+        response = self.app.get('/api/v2/users')
+        # the users, then their diaries in one selectinload query
+        self.assertEqual(response.headers['X-DB-Statements'], '2')
+        self.assertGreater(float(response.headers['X-DB-Time']), 0)
+        self.assertEqual(response.headers['X-DB-Commits'], '0')
+
+        app.config['DEBUG'] = False
+        response = self.app.get('/api/v2/users')
+        self.assertNotIn('X-DB-Statements', response.headers)
+
+    def test_metrics(self):
+        """Test statement totals are exported per endpoint"""
+        self.app.get('/api/v2/users')
+        self.app.get('/api/v2/users')
+        text = metrics.render()
+        self.assertIn(
+            'db_statements_total{endpoint="users_v2.get_all_users"} 4', text)
+        self.assertIn(
+            'db_statements_per_request_bucket'
+            '{endpoint="users_v2.get_all_users",le="2"} 2', text)
+
+    def test_threshold_is_logged(self):
+        """Test requests over the statement threshold are logged"""
+        app.config['SQL_STATEMENT_THRESHOLD'] = 1
+        with self.assertLogs(app.logger, 'WARNING') as logs:
+            self.app.get('/api/v2/users')
+        self.assertIn('ran 2 statements', logs.output[0])
+        self.assertIn('1 x SELECT', logs.output[0])
+
+    def test_access_log(self):
+        """Test a JSON access log line is written per request"""
+        app.config['ACCESS_LOG'] = True
+        with self.assertLogs('versions.access', 'INFO') as logs:
+            self.app.get('/api/v2/users')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['endpoint'], 'users_v2.get_all_users')
+        self.assertEqual(line['status'], 200)
+        self.assertEqual(line['db_statements'], 2)
+        self.assertEqual(line['db_commits'], 0)
+
+
+    def test_failed_statement_is_dropped(self):
+        """Test a failing statement does not leave its start time behind"""
+        with app.test_request_context():
+            conn = db.session.connection()
+            with self.assertRaises((OperationalError, ProgrammingError)):
+                conn.execute('SELECT * FROM no_such_table')
+            self.assertEqual(conn.info.get('statement_started'), [])
+            db.session.rollback()
+
+if __name__ == '__main__':
+    unittest.main()
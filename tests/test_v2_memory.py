@@ -0,0 +1,85 @@
+import json
+import tracemalloc
+import unittest
+from unittest import mock
+import config
+from versions import create_app, memory, metrics
+from versions.v2.models import User, db
+
+
+class TestMemoryTracking(unittest.TestCase):
+    def setUp(self):
+        """Creates an app with memory tracking and a few users"""
+        class Tracked(config.Testing):
+            MEMORY_TRACKING = True
+
+        self.app = create_app(Tracked)
+        self.client = self.app.test_client()
+        db.session.execute(User.__table__.insert(), [
+            {
+                'username': name, 'fullname': name,
+                'email': name + '@gmail.com', 'password': 'x',
+                'hash_key': name, 'activate': False
+            } for name in ['user_a', 'user_b', 'user_c']
+        ])
+        db.session.commit()
+        metrics.reset()
+
+    def tearDown(self):
+        tracemalloc.stop()
+        metrics.reset()
+        db.session.query(User).delete()
+        db.session.commit()
+
+    def test_disabled_by_default(self):
+        """Test tracemalloc is not started unless enabled"""
+        tracemalloc.stop()
+        create_app('config.Testing')
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_peak_per_endpoint(self):
+        """Test request peaks are exported per endpoint"""
+        response = self.client.get('/api/v2/users')
+        self.assertEqual(response.status_code, 200)
+        text = metrics.render()
+        self.assertIn(
+            'http_request_peak_bytes_count{endpoint="users_v2.get_all_users"}'
+            ' 1', text)
+        self.assertIn(
+            'http_request_peak_bytes_max{endpoint="users_v2.get_all_users"}',
+            text)
+
+    def test_peak_without_reset_peak(self):
+        """Test peaks are still recorded on Pythons before 3.9"""
+        # create, the attribute does not exist on those versions
+        missing = mock.Mock(side_effect=AttributeError('reset_peak'))
+        with mock.patch.object(memory, 'RESETS_PEAK', False), \
+                mock.patch.object(tracemalloc, 'reset_peak', missing,
+                                  create=True):
+            response = self.client.get('/api/v2/users')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'http_request_peak_bytes_count{endpoint="users_v2.get_all_users"}'
+            ' 1', metrics.render())
+
+    def test_worst_offenders_are_logged(self):
+        """Test requests over the report size log allocation sites"""
+        self.app.config['MEMORY_REPORT_BYTES'] = 0
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            self.client.get('/api/v2/users')
+        self.assertIn('top allocation sites', logs.output[0])
+        self.assertIn('KiB in', logs.output[0])
+
+    def test_budget(self):
+        """Test a request over its memory budget gets a 503"""
+        self.app.config['MEMORY_BUDGET_BYTES'] = 1
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            response = self.client.get('/api/v2/users')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('memory budget', json.loads(
+            response.get_data(as_text=True))['warning'])
+        self.assertIn('over its 1 byte budget', logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
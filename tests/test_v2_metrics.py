@@ -0,0 +1,79 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from versions import app, metrics
+
+
+class TestRequestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_requests_are_counted_and_timed(self):
+        """Test every request lands in the counter and histogram"""
+        self.app.get('/')
+        self.app.get('/')
+        self.app.get('/no-such-page')
+        text = self.app.get('/metrics').data.decode()
+        self.assertIn(
+            'http_requests_total{endpoint="routes.version2",method="GET",'
+            'status="200"} 2', text)
+        self.assertIn(
+            'http_requests_total{endpoint="unmatched",method="GET",'
+            'status="404"} 1', text)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn(
+            'http_request_duration_seconds_bucket{endpoint="routes.version2",'
+            'le="+Inf",method="GET"} 2', text)
+        self.assertIn(
+            'http_request_duration_seconds_count{endpoint="routes.version2",'
+            'method="GET"} 2', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test a bucket counts every sample at or below its bound"""
+        metrics.describe('test_seconds', 'histogram', 'Test', (0.1, 1.0))
+        for value in (0.05, 0.5, 5):
+            metrics.observe('test_seconds', value)
+        text = metrics.render()
+        self.assertIn('test_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('test_seconds_bucket{le="1.0"} 2\n', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3\n', text)
+        self.assertLess(
+            text.index('le="0.1"'), text.index('le="1.0"'))
+
+
+class TestMultiprocessMetrics(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved = dict(metrics._multiprocess)
+        metrics._multiprocess['dir'] = self.dir
+        metrics.reset()
+
+    def tearDown(self):
+        metrics._multiprocess.update(self.saved)
+        metrics.reset()
+        shutil.rmtree(self.dir)
+
+    def test_workers_are_added_up(self):
+        """Test /metrics sums the files written by every worker"""
+        with open(os.path.join(self.dir, '1.json'), 'w') as f:
+            json.dump([['http_requests_total',
+                        [['endpoint', 'routes.version2'], ['method', 'GET'],
+                         ['status', 200]], 3]], f)
+        metrics.inc('http_requests_total', 2, endpoint='routes.version2',
+                    method='GET', status=200)
+        text = metrics.render()
+        self.assertIn(
+            'http_requests_total{endpoint="routes.version2",method="GET",'
+            'status="200"} 5', text)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.dir, '{}.json'.format(os.getpid()))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 import unittest
 import json
+import datetime
 from versions import app
 from versions.v2.models import User, db, Notification, Diary, Entry
+from versions.v2.models import NotificationArchive
 
 
 class TestNotification(unittest.TestCase):
@@ -19,6 +21,18 @@ class TestNotification(unittest.TestCase):
             'email': 'daniel.kamar@gmail.com',
             'password': 'kamarster@gmail.com'
         }
+        self.owner_info = {
+            'username': 'owner',
+            'fullname': 'diary owner',
+            'email': 'owner@gmail.com',
+            'password': 'kamarster2018'
+        }
+        self.entryer_info = {
+            'username': 'entryer',
+            'fullname': 'diary entryer',
+            'email': 'entryer@gmail.com',
+            'password': 'kamarster2018'
+        }
 
     def test_get_notification(self):
         """Test get notification
@@ -37,6 +51,138 @@ class TestNotification(unittest.TestCase):
         warning = json.loads(response.get_data(as_text=True))['warning']
         self.assertEqual('user has no notifications', warning)
 
+    def test_unread_count(self):
+        """Test unread counter goes up on entry and down once read
+        """
+        owner_token = self.signup_and_login(self.owner_info)
+        entryer_token = self.signup_and_login(self.entryer_info)
+        diary = self.app.post(
+            '/api/v2/diaries/',
+            data=json.dumps({
+                'name': 'Owners diary',
+                'logo': 'url',
+                'location': 'NBO',
+                'category': 'Technology',
+                'bio': 'bio'
+            }),
+            headers={
+                "content-type": "application/json",
+                "x-access-token": owner_token
+            }
+        )
+        diary_id = json.loads(diary.get_data(as_text=True))['diary']['id']
+        self.app.post(
+            '/api/v2/diaries/{}/entries'.format(diary_id),
+            data=json.dumps({'title': 'hello', 'desc': 'world'}),
+            headers={
+                "content-type": "application/json",
+                "x-access-token": entryer_token
+            }
+        )
+        self.assertEqual(self.unread_count(owner_token), 1)
+
+        self.app.get(
+            '/api/v2/notifications',
+            headers={"x-access-token": owner_token}
+        )
+        self.assertEqual(self.unread_count(owner_token), 0)
+
+    def test_all_notifications_streamed(self):
+        """Test history is streamed and only unread ones are counted down
+        """
+        token = self.signup_and_login(self.owner_info)
+        user = User.query.filter_by(username='owner').first()
+        read_at = datetime.datetime.utcnow()
+        for read in [None, None, read_at]:
+            Notification(user, 'actor', 1, 1, read_at=read).save()
+        self.assertEqual(self.unread_count(token), 2)
+
+        response = self.app.get(
+            '/api/v2/notifications/all',
+            headers={"x-access-token": token}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        notifications = json.loads(
+            response.get_data(as_text=True))['notifications']
+        self.assertEqual(len(notifications), 3)
+        self.assertEqual(self.unread_count(token), 0)
+        self.assertEqual(Notification.query.filter(
+            Notification.read_at == read_at).count(), 1)
+
+    def test_reconcile_unread_count(self):
+        """Test reconciliation fixes a drifted counter
+        """
+        token = self.signup_and_login(self.owner_info)
+        user = User.query.filter_by(username='owner').first()
+        user.unread_count = 7
+        user.save()
+
+        self.assertEqual(Notification.reconcile_unread_counts(), 1)
+        self.assertEqual(self.unread_count(token), 0)
+
+    def test_prune_read_notifications(self):
+        """Test only old read notifications are archived
+        """
+        user = User('owner', 'diary owner', 'owner@gmail.com', 'kamarster2018')
+        user.save()
+        now = datetime.datetime.utcnow()
+        old = now - datetime.timedelta(days=100)
+        for read_at in [old, old, now, None]:
+            Notification(user, 'actor', 1, 1, read_at=read_at).save()
+
+        before = now - datetime.timedelta(days=90)
+        batches = list(Notification.prune_read(before, batch_size=1))
+
+        self.assertEqual(batches, [1, 1])
+        self.assertEqual(Notification.query.count(), 2)
+        self.assertEqual(NotificationArchive.query.count(), 2)
+        self.assertIsNotNone(NotificationArchive.query.first().archived_at)
+
+    def test_mark_many_read(self):
+        """Test only the given unread notifications are counted down
+        """
+        user = User('owner', 'diary owner', 'owner@gmail.com', 'kamarster2018')
+        user.save()
+        read_at = datetime.datetime.utcnow()
+        notifications = [Notification(user, 'actor', 1, 1, read_at=read)
+                         for read in [None, None, None, read_at]]
+        for notification in notifications:
+            notification.save()
+        db.session.expire(user)
+        self.assertEqual(user.unread_count, 3)
+
+        ids = [notification.id for notification in notifications[1:]]
+        self.assertEqual(Notification.mark_many_read(user.id, ids), 2)
+        db.session.expire_all()
+        self.assertEqual(user.unread_count, 1)
+        self.assertIsNone(notifications[0].read_at)
+        self.assertEqual(notifications[3].read_at, read_at)
+
+    def unread_count(self, token):
+        response = self.app.get(
+            '/api/v2/notifications/unread-count',
+            headers={"x-access-token": token}
+        )
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.get_data(as_text=True))['unread']
+
+    def signup_and_login(self, info):
+        self.app.post(
+            '/api/v2/auth/register',
+            data=json.dumps(info),
+            content_type='application/json'
+        )
+        response = self.app.post(
+            '/api/v2/auth/login',
+            data=json.dumps({
+                'username': info['username'],
+                'password': info['password']
+            }),
+            content_type='application/json'
+        )
+        return json.loads(response.get_data(as_text=True))['token']
+
     def register(self):
         return self.app.post(
             '/api/v2/auth/register',
@@ -53,6 +199,7 @@ class TestNotification(unittest.TestCase):
         
     def tearDown(self):
         """Clean-up db"""
+        db.session.query(NotificationArchive).delete()
         db.session.query(Notification).delete()
         db.session.query(Entry).delete()
         db.session.query(Diary).delete()
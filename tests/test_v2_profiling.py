@@ -0,0 +1,84 @@
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import config
+from versions import create_app
+from versions.profiling import StackSampler, make_token
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+        class Profiled(config.Testing):
+            PROFILE_ENABLED = True
+            PROFILE_DIR = self.dir
+
+        self.config = Profiled
+        self.app = create_app(Profiled)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_disabled_by_default(self):
+        """Test no profiling hooks exist unless enabled"""
+        app = create_app('config.Testing')
+        hooks = [f.__name__ for f in app.before_request_funcs.get(None, [])]
+        self.assertNotIn('start_profile', hooks)
+
+    def test_signed_header(self):
+        """Test a request with a valid X-Profile token is profiled"""
+        token = make_token(self.config.SECRET_KEY)
+        response = self.client.get('/', headers={'X-Profile': token})
+        name = response.headers['X-Profile-File']
+        self.assertIn('-routes.version2-{}-'.format(os.getpid()), name)
+        self.assertTrue(name.endswith('.prof'))
+        stats = pstats.Stats(os.path.join(self.dir, name))
+        self.assertTrue(any(
+            func[2] == 'version2' for func in stats.stats))
+
+    def test_bad_or_missing_header(self):
+        """Test requests without a valid token are not profiled"""
+        response = self.client.get('/', headers={'X-Profile': 'forged'})
+        self.assertNotIn('X-Profile-File', response.headers)
+        self.client.get('/')
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_sample_rate(self):
+        """Test every request is profiled at a sample rate of 1"""
+        self.app.config['PROFILE_SAMPLE_RATE'] = 1
+        self.client.get('/')
+        self.client.get('/')
+        self.assertEqual(len(os.listdir(self.dir)), 2)
+
+
+class TestStackSampler(unittest.TestCase):
+    def test_collapsed_stacks(self):
+        """Test sampled stacks are written in collapsed format"""
+        def busy_loop():
+            end = time.time() + 0.05
+            while time.time() < end:
+                pass
+
+        sampler = StackSampler(threading.current_thread().ident, 0.001)
+        sampler.enable()
+        busy_loop()
+        sampler.disable()
+
+        path = tempfile.mktemp(suffix='.collapsed')
+        sampler.dump_stats(path)
+        with open(path) as f:
+            lines = f.read().splitlines()
+        os.remove(path)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+        self.assertTrue(any('busy_loop' in line for line in lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
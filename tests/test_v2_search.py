@@ -0,0 +1,129 @@
+import json
+import unittest
+import jwt
+from versions import app
+from versions.v2 import search
+from versions.v2.models import User, db, Diary, Entry
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object('config.Testing')
+        self.app = app.test_client()
+        self.user = User('owner', 'diary owner', 'owner@gmail.com', 'x')
+        self.other = User('other', 'other user', 'other@gmail.com', 'x')
+        self.diary = Diary(name='Travel', owner=self.user)
+        self.food = Diary(name='Food', owner=self.other)
+        db.session.add_all([
+            Entry('Safari in the Mara', 'We saw lions at dawn',
+                  self.diary, self.user),
+            Entry('Lunch', 'Nyama choma after the safari drive',
+                  self.diary, self.user),
+            Entry('Safari food', 'Packed lunch for a safari',
+                  self.food, self.other),
+            Entry('Groceries', 'Nothing to see here', self.food, self.other),
+        ])
+        db.session.commit()
+        self.headers = {'x-access-token': jwt.encode(
+            {'id': self.user.id}, app.config['SECRET_KEY']).decode()}
+
+    def get(self, query):
+        response = self.app.get('/api/v2/diaries/entries/search?' + query,
+                                headers=self.headers)
+        return response, json.loads(response.get_data(as_text=True))
+
+    def test_ranked_and_highlighted(self):
+        """Test title matches rank first and matches are marked"""
+        response, data = self.get('q=safari')
+        self.assertEqual(response.status_code, 200)
+        titles = [entry['title'] for entry in data['entries']]
+        self.assertEqual(titles, ['Safari food', 'Safari in the Mara', 'Lunch'])
+        self.assertEqual(data['entries'][0]['highlight']['desc'],
+                         'Packed lunch for a <mark>safari</mark>')
+        self.assertEqual(data['entries'][1]['highlight']['title'],
+                         '<mark>Safari</mark> in the Mara')
+
+    def test_every_word_matches(self):
+        """Test words are ANDed"""
+        _, data = self.get('q=safari+lunch')
+        self.assertEqual([entry['title'] for entry in data['entries']],
+                         ['Safari food', 'Lunch'])
+        _, data = self.get('q=the')
+        self.assertEqual(data['entries'], [])
+
+    def test_scopes(self):
+        """Test ?user= and ?diary= narrow the search"""
+        _, data = self.get('q=safari&user={}'.format(self.user.id))
+        self.assertEqual(len(data['entries']), 2)
+        _, data = self.get('q=safari&diary={}'.format(self.food.id))
+        self.assertEqual([entry['diary'] for entry in data['entries']],
+                         ['Food'])
+
+    def test_cursor_pagination(self):
+        """Test pages follow X-Next-Cursor without repeats"""
+        seen = []
+        query = 'q=safari&limit=1'
+        while True:
+            response, data = self.get(query)
+            seen.extend(entry['id'] for entry in data['entries'])
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+            query = 'q=safari&limit=1&cursor=' + cursor
+        self.assertEqual(len(seen), 3)
+        self.assertEqual(len(set(seen)), 3)
+
+        response, _ = self.get('q=safari&cursor=nonsense')
+        self.assertEqual(response.status_code, 400)
+        response, _ = self.get('q=')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_with_tied_ranks(self):
+        """Test pages of equally ranked entries neither repeat nor skip
+        runs search_postgres when DATABASE_URL_TEST is Postgres
+        """
+        db.session.add_all([
+            Entry('Tie {}'.format(i), 'a zebra crossing', self.diary,
+                  self.user) for i in range(7)])
+        db.session.commit()
+        _, data = self.get('q=zebra&limit=100')
+        everything = [entry['id'] for entry in data['entries']]
+        self.assertEqual(len(everything), 7)
+
+        seen = []
+        query = 'q=zebra&limit=2'
+        for _ in range(10):
+            response, data = self.get(query)
+            seen.extend(entry['id'] for entry in data['entries'])
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+            query = 'q=zebra&limit=2&cursor=' + cursor
+        self.assertEqual(seen, everything)
+
+    def test_index_follows_changes(self):
+        """Test the in process index is rebuilt after writes"""
+        self.get('q=safari')
+        entry = Entry.query.filter_by(title='Groceries').one()
+        entry.desc = 'Safari snacks'
+        entry.save()
+        _, data = self.get('q=snacks')
+        self.assertEqual([e['title'] for e in data['entries']], ['Groceries'])
+
+    def test_long_text_headline(self):
+        """Test long texts are cut around the first match"""
+        text = ' '.join(['word'] * 50 + ['lion'] + ['word'] * 50)
+        headline = search.highlight(text, {'lion'})
+        self.assertIn('<mark>lion</mark>', headline)
+        self.assertEqual(len(headline.split()), search.HEADLINE_WORDS)
+
+    def tearDown(self):
+        """Clean-up db"""
+        db.session.query(Entry).delete()
+        db.session.query(Diary).delete()
+        db.session.query(User).delete()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+from passlib.hash import sha256_crypt
+from versions import app, commands, seed
+from versions.v2.models import User, db, Notification, Diary, Entry
+
+
+class TestSeed(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object('config.Testing')
+        # app.test_cli_runner() is Flask 1.0+
+        self.runner = CliRunner()
+        self.script_info = ScriptInfo(create_app=lambda info: app)
+
+    def test_generate(self):
+        """Test generated rows are consistent and skewed"""
+        ids = seed.generate(20, 50, 1000, 300, skew=1.2, seed=1)
+        self.assertEqual(User.query.count(), 20)
+        self.assertEqual(Diary.query.count(), 50)
+        self.assertEqual(Entry.query.count(), 1000)
+        self.assertEqual(Notification.query.count(), 300)
+        self.assertEqual(list(ids['users']), [u.id for u in User.query])
+
+        # hot diaries get far more than an even share of the entries
+        busiest = db.session.query(db.func.count(Entry.id)).group_by(
+            Entry.diary_id).order_by(db.func.count(Entry.id).desc()).first()
+        self.assertGreater(busiest[0], 1000 / 50 * 5)
+
+        unread = Notification.query.filter(
+            Notification.read_at == None).count()
+        total = db.session.query(db.func.sum(User.unread_count)).scalar()
+        self.assertEqual(total, unread)
+        # counter caches are written by the seed, nothing left to fix
+        self.assertEqual(Diary.reconcile_counts(), (0, 0))
+        self.assertEqual(
+            db.session.query(db.func.sum(Diary.entry_count)).scalar(), 1000)
+        self.assertTrue(
+            sha256_crypt.verify('bench2018', User.query.first().password))
+
+    def test_ids_follow_existing_rows(self):
+        """Test seeding twice appends new rows"""
+        first = seed.generate(2, 2, 2, 2, seed=1)
+        second = seed.generate(2, 2, 2, 2, seed=1)
+        self.assertEqual(second['users'][0], first['users'][-1] + 1)
+        self.assertEqual(User.query.count(), 4)
+
+    def test_command(self):
+        """Test flask seed reports each table"""
+        result = self.runner.invoke(commands.seed, [
+            '--users', '3', '--diaries', '4', '--entries', '5',
+            '--notifications', '6'], obj=self.script_info)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('5 entries in', result.output)
+        self.assertEqual(Notification.query.count(), 6)
+
+        result = self.runner.invoke(
+            commands.seed, ['--diaries', '0', '--entries', '5'],
+            obj=self.script_info)
+        self.assertNotEqual(result.exit_code, 0)
+
+    def tearDown(self):
+        """Clean-up db"""
+        db.session.query(Notification).delete()
+        db.session.query(Entry).delete()
+        db.session.query(Diary).delete()
+        db.session.query(User).delete()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    unittest.main()
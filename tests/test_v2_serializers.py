@@ -0,0 +1,91 @@
+import datetime
+import json
+import unittest
+from flask import jsonify
+from werkzeug.http import http_date
+from versions import app
+from versions.v2 import serializers
+from versions.v2.models import Diary, Notification, User
+
+
+class TestSerializers(unittest.TestCase):
+    def setUp(self):
+        self.owner = User('owner', 'diary owner', 'owner@gmail.com', 'x')
+        self.diary = Diary(
+            name='Crown', logo='url', location='NBO',
+            category='Construction', bio='bio', owner=self.owner)
+        self.diary.id = 1
+        self.diary.created_at = datetime.datetime(2018, 3, 9, 7, 5, 3)
+        self.diary.updated_at = None
+
+    def test_http_date(self):
+        """Test dates render like jsonify"""
+        value = datetime.datetime(2018, 12, 31, 23, 59, 1)
+        self.assertEqual(
+            serializers.http_date(value), http_date(value.timetuple()))
+
+    def test_diary_matches_jsonify(self):
+        """Test serializer output equals the hand built dict"""
+        expected = {
+            'id': 1, 'name': 'Crown', 'logo': 'url', 'location': 'NBO',
+            'category': 'Construction', 'bio': 'bio', 'owner': 'owner',
+            'entry_count': None, 'last_entry_at': None,
+            'created_at': self.diary.created_at, 'updated_at': None
+        }
+        with app.test_request_context():
+            expected = json.loads(jsonify(expected).get_data(as_text=True))
+            response = serializers.json_response(
+                serializers.diary.dump(self.diary))
+        self.assertEqual(json.loads(response.get_data(as_text=True)), expected)
+
+    def test_notification_computed_fields(self):
+        """Test act and url are added"""
+        notification = Notification(self.owner, 'actor', 3, 4)
+        data = serializers.notification.dump(notification)
+        self.assertEqual(data['act'], 'actor entryed one of your diaries')
+        self.assertEqual(data['url'], '/diary/3#entry-4')
+        self.assertEqual(data['recipient_id'], 'owner')
+
+    def round_trip(self, name):
+        """Encodes with a backend, compact and indented, and decodes"""
+        try:
+            __import__(name)
+        except ImportError:
+            self.skipTest('{} is not installed'.format(name))
+        when = datetime.datetime(2018, 3, 9, 7, 5, 3)
+        data = {'when': when, 'list': [1, 2.5, None, True], 'text': 'é/x'}
+        expected = {'when': 'Fri, 09 Mar 2018 07:05:03 GMT',
+                    'list': [1, 2.5, None, True], 'text': 'é/x'}
+        dumps = serializers.get_backend(name)
+        for pretty in (False, True):
+            body = dumps(data, pretty)
+            if isinstance(body, bytes):
+                body = body.decode('utf-8')
+            self.assertEqual(json.loads(body), expected)
+            self.assertEqual('\n' in body, pretty)
+
+    def test_json_backend(self):
+        self.round_trip('json')
+
+    def test_simplejson_backend(self):
+        self.round_trip('simplejson')
+
+    def test_ujson_backend(self):
+        self.round_trip('ujson')
+
+    def test_rapidjson_backend(self):
+        self.round_trip('rapidjson')
+
+    def test_orjson_backend(self):
+        self.round_trip('orjson')
+
+    def test_unknown_backend_falls_back_to_json(self):
+        """Test a missing backend uses the stdlib encoder"""
+        dumps = serializers.get_backend('no_such_json_module')
+        self.assertEqual(dumps({'a': 1}, False), '{"a":1}')
+        dumps = serializers.get_backend('pickle')
+        self.assertEqual(dumps({'a': 1}, False), '{"a":1}')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+import json
+from versions import app
+from versions.v2.models import User, db, Notification, Diary, Entry
+
+
+class TestRequestTransaction(unittest.TestCase):
+    def setUp(self):
+        """Creates the app as test client
+        enables the request scoped transaction
+        """
+        app.config.from_object('config.Testing')
+        app.config['SQLALCHEMY_REQUEST_TRANSACTION'] = True
+        self.app = app.test_client()
+        self.owner_info = {
+            'username': 'owner',
+            'fullname': 'diary owner',
+            'email': 'owner@gmail.com',
+            'password': 'kamarster2018'
+        }
+        self.entryer_info = {
+            'username': 'entryer',
+            'fullname': 'diary entryer',
+            'email': 'entryer@gmail.com',
+            'password': 'kamarster2018'
+        }
+
+    def test_one_commit_per_request(self):
+        """Test entry and notification are committed together
+        """
+        owner_token = self.signup_and_login(self.owner_info)
+        entryer_token = self.signup_and_login(self.entryer_info)
+        diary = self.app.post(
+            '/api/v2/diaries/',
+            data=json.dumps({
+                'name': 'Owners diary',
+                'logo': 'url',
+                'location': 'NBO',
+                'category': 'Technology',
+                'bio': 'bio'
+            }),
+            headers={
+                "content-type": "application/json",
+                "x-access-token": owner_token
+            }
+        )
+        self.assertEqual(diary.headers['X-DB-Commits'], '1')
+        diary_id = json.loads(diary.get_data(as_text=True))['diary']['id']
+
+        response = self.app.post(
+            '/api/v2/diaries/{}/entries'.format(diary_id),
+            data=json.dumps({'title': 'hello', 'desc': 'world'}),
+            headers={
+                "content-type": "application/json",
+                "x-access-token": entryer_token
+            }
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.headers['X-DB-Commits'], '1')
+        self.assertEqual(Entry.query.count(), 1)
+        self.assertEqual(Notification.query.count(), 1)
+
+    def test_commit_or_rollback_on_response(self):
+        """Test request is committed on success and rolled back on 500
+        """
+        with app.test_request_context('/'):
+            User('saved', 'saved', 'saved@gmail.com', 'kamarster2018').save()
+            app.process_response(app.response_class(status=200))
+        self.assertIsNotNone(User.query.filter_by(username='saved').first())
+
+        with app.test_request_context('/'):
+            User('ghost', 'ghost', 'ghost@gmail.com', 'kamarster2018').save()
+            app.process_response(app.response_class(status=500))
+        self.assertIsNone(User.query.filter_by(username='ghost').first())
+
+    def signup_and_login(self, info):
+        self.app.post(
+            '/api/v2/auth/register',
+            data=json.dumps(info),
+            content_type='application/json'
+        )
+        response = self.app.post(
+            '/api/v2/auth/login',
+            data=json.dumps({
+                'username': info['username'],
+                'password': info['password']
+            }),
+            content_type='application/json'
+        )
+        return json.loads(response.get_data(as_text=True))['token']
+
+    def tearDown(self):
+        """Clean-up db"""
+        app.config['SQLALCHEMY_REQUEST_TRANSACTION'] = False
+        db.session.query(Notification).delete()
+        db.session.query(Entry).delete()
+        db.session.query(Diary).delete()
+        db.session.query(User).delete()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    unittest.main()
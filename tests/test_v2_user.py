@@ -29,6 +29,23 @@ class TestUser(unittest.TestCase):
         output = json.loads(response.get_data(as_text=True))
         self.assertEqual(output[0]['username'], self.new_user_info['username'])
 
+    def test_read_all_users_paginated(self):
+        """v2 Test users are cursor paginated and emails not exposed"""
+        for name in ['user_a', 'user_b', 'user_c']:
+            User(name, name, name + '@gmail.com', 'kamarster2018').save()
+
+        response = self.app.get('/api/v2/users?limit=2')
+        output = json.loads(response.get_data(as_text=True))
+        self.assertEqual(
+            [user['username'] for user in output], ['user_a', 'user_b'])
+        self.assertNotIn('email', output[0])
+
+        cursor = response.headers['X-Next-Cursor']
+        response = self.app.get('/api/v2/users?limit=2&cursor=' + cursor)
+        output = json.loads(response.get_data(as_text=True))
+        self.assertEqual([user['username'] for user in output], ['user_c'])
+        self.assertNotIn('X-Next-Cursor', response.headers)
+
     def test_read_one_user(self):
         """v2 Test endpoint for one user"""
         new_user = self.register()
@@ -58,6 +75,33 @@ class TestUser(unittest.TestCase):
         output = json.loads(response.get_data(as_text=True))[0]['name']
         self.assertEqual(output, 'Facebook')
 
+    def test_read_user_diaries_streamed_in_batches(self):
+        """v2 Test diaries streamed over several batches stay valid json"""
+        owner = User('owner', 'owner', 'owner@gmail.com', 'kamarster2018')
+        owner.save()
+        user_id = owner.id
+        for name in ['one', 'two', 'three', 'four', 'five']:
+            Diary(name=name, owner=owner).save()
+
+        app.config['STREAM_BATCH_SIZE'] = 2
+        try:
+            response = self.app.get(
+                '/api/v2/users/{}/diaries'.format(user_id))
+            self.assertTrue(response.is_streamed)
+            output = json.loads(response.get_data(as_text=True))
+        finally:
+            app.config['STREAM_BATCH_SIZE'] = 500
+        self.assertEqual(
+            [diary['name'] for diary in output],
+            ['one', 'two', 'three', 'four', 'five'])
+
+    def test_user_without_diaries(self):
+        """v2 Test a user owning no diary gets null"""
+        user = User('owner', 'owner', 'owner@gmail.com', 'kamarster2018')
+        user.save()
+        response = self.app.get('/api/v2/users/{}/diaries'.format(user.id))
+        self.assertIsNone(json.loads(response.get_data(as_text=True)))
+
     def test_not_found_user_diaries(self):
         """v2 Test all diary owned by user
         If user doesn't exist
@@ -1,30 +1,42 @@
 """Modulizing the app
 Split the routes into modules i.e User, Diary, Entry
 
-object `app` is created here so that each module can import it safely
-and the __name__ variable will resolve to the correct package.
+Extension `db` is created here unbound so that each module can import
+it safely, `create_app` binds it to an app. The module level `app` is
+kept for `gunicorn app:app`, `flask` and tests.
 
-Its important to import the modules after the application object is created.
+Startup only pays for what it uses: Flask-Migrate (and with it Alembic)
+is only loaded when the app is started by the `flask` command, Flask-Mail
+when the first email is sent (see versions.utils), and only blueprints
+listed in the BLUEPRINTS config (all by default) are imported.
 
 Why do this; it reduces lines of code within a single file
 and its an easy read
 """
 import os
+import click
 import jwt
 from functools import wraps
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, current_app
 from flask_cors import CORS
-from flask_mail import Mail
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from werkzeug.utils import import_string
+from versions.database import SQLAlchemy
 
 
-app = Flask(__name__)
-app.config.from_object('config.{}'.format(os.getenv('ENVIRON')))
-CORS(app)
-mail = Mail(app)
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+# objects stay loaded after commit so handlers can build responses
+# without reloading every attribute that was just written
+db = SQLAlchemy(session_options={'expire_on_commit': False})
+
+# blueprint name, module holding `mod`, url prefix
+BLUEPRINTS = [
+    ('routes', 'versions.routes', None),
+    ('auth_v2', 'versions.v2.auth', '/api/v2/auth'),
+    ('users_v2', 'versions.v2.user', '/api/v2/users'),
+    ('diary_v2', 'versions.v2.diary', '/api/v2/diaries'),
+    ('entry_v2', 'versions.v2.entry', '/api/v2/diaries'),
+    ('notification_v2', 'versions.v2.notifications', '/api/v2/notifications'),
+    ('imports_v2', 'versions.v2.imports', '/api/v2/imports'),
+]
 
 def login_required(f):
     """Ensures user is logged in before action
@@ -42,7 +54,10 @@ def login_required(f):
                 'warning': 'Missing token. Please register or login'
             }), 401
 
-        is_token_valid = versions.v2.models.AuthToken.query.filter_by(token=token).first()
+        # a replica may not have seen the logout yet
+        with db.primary():
+            is_token_valid = versions.v2.models.AuthToken.query.filter_by(
+                token=token).first()
 
         is_token_valid = is_token_valid.valid if is_token_valid else True
 
@@ -50,7 +65,7 @@ def login_required(f):
             return jsonify({ 'warning': 'Login again'}), 401
 
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'])
+            data = jwt.decode(token, current_app.config['SECRET_KEY'])
             current_user = data['id']
         except jwt.ExpiredSignatureError:
             return jsonify({
@@ -64,19 +79,66 @@ def login_required(f):
         return f(current_user, *args, **kwargs)
     return wrap
 
-import versions.routes
+
+def remember_write(seconds):
+    """Keeps the access token of a request that wrote on the primary"""
+    token = request.headers.get('x-access-token')
+    if token:
+        versions.v2.models.AuthToken.stick_to_primary(token, seconds)
+
+
+def recall_write():
+    token = request.headers.get('x-access-token')
+    return bool(token) and versions.v2.models.AuthToken.reads_primary(token)
+
+
+# api clients authenticate with x-access-token and send no cookies back
+db.sticky_clients(remember_write, recall_write)
+
+
+def create_app(config=None):
+    """Application factory
+    config is an import path or object, defaults to config.$ENVIRON
+    """
+    app = Flask(__name__)
+    app.config.from_object(
+        config or 'config.{}'.format(os.getenv('ENVIRON')))
+    CORS(app)
+    # profiling and timing are registered first so they cover the work
+    # of every other hook (after_request hooks run in reverse)
+    versions.profiling.init_app(app)
+    versions.metrics.init_app(app)
+    versions.instrumentation.init_app(app)
+    versions.memory.init_app(app)
+    versions.compression.init_app(app)
+    db.init_app(app)
+    versions.transaction.init_app(app)
+    versions.commands.init_app(app)
+
+    if click.get_current_context(silent=True) is not None:
+        # loaded by the flask cli, `flask db` needs Flask-Migrate
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    enabled = app.config.get('BLUEPRINTS')
+    for name, module, url_prefix in BLUEPRINTS:
+        if enabled is None or name in enabled:
+            app.register_blueprint(
+                import_string(module).mod, url_prefix=url_prefix)
+
+    versions.capture.init_app(app)
+    return app
+
+import versions.capture
+import versions.profiling
+import versions.metrics
+import versions.instrumentation
+import versions.memory
+import versions.compression
+import versions.transaction
 import versions.v2.models
-import versions.v2.auth
-import versions.v2.user
-import versions.v2.diary
-import versions.v2.entry
-import versions.v2.notifications
-
-# version 2 routes
-app.register_blueprint(versions.v2.auth.mod, url_prefix='/api/v2/auth')
-app.register_blueprint(versions.v2.user.mod, url_prefix='/api/v2/users')
-app.register_blueprint(
-    versions.v2.diary.mod, url_prefix='/api/v2/diaries')
-app.register_blueprint(
-    versions.v2.entry.mod, url_prefix='/api/v2/diaries')
-app.register_blueprint(versions.v2.notifications.mod, url_prefix='/api/v2/notifications')
+import versions.commands
+
+app = create_app()
+# default app for db use outside of an app context, i.e scripts and tests
+db.app = app
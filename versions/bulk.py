@@ -0,0 +1,50 @@
+"""Bulk writes for seeding and imports
+Rows are tuples in column order, written in chunks with COPY on
+Postgres (psycopg2) and executemany elsewhere.
+"""
+import csv
+import io
+import itertools
+from versions import db
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def copy_rows(conn, table, columns, rows):
+    """Writes rows with COPY FROM STDIN, psycopg2 only"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([
+            '' if value is None else
+            str(value).lower() if isinstance(value, bool) else value
+            for value in row])
+    buf.seek(0)
+    quote = conn.dialect.identifier_preparer.quote
+    cursor = conn.connection.cursor()
+    cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+        quote(table.name), ', '.join(quote(c) for c in columns)), buf)
+
+
+def write_rows(table, columns, rows, chunk_size):
+    """Writes rows, tuples in `columns` order, in one transaction
+    returns how many were written
+    """
+    total = 0
+    with db.engine.begin() as conn:
+        use_copy = conn.dialect.driver == 'psycopg2'
+        for chunk in chunks(rows, chunk_size):
+            if use_copy:
+                copy_rows(conn, table, columns, chunk)
+            else:
+                conn.execute(table.insert(), [
+                    dict(zip(columns, row)) for row in chunk])
+            total += len(chunk)
+    return total
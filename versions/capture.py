@@ -0,0 +1,138 @@
+"""Traffic capture for replaying real request mixes
+With CAPTURE_FILE set the app is wrapped in CaptureMiddleware, which
+appends one json line per request (CAPTURE_SAMPLE_RATE of them):
+    t   start time, unix seconds
+    m   method
+    p   path
+    r   endpoint of the matched route, null when nothing matched
+    q   query string parameters
+    b   shape of a json body: keys with the type and length of each value,
+        values themselves are never written
+    a   1 when the request was authenticated with x-access-token
+    s   response status
+    d   duration in ms, until the response body was sent
+    n   response size in bytes
+Secrets are dropped: no headers are kept, and the values of query
+parameters named in SENSITIVE, or of every parameter of the endpoints
+in SENSITIVE_ENDPOINTS, are replaced with "***".
+
+benchmarks/replay.py sends the captured traffic to another instance.
+"""
+import io
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qsl
+from werkzeug.exceptions import HTTPException
+from werkzeug.wsgi import ClosingIterator
+
+SENSITIVE = frozenset([
+    'password', 'old_password', 'new_password', 'token', 'access_token',
+    'secret', 'hash_key', 'key', 'email'
+])
+# their query string carries secrets, whatever the parameters are named
+SENSITIVE_ENDPOINTS = frozenset(['auth_v2.verify'])
+MAX_BODY = 64 * 1024
+
+
+def shape(value):
+    """Describes a json value without its content"""
+    if isinstance(value, dict):
+        return dict((key, shape(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [shape(value[0])] if value else []
+    if isinstance(value, str):
+        return 'str:{}'.format(len(value))
+    if value is None:
+        return 'null'
+    return type(value).__name__
+
+
+def sanitize(query_string, endpoint=None):
+    masked = endpoint in SENSITIVE_ENDPOINTS
+    return dict(
+        (key, '***' if masked or key.lower() in SENSITIVE else value)
+        for key, value in parse_qsl(query_string, keep_blank_values=True))
+
+
+class CaptureMiddleware(object):
+    """WSGI middleware writing one line per request to `path`"""
+
+    def __init__(self, wsgi_app, url_map, path, sample_rate=1.0):
+        self.wsgi_app = wsgi_app
+        self.url_map = url_map
+        self.path = path
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+
+    def body_shape(self, environ):
+        if 'json' not in environ.get('CONTENT_TYPE', ''):
+            return None
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return None
+        if not length or length > MAX_BODY:
+            return None
+        body = environ['wsgi.input'].read(length)
+        # put the body back for the app
+        environ['wsgi.input'] = io.BytesIO(body)
+        try:
+            return shape(json.loads(body.decode('utf-8')))
+        except ValueError:
+            return 'invalid'
+
+    def endpoint(self, environ):
+        try:
+            return self.url_map.bind_to_environ(environ).match()[0]
+        except HTTPException:
+            return None
+
+    def write(self, record):
+        line = json.dumps(record, separators=(',', ':'), sort_keys=True)
+        with self.lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+    def __call__(self, environ, start_response):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.wsgi_app(environ, start_response)
+
+        started = time.time()
+        endpoint = self.endpoint(environ)
+        record = {
+            't': round(started, 3),
+            'm': environ['REQUEST_METHOD'],
+            'p': environ.get('PATH_INFO', ''),
+            'r': endpoint,
+            'q': sanitize(environ.get('QUERY_STRING', ''), endpoint),
+            'b': self.body_shape(environ),
+            'a': int('HTTP_X_ACCESS_TOKEN' in environ),
+            'n': 0,
+        }
+
+        def capture_start_response(status, headers, exc_info=None):
+            record['s'] = int(status.split(' ', 1)[0])
+            return start_response(status, headers, exc_info)
+
+        def count(app_iter):
+            for chunk in app_iter:
+                record['n'] += len(chunk)
+                yield chunk
+
+        def finish():
+            record['d'] = round((time.time() - started) * 1000, 2)
+            self.write(record)
+
+        app_iter = self.wsgi_app(environ, capture_start_response)
+        return ClosingIterator(count(app_iter), [
+            getattr(app_iter, 'close', lambda: None), finish])
+
+
+def init_app(app):
+    """Wraps the app in CaptureMiddleware when CAPTURE_FILE is set"""
+    path = app.config.get('CAPTURE_FILE')
+    if path:
+        app.wsgi_app = CaptureMiddleware(
+            app.wsgi_app, app.url_map, path,
+            app.config.get('CAPTURE_SAMPLE_RATE', 1.0))
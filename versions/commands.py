@@ -0,0 +1,145 @@
+"""Maintenance commands run through the flask cli
+flask reconcile-notifications
+    recompute the unread notification counter cache
+flask reconcile-counts
+    recompute the diary and entry counter caches
+flask prune-notifications
+    archive or delete read notifications past the retention period
+flask compress-static
+    write precompressed .gz/.br variants of the static files
+flask profile-token
+    print an X-Profile header value for profiling a request
+flask seed
+    generate synthetic users, diaries, entries and notifications
+"""
+import datetime
+import os
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from versions.compression import compress_static as compress_folder
+from versions.profiling import make_token
+from versions import seed as seeding
+from versions.v2.models import Diary, Notification
+
+
+@click.command('reconcile-notifications')
+@with_appcontext
+def reconcile_notifications():
+    """Fix drift in users.unread_count"""
+    fixed = Notification.reconcile_unread_counts()
+    click.echo('Reconciled unread count for {} user(s)'.format(fixed))
+
+
+@click.command('reconcile-counts')
+@click.option('--user', 'user_id', type=int, default=None,
+              help='Only this user and their diaries')
+@with_appcontext
+def reconcile_counts(user_id):
+    """Fix drift in users.diary_count and diaries.entry_count"""
+    diaries, users = Diary.reconcile_counts(user_id=user_id)
+    click.echo('Reconciled counts for {} diary(s) and {} user(s)'.format(
+        diaries, users))
+
+
+@click.command('prune-notifications')
+@click.option('--days', type=int, default=None,
+              help='Retention in days, defaults to NOTIFICATION_RETENTION_DAYS')
+@click.option('--batch-size', type=int, default=None,
+              help='Rows per transaction')
+@click.option('--archive/--delete', default=None,
+              help='Copy rows to notifications_archive or just delete them')
+@with_appcontext
+def prune_notifications(days, batch_size, archive):
+    """Archive or delete read notifications older than the retention"""
+    if days is None:
+        days = current_app.config['NOTIFICATION_RETENTION_DAYS']
+    if batch_size is None:
+        batch_size = current_app.config['NOTIFICATION_RETENTION_BATCH_SIZE']
+    if archive is None:
+        archive = current_app.config['NOTIFICATION_RETENTION_ARCHIVE']
+
+    before = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    total = 0
+    start = time.time()
+    for moved in Notification.prune_read(before, batch_size, archive):
+        total += moved
+        elapsed = time.time() - start
+        click.echo('{} rows, {:.0f} rows/s'.format(
+            total, total / elapsed if elapsed else total))
+
+    elapsed = time.time() - start
+    click.echo('{} {} read notification(s) older than {} days in {:.2f}s '
+               '({:.0f} rows/s)'.format(
+                   'Archived' if archive else 'Deleted', total, days, elapsed,
+                   total / elapsed if elapsed else total))
+
+
+@click.command('compress-static')
+@with_appcontext
+def compress_static():
+    """Precompress static files for serving with Content-Encoding"""
+    for path in compress_folder(current_app.static_folder):
+        click.echo('{} ({} bytes)'.format(path, os.path.getsize(path)))
+
+
+@click.command('profile-token')
+@click.option('--minutes', type=int, default=10,
+              help='Minutes the token stays valid')
+@with_appcontext
+def profile_token(minutes):
+    """Print a token to send as the X-Profile header"""
+    if not current_app.config['PROFILE_ENABLED']:
+        click.echo('PROFILE_ENABLED is off, the header will be ignored',
+                   err=True)
+    click.echo(make_token(current_app.config['SECRET_KEY'], minutes))
+
+
+@click.command('seed')
+@click.option('--users', type=int, default=1000)
+@click.option('--diaries', type=int, default=2000)
+@click.option('--entries', type=int, default=20000)
+@click.option('--notifications', type=int, default=20000)
+@click.option('--skew', type=float, default=1.0,
+              help='Zipf exponent for heavy users and hot diaries, 0 is uniform')
+@click.option('--days', type=int, default=365,
+              help='Spread created_at over this many past days')
+@click.option('--read-fraction', type=float, default=0.8,
+              help='Share of notifications already read')
+@click.option('--password', default='bench2018',
+              help='Password of every generated user')
+@click.option('--chunk-size', type=int, default=10000,
+              help='Rows per COPY or executemany')
+@click.option('--seed', 'random_seed', type=int, default=None,
+              help='Random seed for a repeatable data set')
+@with_appcontext
+def seed(users, diaries, entries, notifications, skew, days, read_fraction,
+         password, chunk_size, random_seed):
+    """Generate synthetic data for benchmarks"""
+    if (diaries or notifications) and not users:
+        raise click.BadParameter('needs at least one user', param_hint='users')
+    if entries and not diaries:
+        raise click.BadParameter(
+            'needs at least one diary', param_hint='diaries')
+
+    def echo(table, rows, seconds):
+        click.echo('{} {} in {:.2f}s ({:.0f} rows/s)'.format(
+            rows, table, seconds, rows / seconds if seconds else rows))
+
+    start = time.time()
+    seeding.generate(
+        users, diaries, entries, notifications, skew=skew, days=days,
+        read_fraction=read_fraction, password=password,
+        chunk_size=chunk_size, seed=random_seed, echo=echo)
+    click.echo('Seeded in {:.2f}s'.format(time.time() - start))
+
+
+def init_app(app):
+    """Registers the commands on the app cli"""
+    app.cli.add_command(reconcile_notifications)
+    app.cli.add_command(reconcile_counts)
+    app.cli.add_command(prune_notifications)
+    app.cli.add_command(compress_static)
+    app.cli.add_command(profile_token)
+    app.cli.add_command(seed)
@@ -0,0 +1,149 @@
+"""Response compression
+Responses are gzip (or brotli, when the brotli package is installed)
+compressed when the client sends a matching Accept-Encoding, the
+mimetype is in COMPRESS_MIMETYPES and the body is at least
+COMPRESS_MIN_SIZE bytes. Streamed responses have no known size, they
+are always compressed chunk by chunk as they are sent, each chunk
+flushed (Z_SYNC_FLUSH for gzip) so the client can decode it right away
+instead of waiting for the encoder's buffer to fill.
+
+Static files are never compressed per request. `flask compress-static`
+writes .gz/.br variants next to them and those are sent as they are,
+rerun it after changing anything in versions/static.
+"""
+import gzip
+import mimetypes
+import os
+import zlib
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# precompressed static variants, preferred first
+STATIC_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+STATIC_EXTENSIONS = ('.js', '.css', '.json', '.html', '.svg', '.yaml')
+
+
+def encodings():
+    """Encodings this process can produce, preferred first"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def accepted(encoding):
+    return request.accept_encodings[encoding] > 0
+
+
+def compressor(encoding, config):
+    """Returns (compress(chunk), finish()) for a streaming encoder
+    what compress returns decodes to every chunk given so far
+    """
+    if encoding == 'br':
+        encoder = brotli.Compressor(quality=config['COMPRESS_BR_QUALITY'])
+
+        def compress_chunk(chunk):
+            return encoder.process(chunk) + encoder.flush()
+        return compress_chunk, encoder.finish
+
+    # wbits 31 writes a gzip header and trailer
+    encoder = zlib.compressobj(config['COMPRESS_LEVEL'], zlib.DEFLATED, 31)
+
+    def compress_chunk(chunk):
+        return encoder.compress(chunk) + encoder.flush(zlib.Z_SYNC_FLUSH)
+    return compress_chunk, encoder.flush
+
+
+def compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BR_QUALITY'])
+    return gzip.compress(data, config['COMPRESS_LEVEL'])
+
+
+def stream(chunks, encoding, config):
+    """Compresses an iterable of bytes as it is consumed"""
+    process, finish = compressor(encoding, config)
+    for chunk in chunks:
+        # a flush without data would still write an empty block
+        if chunk:
+            yield process(chunk)
+    yield finish()
+
+
+def compress_response(response):
+    """after_request hook compressing the response body"""
+    config = current_app.config
+    if (not config['COMPRESS_ENABLED'] or
+            response.direct_passthrough or
+            request.method == 'HEAD' or
+            not 200 <= response.status_code < 300 or
+            response.status_code == 204 or
+            'Content-Encoding' in response.headers or
+            response.mimetype not in config['COMPRESS_MIMETYPES']):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(encodings())
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = stream(
+            response.iter_encoded(), encoding, config)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress(data, encoding, config))
+
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def send_static_file(filename):
+    """Static view that prefers a precompressed variant of the file"""
+    app = current_app._get_current_object()
+    for encoding, suffix in STATIC_SUFFIXES:
+        path = os.path.join(app.static_folder, filename + suffix)
+        if accepted(encoding) and os.path.isfile(path):
+            response = send_from_directory(
+                app.static_folder, filename + suffix,
+                mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            return response
+    return app.send_static_file(filename)
+
+
+def compress_static(folder, level=9):
+    """Writes .gz (and .br) variants of the text files in folder
+    returns the paths written
+    """
+    written = []
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if not name.endswith(STATIC_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(path + '.gz', 'wb') as f:
+                with gzip.GzipFile(
+                        filename='', mode='wb', fileobj=f,
+                        compresslevel=level, mtime=0) as gz:
+                    gz.write(data)
+            written.append(path + '.gz')
+            if brotli is not None:
+                with open(path + '.br', 'wb') as f:
+                    f.write(brotli.compress(data, quality=11))
+                written.append(path + '.br')
+    return written
+
+
+def init_app(app):
+    """Registers the compression hook and the precompressed static view"""
+    app.after_request(compress_response)
+    if app.static_folder and 'static' in app.view_functions:
+        app.view_functions['static'] = send_static_file
@@ -0,0 +1,293 @@
+"""SQLAlchemy configured from the Config classes
+Engine pool settings are read from DATABASE_* config keys:
+    DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW, DATABASE_POOL_TIMEOUT,
+    DATABASE_POOL_RECYCLE, DATABASE_POOL_PRE_PING,
+    DATABASE_STATEMENT_TIMEOUT (milliseconds, 0 disables)
+
+DATABASE_PGBOUNCER is for running behind PgBouncer in transaction
+pooling mode. Consecutive transactions may land on different server
+connections, so nothing may rely on session state: the statement
+timeout is applied with SET LOCAL at the start of every transaction
+instead of as a connection startup option (PgBouncer rejects those).
+psycopg2 never prepares statements server side so that is all it takes.
+
+Pool checkouts and the time spent waiting for a connection
+are exported through versions.metrics.
+
+Pools are fork safe: a connection opened by another process (the
+gunicorn master before it forked) is discarded on checkout instead of
+being shared with the parent, the worker then opens its own.
+
+DATABASE_REPLICA_URLS lists read replicas. Reads made while serving
+GET/HEAD/OPTIONS requests go to the replicas round robin, skipping any
+that failed their last health check. Flushes and INSERT/UPDATE/DELETE
+statements always go to the primary, and once a request has written,
+the rest of it reads from the primary, as do reads made inside
+`with db.primary():`. A client that wrote keeps reading from the primary
+for DATABASE_READ_YOUR_WRITES seconds, so it never sees a replica that
+has not caught up with its own writes yet. That is remembered in the
+cookie session, and for API clients, which do not send cookies back,
+through the hooks given to db.sticky_clients (on the access token, see
+versions/__init__.py).
+"""
+import contextlib
+import itertools
+import os
+import threading
+import time
+from flask import g, request, has_request_context
+from flask import session as http_session
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, exc, orm, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import Pool, QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+from versions import metrics
+
+
+metrics.describe(
+    'db_pool_checkouts_total', 'counter', 'Connections checked out of the pool')
+metrics.describe(
+    'db_pool_connects_total', 'counter', 'New DBAPI connections opened')
+metrics.describe(
+    'db_pool_wait_seconds', 'summary', 'Time spent waiting for a connection')
+
+# engine urls that need SET LOCAL statement_timeout on every transaction
+_local_statement_timeouts = {}
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection"""
+
+    def _do_get(self):
+        start = time.time()
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        finally:
+            metrics.observe('db_pool_wait_seconds', time.time() - start)
+
+
+@event.listens_for(Pool, 'checkout')
+def checkout(dbapi_connection, connection_record, connection_proxy):
+    metrics.inc('db_pool_checkouts_total')
+    if connection_record.info.get('pid', os.getpid()) != os.getpid():
+        # inherited across fork, drop it without closing the parent's socket
+        connection_record.connection = connection_proxy.connection = None
+        raise exc.DisconnectionError(
+            'Connection belongs to pid {}, reconnecting'.format(
+                connection_record.info['pid']))
+
+
+@event.listens_for(Pool, 'connect')
+def connect(dbapi_connection, connection_record):
+    metrics.inc('db_pool_connects_total')
+    connection_record.info['pid'] = os.getpid()
+
+
+@event.listens_for(Engine, 'begin')
+def set_local_statement_timeout(conn):
+    timeout = _local_statement_timeouts.get(str(conn.engine.url))
+    if timeout:
+        conn.execute('SET LOCAL statement_timeout = {:d}'.format(timeout))
+
+
+def engine_options(config, sa_url):
+    """Returns create_engine keyword arguments for a database url"""
+    if sa_url.drivername.startswith('sqlite'):
+        return {}
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': config['DATABASE_POOL_PRE_PING'],
+    }
+
+    timeout = config['DATABASE_STATEMENT_TIMEOUT']
+    if not sa_url.drivername.startswith('postgresql'):
+        return options
+
+    if config['DATABASE_PGBOUNCER']:
+        _local_statement_timeouts[str(sa_url)] = timeout
+    elif timeout:
+        options['connect_args'] = {
+            'options': '-c statement_timeout={:d}'.format(timeout)
+        }
+    return options
+
+
+class ReplicaSet(object):
+    """Read replica engines picked round robin
+    a replica is checked with SELECT 1 at most once every `interval`
+    seconds and is skipped while that check fails
+    """
+
+    def __init__(self, urls, config, interval):
+        self.urls = urls
+        self.interval = interval
+        self.engines = [
+            create_engine(url, **engine_options(config, make_url(url)))
+            for url in urls
+        ]
+        self.healthy = dict((engine, True) for engine in self.engines)
+        self.checked_at = dict((engine, 0) for engine in self.engines)
+        self._cycle = itertools.cycle(self.engines)
+        self._lock = threading.Lock()
+        for engine in self.engines:
+            event.listen(engine, 'handle_error', self._on_error)
+
+    def _on_error(self, context):
+        if context.is_disconnect and context.engine in self.healthy:
+            self.healthy[context.engine] = False
+
+    def check(self, engine):
+        """True when the replica answers"""
+        try:
+            with engine.connect() as conn:
+                conn.scalar(select([1]))
+            return True
+        except exc.DBAPIError:
+            return False
+
+    def next(self):
+        """Returns the next healthy replica or None"""
+        for _ in self.engines:
+            with self._lock:
+                engine = next(self._cycle)
+            if time.time() - self.checked_at[engine] >= self.interval:
+                self.checked_at[engine] = time.time()
+                self.healthy[engine] = self.check(engine)
+            if self.healthy[engine]:
+                return engine
+        return None
+
+    def dispose(self):
+        for engine in self.engines:
+            engine.dispose()
+
+
+def reads_from_replica(db):
+    """True when the current request may read from a replica"""
+    return (
+        has_request_context() and
+        request.method in ('GET', 'HEAD', 'OPTIONS') and
+        not g.get('db_wrote') and
+        not g.get('db_primary') and
+        http_session.get('primary_until', 0) < time.time() and
+        not db.client_wrote_recently()
+    )
+
+
+class RoutingSession(SignallingSession):
+    """Session that sends reads of read only requests to a replica"""
+
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if (not self._flushing and not isinstance(clause, UpdateBase) and
+                self.app.config['DATABASE_REPLICA_URLS'] and
+                reads_from_replica(self.db)):
+            engine = self.db.get_replicas(self.app).next()
+            if engine is not None:
+                return engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+@event.listens_for(RoutingSession, 'after_bulk_update')
+@event.listens_for(RoutingSession, 'after_bulk_delete')
+def mark_write(session, *args):
+    """Remembers the request wrote, its reads go to the primary from now"""
+    if has_request_context():
+        g.db_wrote = True
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    """Flask-SQLAlchemy with pool options from the app config
+    and read replica routing
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._replicas_lock = threading.Lock()
+        self._sticky = None
+        super(SQLAlchemy, self).__init__(*args, **kwargs)
+
+    def sticky_clients(self, remember, recall):
+        """Keeps clients without cookies on the primary after they wrote
+        remember(seconds) is called after a request wrote, recall() is
+        True while the client should still read from the primary, it
+        runs on the primary at most once per request
+        """
+        self._sticky = (remember, recall)
+
+    def client_wrote_recently(self):
+        if self._sticky is None:
+            return False
+        if 'db_recalled' not in g:
+            with self.primary():
+                g.db_recalled = bool(self._sticky[1]())
+        return g.db_recalled
+
+    @contextlib.contextmanager
+    def primary(self):
+        """Reads made inside go to the primary"""
+        previous = g.get('db_primary', False)
+        g.db_primary = True
+        try:
+            yield
+        finally:
+            g.db_primary = previous
+
+    def init_app(self, app):
+        super(SQLAlchemy, self).init_app(app)
+
+        @app.after_request
+        def stick_to_primary(response):
+            if (g.get('db_wrote') and response.status_code < 500 and
+                    app.config['DATABASE_REPLICA_URLS']):
+                seconds = app.config['DATABASE_READ_YOUR_WRITES']
+                http_session['primary_until'] = time.time() + seconds
+                if self._sticky is not None:
+                    self._sticky[0](seconds)
+            return response
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        rv = super(SQLAlchemy, self).apply_driver_hacks(app, sa_url, options)
+        options.update(engine_options(app.config, sa_url))
+        return rv
+
+    def dispose_engines(self, app):
+        """Closes pooled connections of the primary, binds and replicas
+        run in the gunicorn master before forking workers
+        """
+        with app.app_context():
+            self.get_engine(app).dispose()
+            for bind in app.config.get('SQLALCHEMY_BINDS') or {}:
+                self.get_engine(app, bind).dispose()
+        replicas = app.extensions.pop('sqlalchemy_replicas', None)
+        if replicas is not None:
+            replicas.dispose()
+
+    def get_replicas(self, app):
+        """Returns the ReplicaSet for DATABASE_REPLICA_URLS"""
+        urls = tuple(app.config['DATABASE_REPLICA_URLS'])
+        replicas = app.extensions.get('sqlalchemy_replicas')
+        if replicas is None or replicas.urls != urls:
+            with self._replicas_lock:
+                replicas = app.extensions.get('sqlalchemy_replicas')
+                if replicas is None or replicas.urls != urls:
+                    if replicas is not None:
+                        replicas.dispose()
+                    replicas = ReplicaSet(
+                        urls, app.config,
+                        app.config['DATABASE_REPLICA_HEALTH_INTERVAL'])
+                    app.extensions['sqlalchemy_replicas'] = replicas
+        return replicas
@@ -0,0 +1,119 @@
+"""SQL statements, database time and commits per request
+Every statement run on any engine while serving a request is counted
+and timed through the cursor execute events. After the response:
+    - in debug mode X-DB-Statements and X-DB-Time (ms) are sent back,
+      next to X-DB-Commits from versions.transaction
+    - the totals are added to the db_*_total metrics per endpoint
+    - with ACCESS_LOG on, a JSON line per request goes to the
+      versions.access logger
+    - requests running more than SQL_STATEMENT_THRESHOLD statements are
+      logged as a warning with the statements they repeated most,
+      which is what an N+1 query looks like
+"""
+import json
+import logging
+import sys
+import time
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from versions import metrics
+
+access_log = logging.getLogger('versions.access')
+
+metrics.describe(
+    'db_statements_total', 'counter', 'SQL statements run by requests')
+metrics.describe(
+    'db_time_seconds_total', 'counter', 'Time requests spent running SQL')
+metrics.describe(
+    'db_commits_total', 'counter', 'Commits made by requests')
+metrics.describe(
+    'db_statements_per_request', 'histogram', 'SQL statements per request',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement(conn, cursor, statement, parameters, context, many):
+    if has_request_context():
+        conn.info.setdefault('statement_started', []).append(
+            time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def end_statement(conn, cursor, statement, parameters, context, many):
+    started = conn.info.get('statement_started')
+    if not started or not has_request_context():
+        return
+    elapsed = time.perf_counter() - started.pop()
+    g.db_time = g.get('db_time', 0) + elapsed
+    statements = g.setdefault('db_statements', {})
+    statements[statement] = statements.get(statement, 0) + 1
+
+
+@event.listens_for(Engine, 'handle_error')
+def drop_statement(context):
+    """A failed statement never reaches after_cursor_execute, drops
+    its start time so it does not pile up on the pooled connection
+    """
+    conn = context.connection
+    if (conn is None or context.execution_context is None
+            or not has_request_context()):
+        return
+    started = conn.info.get('statement_started')
+    if started:
+        started.pop()
+
+
+def record_statements(app, response):
+    statements = g.get('db_statements', {})
+    count = sum(statements.values())
+    db_time = g.get('db_time', 0)
+    commits = g.get('db_commits', 0)
+    endpoint = request.endpoint or 'unmatched'
+
+    if app.debug:
+        response.headers['X-DB-Statements'] = str(count)
+        response.headers['X-DB-Time'] = '{:.1f}'.format(db_time * 1000)
+
+    metrics.inc('db_statements_total', count, endpoint=endpoint)
+    metrics.inc('db_time_seconds_total', db_time, endpoint=endpoint)
+    metrics.inc('db_commits_total', commits, endpoint=endpoint)
+    metrics.observe('db_statements_per_request', count, endpoint=endpoint)
+
+    threshold = app.config.get('SQL_STATEMENT_THRESHOLD')
+    if threshold and count > threshold:
+        repeated = sorted(statements.items(), key=lambda item: -item[1])[:3]
+        app.logger.warning(
+            '%s %s ran %s statements (threshold %s), most repeated:\n%s',
+            request.method, request.path, count, threshold,
+            '\n'.join('{} x {}'.format(n, ' '.join(sql.split())[:200])
+                      for sql, n in repeated))
+
+    if app.config.get('ACCESS_LOG'):
+        started = g.get('request_started')
+        access_log.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+            if started is not None else None,
+            'db_statements': count,
+            'db_time_ms': round(db_time * 1000, 1),
+            'db_commits': commits,
+        }, sort_keys=True))
+    return response
+
+
+def init_app(app):
+    """Reports the statements of every request, see module docstring"""
+    if app.config.get('ACCESS_LOG') and not access_log.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        access_log.addHandler(handler)
+        access_log.setLevel(logging.INFO)
+        access_log.propagate = False
+
+    @app.after_request
+    def report_statements(response):
+        return record_statements(app, response)
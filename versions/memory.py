@@ -0,0 +1,124 @@
+"""Per request memory tracking with tracemalloc
+Off unless MEMORY_TRACKING is set, tracing slows down every allocation.
+When on, the peak traced memory of each request above what was allocated
+when it started is recorded in the http_request_peak_bytes histogram
+and the http_request_peak_bytes_max gauge, per endpoint.
+
+Requests peaking above MEMORY_REPORT_BYTES are logged as a warning with
+their MEMORY_TOP_SITES biggest allocation sites still alive when the
+response is built, each with the innermost line of this app that led
+to it.
+
+MEMORY_BUDGET_BYTES (0 disables) aborts a request with a 503 once it
+holds more than that. It is checked as ORM rows are loaded, which is
+where the large listings spend their memory.
+
+tracemalloc counts the whole process, so the numbers are per request only
+with one request at a time per worker, the gunicorn sync worker default.
+
+tracemalloc.reset_peak is Python 3.9+. Before that the recorded peak is
+the most the request held when rows were loaded or the response was
+built, which can miss short lived spikes in between.
+"""
+import os
+import tracemalloc
+from flask import current_app, g, request, has_request_context
+from sqlalchemy import event
+from werkzeug.exceptions import ServiceUnavailable
+from versions import db, metrics
+
+metrics.describe(
+    'http_request_peak_bytes', 'histogram', 'Peak memory allocated by requests',
+    buckets=(2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26, 2 ** 28, 2 ** 30))
+metrics.describe(
+    'http_request_peak_bytes_max', 'gauge',
+    'Largest request peak seen by this process')
+
+_peaks = {}
+# the process wide peak can only be reset from Python 3.9
+RESETS_PEAK = hasattr(tracemalloc, 'reset_peak')
+_app_folder = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+class MemoryBudgetExceeded(ServiceUnavailable):
+    description = 'Request exceeded its memory budget'
+
+
+def request_bytes():
+    """Memory allocated since the current request started"""
+    return tracemalloc.get_traced_memory()[0] - g.memory_base
+
+
+def check_budget(*args):
+    """Raises MemoryBudgetExceeded once the request is over budget"""
+    if not has_request_context() or 'memory_base' not in g:
+        return
+    held = request_bytes()
+    g.memory_high = max(g.get('memory_high', 0), held)
+    budget = current_app.config['MEMORY_BUDGET_BYTES']
+    if budget and held > budget:
+        log_sites('over its {} byte budget'.format(budget))
+        raise MemoryBudgetExceeded()
+
+
+def allocation_sites(limit):
+    """Returns the biggest allocation sites as printable lines"""
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    lines = []
+    for stat in snapshot.statistics('traceback')[:limit]:
+        frames = list(stat.traceback)
+        site = '{}:{}'.format(frames[-1].filename, frames[-1].lineno)
+        own = next((frame for frame in reversed(frames)
+                    if frame.filename.startswith(_app_folder)), None)
+        if own is not None and own is not frames[-1]:
+            site += ' from {}:{}'.format(own.filename, own.lineno)
+        lines.append('{:.1f} KiB in {} blocks at {}'.format(
+            stat.size / 1024.0, stat.count, site))
+    return lines
+
+
+def log_sites(reason):
+    current_app.logger.warning(
+        '%s %s %s, top allocation sites:\n%s', request.method, request.path,
+        reason, '\n'.join(
+            allocation_sites(current_app.config['MEMORY_TOP_SITES'])))
+
+
+def start_tracking():
+    if RESETS_PEAK:
+        tracemalloc.reset_peak()
+    g.memory_base = tracemalloc.get_traced_memory()[0]
+
+
+def record_peak(response):
+    if 'memory_base' not in g:
+        return response
+    if RESETS_PEAK:
+        peak = tracemalloc.get_traced_memory()[1] - g.memory_base
+    else:
+        peak = max(g.get('memory_high', 0), request_bytes())
+    endpoint = request.endpoint or 'unmatched'
+    metrics.observe('http_request_peak_bytes', peak, endpoint=endpoint)
+    _peaks[endpoint] = max(peak, _peaks.get(endpoint, 0))
+    metrics.set_gauge('http_request_peak_bytes_max', _peaks[endpoint],
+                      endpoint=endpoint)
+
+    if peak > current_app.config['MEMORY_REPORT_BYTES']:
+        log_sites('peaked at {} bytes'.format(peak))
+    return response
+
+
+def init_app(app):
+    """Starts tracemalloc and the request hooks when MEMORY_TRACKING is on"""
+    if not app.config.get('MEMORY_TRACKING'):
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(app.config['MEMORY_TRACE_FRAMES'])
+    if not event.contains(db.Model, 'load', check_budget):
+        event.listen(db.Model, 'load', check_budget, propagate=True)
+
+    app.before_request(start_tracking)
+    app.after_request(record_peak)
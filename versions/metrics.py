@@ -0,0 +1,230 @@
+"""Process metrics rendered in the Prometheus text format
+inc: add to a counter
+observe: add a sample to a summary or histogram
+set_gauge: set a gauge to the current value
+
+Metric names are declared with describe() so /metrics can
+print HELP and TYPE lines for them.
+
+Every gunicorn worker records into its own registry. With METRICS_DIR
+set each process also writes its counters, summaries and histograms to
+METRICS_DIR/<pid>.json, at most once every METRICS_FLUSH_INTERVAL
+seconds, and render() adds up the files of all workers so whichever
+worker answers the scrape reports for the whole server. Files of exited
+workers are kept so totals never go backwards. Gauges are per process.
+
+init_app records for every request:
+    http_requests_total{endpoint, method, status}
+    http_request_duration_seconds{endpoint, method} histogram
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from flask import g, request
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_values = {}
+_gauges = {}
+_descriptions = {}
+_multiprocess = {'dir': None, 'interval': 1.0, 'flushed_at': 0}
+
+
+def describe(name, kind, text, buckets=DEFAULT_BUCKETS):
+    """Declares a metric; kind is counter, summary, histogram or gauge"""
+    _descriptions[name] = (kind, text, tuple(sorted(buckets)))
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _add(key, value):
+    _values[key] = _values.get(key, 0) + value
+
+
+def inc(name, value=1, **labels):
+    """Adds value to a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _add(key, value)
+
+
+def observe(name, value, **labels):
+    """Adds one sample to a summary or histogram
+    histogram buckets are stored per bucket and made cumulative on render
+    """
+    kind, _, buckets = _descriptions.get(name, ('summary', '', ()))
+    with _lock:
+        if kind == 'histogram':
+            le = '+Inf'
+            for bound in buckets:
+                if value <= bound:
+                    le = repr(bound)
+                    break
+            bucket = dict(labels, le=le)
+            _add(_key(name + '_bucket', bucket), 1)
+        _add(_key(name + '_sum', labels), value)
+        _add(_key(name + '_count', labels), 1)
+
+
+def set_gauge(name, value, **labels):
+    """Sets a gauge"""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in labels) + '}'
+
+
+def _base_name(name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in _descriptions:
+            return name[:-len(suffix)]
+    return name
+
+
+def _sort_key(item):
+    (name, labels), _ = item
+    return name, tuple(
+        (k, (0, float(v)) if k == 'le' else (1, str(v))) for k, v in labels)
+
+
+def _cumulative(values):
+    """Turns per bucket histogram counts into cumulative ones
+    adds the buckets no sample fell into so every series is complete
+    """
+    series = {}
+    for (name, labels), value in values.items():
+        base = _base_name(name)
+        if name.endswith('_bucket') and base in _descriptions:
+            le = dict(labels)['le']
+            rest = tuple(label for label in labels if label[0] != 'le')
+            series.setdefault((name, rest, base), {})[le] = value
+
+    for (name, rest, base), counts in series.items():
+        total = 0
+        bounds = [repr(b) for b in _descriptions[base][2]] + ['+Inf']
+        for le in bounds:
+            total += counts.get(le, 0)
+            labels = tuple(sorted(rest + (('le', le),)))
+            values[(name, labels)] = total
+    return values
+
+
+def _read_dir(path):
+    """Adds up the values written by every process"""
+    values = {}
+    for filename in os.listdir(path):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(path, filename)) as f:
+                rows = json.load(f)
+        except (IOError, ValueError):
+            continue
+        for name, labels, value in rows:
+            key = name, tuple(tuple(label) for label in labels)
+            values[key] = values.get(key, 0) + value
+    return values
+
+
+def flush():
+    """Writes this process' values to METRICS_DIR"""
+    path = _multiprocess['dir']
+    if not path:
+        return
+    with _lock:
+        rows = [[name, labels, value]
+                for (name, labels), value in _values.items()]
+        _multiprocess['flushed_at'] = time.time()
+    target = os.path.join(path, '{}.json'.format(os.getpid()))
+    tmp = target + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(rows, f)
+    os.rename(tmp, target)
+
+
+def maybe_flush():
+    """Flushes when METRICS_FLUSH_INTERVAL has passed since the last one"""
+    if (_multiprocess['dir'] and time.time() - _multiprocess['flushed_at'] >=
+            _multiprocess['interval']):
+        flush()
+
+
+def render():
+    """Returns all metrics in Prometheus text format"""
+    if _multiprocess['dir']:
+        flush()
+        values = _read_dir(_multiprocess['dir'])
+    else:
+        with _lock:
+            values = dict(_values)
+    with _lock:
+        values.update(_gauges)
+
+    lines = []
+    described = set()
+    for (name, labels), value in sorted(
+            _cumulative(values).items(), key=_sort_key):
+        base = _base_name(name)
+        if base in _descriptions and base not in described:
+            kind, text, _ = _descriptions[base]
+            lines.append('# HELP {} {}'.format(base, text))
+            lines.append('# TYPE {} {}'.format(base, kind))
+            described.add(base)
+        lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Drops all recorded values"""
+    with _lock:
+        _values.clear()
+        _gauges.clear()
+
+
+describe('http_requests_total', 'counter', 'Requests handled')
+describe('http_request_duration_seconds', 'histogram',
+         'Time spent handling requests')
+
+
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+def record_request(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or 'unmatched'
+    inc('http_requests_total', endpoint=endpoint, method=request.method,
+        status=response.status_code)
+    observe('http_request_duration_seconds', elapsed,
+            endpoint=endpoint, method=request.method)
+    maybe_flush()
+    return response
+
+
+def init_app(app):
+    """Times every request, METRICS_DIR turns on multiprocess mode"""
+    path = app.config.get('METRICS_DIR')
+    if path:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        _multiprocess['dir'] = path
+        _multiprocess['interval'] = app.config.get(
+            'METRICS_FLUSH_INTERVAL', 1.0)
+        atexit.register(flush)
+    app.before_request(start_timer)
+    app.after_request(record_request)
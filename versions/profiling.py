@@ -0,0 +1,122 @@
+"""On demand request profiling
+Off unless PROFILE_ENABLED is set, no hooks are registered then.
+When on, a request is profiled if it carries an X-Profile header with a
+token from `flask profile-token`, or at random for PROFILE_SAMPLE_RATE
+of all requests. Its profile is written to PROFILE_DIR and the file
+name is sent back in the X-Profile-File header.
+
+PROFILE_MODE picks the profiler:
+    deterministic: cProfile, writes a .prof file for pstats/snakeviz
+    sampling: samples the request thread stack every PROFILE_INTERVAL
+        seconds, writes a .collapsed file for flamegraph.pl/speedscope
+"""
+import cProfile
+import datetime
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+import jwt
+from flask import current_app, g, request
+
+_sequence = itertools.count(1)
+
+
+class StackSampler(threading.Thread):
+    """Counts the stacks of one thread, sampled every `interval` seconds"""
+
+    def __init__(self, thread_id, interval):
+        super(StackSampler, self).__init__(name='stack-sampler')
+        self.daemon = True
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append('{} ({}:{})'.format(
+                    code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            stack = ';'.join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def enable(self):
+        self.start()
+
+    def disable(self):
+        self.stopped.set()
+        self.join()
+
+    def dump_stats(self, path):
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write('{} {}\n'.format(stack, count))
+
+
+def make_token(secret, minutes=10):
+    """Returns an X-Profile token valid for `minutes`"""
+    exp = datetime.datetime.utcnow() + datetime.timedelta(minutes=minutes)
+    return jwt.encode({'profile': True, 'exp': exp}, secret).decode('UTF-8')
+
+
+def wants_profile(config):
+    """True for a valid X-Profile token or a sampled request"""
+    token = request.headers.get('X-Profile')
+    if token:
+        try:
+            return bool(jwt.decode(token, config['SECRET_KEY']).get('profile'))
+        except jwt.InvalidTokenError:
+            return False
+    rate = config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+
+def start_profile():
+    config = current_app.config
+    if not wants_profile(config):
+        return
+    if config['PROFILE_MODE'] == 'sampling':
+        profiler = StackSampler(
+            threading.current_thread().ident, config['PROFILE_INTERVAL'])
+        extension = 'collapsed'
+    else:
+        profiler = cProfile.Profile()
+        extension = 'prof'
+    g.profile_file = '{}-{}-{}-{}.{}'.format(
+        time.strftime('%Y%m%d%H%M%S'), request.endpoint or 'unmatched',
+        os.getpid(), next(_sequence), extension)
+    g.profiler = profiler
+    profiler.enable()
+
+
+def name_profile(response):
+    if g.get('profile_file'):
+        response.headers['X-Profile-File'] = g.profile_file
+    return response
+
+
+def stop_profile(exc):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    profiler.disable()
+    folder = current_app.config['PROFILE_DIR']
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    profiler.dump_stats(os.path.join(folder, g.profile_file))
+
+
+def init_app(app):
+    """Registers the profiling hooks when PROFILE_ENABLED is set"""
+    if not app.config.get('PROFILE_ENABLED'):
+        return
+    app.before_request(start_profile)
+    app.after_request(name_profile)
+    app.teardown_request(stop_profile)
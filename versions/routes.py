@@ -1,15 +1,30 @@
-from versions import app
-from flask import render_template, jsonify
+from versions import db, metrics
+from flask import Blueprint, render_template, jsonify, Response
 
-@app.route('/')
+mod = Blueprint('routes', __name__)
+
+@mod.route('/')
 def version2():
     """route for API documentation"""
     return render_template('version2.html')
 
-@app.errorhandler(404)
+@mod.route('/metrics')
+def prometheus_metrics():
+    """Process metrics in Prometheus text format"""
+    pool = db.engine.pool
+    if hasattr(pool, 'checkedout'):
+        metrics.set_gauge('db_pool_checked_out', pool.checkedout())
+        metrics.set_gauge('db_pool_size', pool.size())
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@mod.app_errorhandler(404)
 def page_not_found(e):
     return jsonify({'warning': '404, Endpoint not found'}), 404
 
-@app.errorhandler(500)
+@mod.app_errorhandler(500)
 def internal_server_error(e):
     return jsonify({'warning': '500, Internal Server Error'}), 500
+
+@mod.app_errorhandler(503)
+def service_unavailable(e):
+    return jsonify({'warning': '503, {}'.format(e.description)}), 503
@@ -0,0 +1,208 @@
+"""Synthetic data for benchmarks, run as `flask seed`
+Generates users, diaries, entries and notifications with skewed
+distributions, like production data:
+    a few heavy users own most diaries and write most entries
+    a few hot diaries get most entries
+    heavy users have the longest notification histories
+The skew follows Zipf's law, rank k gets weight 1 / k ** skew, so 0 is
+uniform and around 1 is typical of real traffic. Ranks are shuffled so
+hot rows are spread over the id range.
+
+Rows are generated in chunks and written with COPY on Postgres
+(psycopg2), executemany elsewhere. Ids are assigned here, after the
+current max id, so no row has to be read back. All users share one
+password hash computed up front, hashing is what makes creating users
+through the API slow.
+"""
+import bisect
+import collections
+import datetime
+import itertools
+import random
+import time
+import uuid
+from passlib.hash import sha256_crypt
+from versions import db
+from versions.bulk import chunks, write_rows
+from versions.v2.models import User, Diary, Entry, Notification
+
+WORDS = [
+    'travel', 'food', 'code', 'music', 'family', 'notes', 'sports', 'books',
+    'garden', 'work', 'health', 'movies', 'ideas', 'photos', 'running'
+]
+LOCATIONS = ['NBO', 'MSA', 'KSM', 'NKR', 'ELD', 'THK']
+CATEGORIES = ['Technology', 'Travel', 'Food', 'Health', 'Sports', 'Music']
+
+
+class Skewed(object):
+    """Picks ids with Zipf weights over a shuffled ranking"""
+
+    def __init__(self, ids, skew, rng):
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        self.cum_weights = list(itertools.accumulate(
+            1.0 / (rank ** skew) for rank in range(1, len(self.ids) + 1)))
+        self.rng = rng
+
+    def pick(self, k):
+        if not self.ids:
+            return []
+        # like random.choices (Python 3.6+), hi keeps a draw rounded up
+        # to the total weight on the last id
+        total, last = self.cum_weights[-1], len(self.ids) - 1
+        return [self.ids[bisect.bisect(self.cum_weights,
+                                       self.rng.random() * total, 0, last)]
+                for _ in range(k)]
+
+
+def next_id(model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def reset_sequences():
+    """Moves Postgres id sequences past the ids assigned here"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    with db.engine.begin() as conn:
+        for model in (User, Diary, Entry, Notification):
+            conn.execute(
+                "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                "(SELECT max(id) FROM {0}))".format(model.__tablename__))
+
+
+def generate(users, diaries, entries, notifications, skew=1.0, days=365,
+             read_fraction=0.8, password='bench2018', chunk_size=10000,
+             seed=None, echo=None):
+    """Seeds the database, returns the new id ranges per table
+    echo(table, rows, seconds) is called after each table is written
+    """
+    rng = random.Random(seed)
+    now = datetime.datetime.utcnow()
+    span = days * 86400
+
+    def timestamp():
+        return now - datetime.timedelta(seconds=rng.randrange(span))
+
+    first = dict((model, next_id(model))
+                 for model in (User, Diary, Entry, Notification))
+    user_ids = range(first[User], first[User] + users)
+    diary_ids = range(first[Diary], first[Diary] + diaries)
+    heavy_users = Skewed(user_ids, skew, rng)
+    hot_diaries = Skewed(diary_ids, skew, rng)
+    hashed = sha256_crypt.hash(password)
+    # picking from small pools keeps generation cheap per row
+    names = ['{} {}'.format(a, b) for a in WORDS for b in WORDS]
+    texts = [' '.join(rng.choice(WORDS) for _ in range(20))
+             for _ in range(1000)]
+
+    def write(name, table, columns, rows):
+        start = time.time()
+        count = write_rows(table, columns, rows, chunk_size)
+        if echo:
+            echo(name, count, time.time() - start)
+
+    def user_rows():
+        for user_id in user_ids:
+            yield (user_id, 'seed{}'.format(user_id), 'seed user',
+                   'seed{}@example.com'.format(user_id), hashed,
+                   uuid.uuid4().hex, True)
+
+    write('users', User.__table__, (
+        'id', 'username', 'fullname', 'email', 'password', 'hash_key',
+        'activate'), user_rows())
+
+    owned = collections.Counter()
+    entry_counts = collections.Counter()
+    last_entry = {}
+
+    def diary_rows():
+        owners = heavy_users.pick(diaries)
+        for diary_id, owner in zip(diary_ids, owners):
+            owned[owner] += 1
+            yield (diary_id, rng.choice(names), 'url',
+                   rng.choice(LOCATIONS), rng.choice(CATEGORIES),
+                   'seeded diary', owner, timestamp())
+
+    write('diaries', Diary.__table__, (
+        'id', 'name', 'logo', 'location', 'category', 'bio', 'user_id',
+        'created_at'), diary_rows())
+
+    def entry_rows():
+        entry_id = first[Entry]
+        for start in range(0, entries, chunk_size):
+            size = min(chunk_size, entries - start)
+            for diary_id, author in zip(
+                    hot_diaries.pick(size), heavy_users.pick(size)):
+                created = timestamp()
+                entry_counts[diary_id] += 1
+                last_entry[diary_id] = max(
+                    last_entry.get(diary_id, created), created)
+                yield (entry_id, 'entry {}'.format(entry_id),
+                       rng.choice(texts), author, diary_id, created)
+                entry_id += 1
+
+    write('entries', Entry.__table__, (
+        'id', 'title', 'desc', 'user_id', 'diary_id', 'created_at'),
+        entry_rows())
+
+    unread = collections.Counter()
+
+    def notification_rows():
+        notification_id = first[Notification]
+        for start in range(0, notifications, chunk_size):
+            size = min(chunk_size, notifications - start)
+            for recipient in heavy_users.pick(size):
+                created = timestamp()
+                read_at = None
+                if rng.random() < read_fraction:
+                    read_at = created + datetime.timedelta(
+                        seconds=rng.randrange(86400))
+                else:
+                    unread[recipient] += 1
+                yield (notification_id, recipient, 'seed',
+                       rng.choice(diary_ids) if diaries else 0,
+                       first[Entry] + rng.randrange(entries) if entries else 0,
+                       'created', read_at, created)
+                notification_id += 1
+
+    write('notifications', Notification.__table__, (
+        'id', 'recipient_id', 'actor', 'diary_id', 'entry_id', 'action',
+        'read_at', 'created_at'), notification_rows())
+
+    # counter caches are counted while generating, reconciling would
+    # scan notifications and entries once per user and diary
+    users_table = User.__table__
+    diaries_table = Diary.__table__
+    with db.engine.begin() as conn:
+        for chunk in chunks(unread.items(), chunk_size):
+            conn.execute(
+                users_table.update()
+                .where(users_table.c.id == db.bindparam('user_id'))
+                .values(unread_count=db.bindparam('unread')),
+                [{'user_id': user_id, 'unread': count}
+                 for user_id, count in chunk])
+        for chunk in chunks(owned.items(), chunk_size):
+            conn.execute(
+                users_table.update()
+                .where(users_table.c.id == db.bindparam('user_id'))
+                .values(diary_count=db.bindparam('owned')),
+                [{'user_id': user_id, 'owned': count}
+                 for user_id, count in chunk])
+        for chunk in chunks(entry_counts.items(), chunk_size):
+            conn.execute(
+                diaries_table.update()
+                .where(diaries_table.c.id == db.bindparam('diary_id'))
+                .values(entry_count=db.bindparam('entries'),
+                        last_entry_at=db.bindparam('last')),
+                [{'diary_id': diary_id, 'entries': count,
+                  'last': last_entry[diary_id]}
+                 for diary_id, count in chunk])
+
+    reset_sequences()
+    return {
+        'users': user_ids,
+        'diaries': diary_ids,
+        'entries': range(first[Entry], first[Entry] + entries),
+        'notifications': range(
+            first[Notification], first[Notification] + notifications),
+    }
@@ -0,0 +1,56 @@
+"""Request scoped unit of work
+With SQLALCHEMY_REQUEST_TRANSACTION on, model save()/delete() only flush
+and the whole request is committed once after the view returns.
+Server errors and exceptions roll the request back instead.
+
+Commits are counted per request, in debug mode the count is sent
+back in the X-DB-Commits header.
+"""
+from flask import current_app, g, has_request_context
+from sqlalchemy import event
+from versions import db
+
+
+def request_transaction():
+    """True when the current request owns the transaction"""
+    return has_request_context() and current_app.config.get(
+        'SQLALCHEMY_REQUEST_TRANSACTION', False)
+
+
+def commit():
+    """Commit now, or flush and leave the commit to the request"""
+    if request_transaction():
+        db.session.flush()
+    else:
+        db.session.commit()
+
+
+def count_commit(session):
+    """Counts commits made during a request"""
+    if has_request_context():
+        g.db_commits = g.get('db_commits', 0) + 1
+
+
+event.listen(db.session, 'after_commit', count_commit)
+
+
+def init_app(app):
+    """Registers request hooks that commit or roll back the request"""
+    @app.after_request
+    def commit_request(response):
+        if request_transaction():
+            if response.status_code < 500:
+                db.session.commit()
+            else:
+                db.session.rollback()
+
+        commits = g.get('db_commits', 0)
+        if app.debug:
+            response.headers['X-DB-Commits'] = str(commits)
+        app.logger.debug('%s commit(s) for %s', commits, response.status)
+        return response
+
+    @app.teardown_request
+    def rollback_request(exc):
+        if exc is not None and request_transaction():
+            db.session.rollback()
@@ -1,7 +1,6 @@
+import datetime
 import re
-from flask_mail import Message
-from flask import jsonify, render_template
-from versions import mail
+from flask import current_app, jsonify, render_template
 from versions.v2.models import Diary, db, User
 
 def check_keys(args, length):
@@ -19,6 +18,30 @@ username_regex = re.compile("^[a-z0-9_-]{3,15}$")
 biz_name_regex = re.compile("[A-z0-9]{4,}")
 password_regex = re.compile("^(?=.*[A-Za-z])(?=.*\d)[A-Za-z\d]{6,}$")
 email_regex = re.compile("[^@]+@[^@]+\.[^@]+")
+iso_datetime_regex = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})'
+    r'(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6})\d*)?)?'
+    r'(Z|[+-]\d{2}:?\d{2})?)?$')
+
+
+def parse_datetime(value):
+    """Parses an ISO 8601 date, or date and time, to a naive UTC datetime
+    datetime.fromisoformat is Python 3.7+, CI runs 3.5
+    raises ValueError
+    """
+    match = iso_datetime_regex.match(value)
+    if not match:
+        raise ValueError('{!r} is not an ISO 8601 date'.format(value))
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    when = datetime.datetime(
+        int(year), int(month), int(day), int(hour or 0), int(minute or 0),
+        int(second or 0), int((fraction or '0').ljust(6, '0')))
+    if offset and offset != 'Z':
+        digits = offset[1:].replace(':', '')
+        shift = datetime.timedelta(
+            hours=int(digits[:2]), minutes=int(digits[2:]))
+        when = when - shift if offset[0] == '+' else when + shift
+    return when
 
 
 def validate(data):
@@ -51,10 +74,22 @@ def validate(data):
 
 
 # Send Mail
+def send_message(msg):
+    """Sends a flask_mail Message
+    Flask-Mail is imported and set up on the app on first use
+    """
+    from flask_mail import Mail
+    mail = Mail()
+    if 'mail' not in current_app.extensions:
+        mail.init_app(current_app)
+    mail.send(msg)
+
+
 def send_email(recipients, hash_key, username, path):
     """Send email activation
     https://blog.miguelgrinberg.com/post/the-flask-mega-tutorial-part-xi-email-support
     """
+    from flask_mail import Message
     msg = Message(
         'Verify Account',
         sender='danielkamarjambo@gmail.com',
@@ -62,12 +97,13 @@ def send_email(recipients, hash_key, username, path):
     )
     msg.html = render_template(
         'email.html', hash_key=hash_key, name=username, path=path)
-    mail.send(msg)
+    send_message(msg)
 
 
 def send_forgot_password_email(recipients, new_password):
     """Send email with new password
     """
+    from flask_mail import Message
     msg = Message(
         'Forgot Password',
         sender='danielkamarjambo@gmail.com',
@@ -77,7 +113,7 @@ def send_forgot_password_email(recipients, new_password):
         'forgotemail.html',
         new_password=new_password
     )
-    mail.send(msg)
+    send_message(msg)
 
 def existing_module(module, name):
     modules = { 'user': User, 'diary': Diary }
@@ -13,6 +13,8 @@ from versions.v2.models import Diary
 from versions import login_required
 from functools import wraps
 from versions.utils import existing_module, get_in_module
+from versions.v2 import serializers
+from versions.v2.serializers import json_response
 
 
 mod = Blueprint('diary_v2', __name__)
@@ -53,19 +55,8 @@ def read_all_diaries():
     diaries = Diary().Search(params)
 
     if diaries:
-        return jsonify({
-            'diaries': [
-                {   'id': diary.id,
-                    'name': diary.name,
-                    'logo': diary.logo,
-                    'location': diary.location,
-                    'category': diary.category,
-                    'bio': diary.bio,
-                    'owner': diary.owner.username,
-                    'created_at': diary.created_at,
-                    'updated_at': diary.updated_at
-                } for diary in diaries
-            ]
+        return json_response({
+            'diaries': serializers.diary.dump_many(diaries)
         }), 200
     return jsonify({'warning': 'No Diaries, create one first'}), 200
 
@@ -102,16 +93,9 @@ def create_diary(current_user):
 
     # Send response if diary was saved
     if new_diary.id:
-        return jsonify({
+        return json_response({
             'success': 'successfully created diary',
-            'diary': {
-                'id': new_diary.id,
-                'name': new_diary.name,
-                'location': new_diary.location,
-                'category': new_diary.category,
-                'bio': new_diary.bio,
-                'owner': new_diary.owner.username
-            }
+            'diary': serializers.new_diary.dump(new_diary)
         }), 201
 
     return jsonify({'warning': 'Could not create new diary'}), 401
@@ -123,18 +107,8 @@ def read_diary(diaryId):
     diary = get_in_module('diary', diaryId)
 
     if diary:
-        return jsonify({
-            'diary': {
-                'id': diary.id,
-                'name': diary.name,
-                'logo': diary.logo,
-                'location': diary.location,
-                'category': diary.category,
-                'bio': diary.bio,
-                'owner': diary.owner.username,
-                'created_at': diary.created_at,
-                'updated_at': diary.updated_at
-            }
+        return json_response({
+            'diary': serializers.diary.dump(diary)
         }), 200
     return jsonify({'warning': 'Diary Not Found'}), 404
 
@@ -158,19 +132,9 @@ def update_diary(current_user, diaryId):
     diary.save()
 
     if diary.name == data['name']:
-        return jsonify({
+        return json_response({
             'success': 'successfully updated',
-            'diary': {
-                'id': diary.id,
-                'name': diary.name,
-                'logo': diary.logo,
-                'location': diary.location,
-                'category': diary.category,
-                'bio': diary.bio,
-                'owner': diary.owner.username,
-                'created_at': diary.created_at,
-                'updated_at': diary.updated_at
-            }
+            'diary': serializers.diary.dump(diary)
         }), 201
 
     return jsonify({'warning': 'Diary Not Updated'}), 400
@@ -7,15 +7,58 @@ PUT: Updates a entry
     expects diaryID, current_user and entryID as arguments
 DELETE: Deletes a Entry
     expects diaryID, current_user and entryID as arguments
+GET /entries/search: Full-text search, see versions/v2/search.py
+Both entry listings take ?from= and ?to=, ISO 8601 dates or times,
+keeping entries created from `from` up to (not including) `to`. A `to`
+without a time includes that whole day, ?from=2018-03-01&to=2018-03-31
+is March. Times with an offset are converted to UTC.
 """
-from flask import Blueprint, jsonify, request
+import datetime
+from flask import Blueprint, jsonify, request, current_app
 from versions.v2.models import Diary, db, User, Entry, Notification
 from versions import login_required
+from versions.utils import parse_datetime
+from versions.v2 import serializers
+from versions.v2.serializers import json_response, stream_response
+from versions.v2.search import InvalidCursor, search_entries
 from functools import wraps
 
 mod = Blueprint('entry_v2', __name__)
 
 
+def parse_when(value, end=False):
+    """Parses a from/to parameter, raises ValueError"""
+    when = parse_datetime(value)
+    if end and len(value) == 10:
+        # a date alone includes that whole day
+        when += datetime.timedelta(days=1)
+    return when
+
+
+def created_between(query, args):
+    """Applies ?from= and ?to= to an Entry query
+    raises ValueError, also when from is not before to
+    """
+    start, end = args.get('from'), args.get('to')
+    start = parse_when(start) if start else None
+    end = parse_when(end, end=True) if end else None
+    if start is not None and end is not None and start >= end:
+        raise ValueError('from must be before to')
+    if start is not None:
+        query = query.filter(Entry.created_at >= start)
+    if end is not None:
+        query = query.filter(Entry.created_at < end)
+    return query
+
+
+def by_date(args):
+    return bool(args.get('from') or args.get('to'))
+
+
+INVALID_RANGE = {
+    'warning': 'from and to must be ISO 8601 dates or times, from before to'}
+
+
 def precheck(f):
     """Checks if diaryID is available
     Check if diary belongs to current user
@@ -74,14 +117,9 @@ def create_entry(current_user, diaryId):
             )
             new_notification.save()
 
-        return jsonify({
+        return json_response({
             'success': 'successfully created entry',
-            'entry': {
-                'id': new_entry.id,
-                'title': new_entry.title,
-                'entryer': new_entry.entryer.username,
-                'desc': new_entry.desc
-            }
+            'entry': serializers.new_entry.dump(new_entry)
         }), 201
 
     return jsonify({'warning': 'Could not create new entries'}), 401
@@ -94,18 +132,22 @@ def read_entry(diaryId):
     if not diary:
         return jsonify({'warning': 'Diary Not Found'}), 404
 
-    if diary.entries:
-        return jsonify({'entries': [
-            {
-                'id': entry.id,
-                'title': entry.title,
-                'desc': entry.desc,
-                'entryer': entry.entryer.username,
-                'diary': entry.diary.name,
-                'created_at': entry.created_at,
-                'updated_at': entry.updated_at,
-            } for entry in diary.entries
-        ]}), 200
+    try:
+        entries = created_between(
+            Entry.query.filter(Entry.diary_id == diary.id), request.args)
+    except ValueError:
+        return jsonify(INVALID_RANGE), 400
+    entries = entries.options(
+        db.joinedload(Entry.entryer).load_only('username'),
+        db.joinedload(Entry.diary).load_only('name')
+    ).order_by(*(
+        (Entry.created_at, Entry.id) if by_date(request.args) else
+        (Entry.id,))).all()
+
+    if entries:
+        return json_response({
+            'entries': serializers.entry.dump_many(entries)
+        }), 200
 
     return jsonify({'warning': 'Diary has no entries'}), 200
 
@@ -134,24 +176,59 @@ def delete_entry(current_user, diaryId, entryId):
 @mod.route('/entries', methods=['GET'])
 @login_required
 def read_all_entries(current_user):
-    """Reads all Entries"""
-    entries = Entry.query.all()
-    if entries:
-        return jsonify({'Entries': [
-            {
-                'id': entry.id,
-                'title': entry.title,
-                'desc': entry.desc,
-                'entryer': entry.entryer.username,
-                'diary': entry.diary.name,
-                'created_at': entry.created_at,
-                'updated_at': entry.updated_at
-            } for entry in entries
-        ]}), 200
+    """Reads all Entries, streamed"""
+    try:
+        entries = created_between(Entry.query, request.args)
+    except ValueError:
+        return jsonify(INVALID_RANGE), 400
+    entries = entries.order_by(*(
+        (Entry.created_at, Entry.id) if by_date(request.args) else
+        (Entry.id,)))
+    if db.session.query(entries.exists()).scalar():
+        return stream_response(entries.options(
+            db.joinedload(Entry.entryer).load_only('username'),
+            db.joinedload(Entry.diary).load_only('name')
+        ), serializers.entry, 'Entries'), 200
 
     return jsonify({'warning': 'No Entry, create one first'}), 200
 
 
+@mod.route('/entries/search', methods=['GET'])
+@login_required
+def search(current_user):
+    """Searches entry titles and texts
+    ?q= words that must all match
+    ?user= and ?diary= scope the search to an entryer or a diary
+    ?cursor= comes from X-Next-Cursor of the previous page
+    ?limit= is capped at SEARCH_PAGE_SIZE_MAX
+    """
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'warning': 'Provide a search query with ?q='}), 400
+
+    limit = request.args.get(
+        'limit', default=current_app.config['SEARCH_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['SEARCH_PAGE_SIZE_MAX']))
+    try:
+        results, cursor = search_entries(
+            q, user_id=request.args.get('user', type=int),
+            diary_id=request.args.get('diary', type=int), limit=limit,
+            cursor=request.args.get('cursor'))
+    except InvalidCursor:
+        return jsonify({'warning': 'Invalid cursor'}), 400
+
+    entries = []
+    for entry, rank, highlight in results:
+        data = serializers.entry.dump(entry)
+        data['rank'] = rank
+        data['highlight'] = highlight
+        entries.append(data)
+    response = json_response({'entries': entries})
+    if cursor:
+        response.headers['X-Next-Cursor'] = cursor
+    return response, 200
+
+
 @mod.route('/<diaryId>/entries/<entryId>', methods=['PUT'])
 @login_required
 @precheck
@@ -168,17 +245,9 @@ def update_diary(current_user, diaryId, entryId):
     entry.save()
 
     if entry.title == data['title']:
-        return jsonify({
+        return json_response({
             'success': 'successfully updated',
-            'entry': {
-                'id': entry.id,
-                'title': entry.title,
-                'desc': entry.desc,
-                'entryer': entry.entryer.username,
-                'diary': entry.diary.name,
-                'created_at': entry.created_at,
-                'updated_at': entry.updated_at
-            }
+            'entry': serializers.entry.dump(entry)
         }), 201
 
     return jsonify({'warning': 'Entry Not Updated'}), 400
@@ -0,0 +1,179 @@
+"""Per user data export, served by GET /api/v2/users/<id>/export
+Every diary a user owns and every entry they wrote, one record per row,
+as NDJSON (default) or CSV with ?format=csv. Records are ordered diaries
+first, then entries, by id, and all share COLUMNS:
+    kind        diary or entry
+    id
+    diary_id    the diary's own id for diaries
+    title       diary name or entry title
+    text        diary bio or entry text
+    location, category, logo    null for entries
+    created_at, updated_at      ISO 8601, UTC
+They come from one UNION ALL query read through a server side cursor
+(stream_results, a named cursor on psycopg2) EXPORT_BATCH_SIZE rows at a
+time, so memory stays flat however large the export is.
+
+The body has no known length until it is sent, so downloads resume by
+row instead of byte: `Range: rows=N-` skips the first N records (the
+CSV header is not a record). The ETag changes whenever a record is
+added, removed or updated; sent back as If-Range it makes sure a resumed
+download continues the same data, otherwise it starts over with a 200.
+"""
+import csv
+import datetime
+import hashlib
+import io
+import re
+from flask import current_app, stream_with_context
+from versions import db
+from versions.v2.models import Diary, Entry
+from versions.v2.serializers import get_backend
+
+COLUMNS = (
+    'kind', 'id', 'diary_id', 'title', 'text', 'location', 'category',
+    'logo', 'created_at', 'updated_at'
+)
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+RANGE = re.compile(r'^rows=(\d+)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def export_query(user_id):
+    diaries = Diary.__table__
+    entries = Entry.__table__
+
+    def null(name):
+        return db.cast(db.null(), db.String).label(name)
+
+    return db.union_all(
+        db.select([
+            db.literal('diary').label('kind'), diaries.c.id,
+            diaries.c.id.label('diary_id'), diaries.c.name.label('title'),
+            diaries.c.bio.label('text'), diaries.c.location,
+            diaries.c.category, diaries.c.logo, diaries.c.created_at,
+            diaries.c.updated_at
+        ]).where(diaries.c.user_id == user_id),
+        db.select([
+            db.literal('entry'), entries.c.id, entries.c.diary_id,
+            entries.c.title, entries.c.desc, null('location'),
+            null('category'), null('logo'),
+            entries.c.created_at, entries.c.updated_at
+        ]).where(entries.c.user_id == user_id)
+    ).order_by(db.column('kind'), db.column('id'))
+
+
+def summary(user_id):
+    """Returns (records, etag) of a user's export"""
+    parts = []
+    total = 0
+    for model in (Diary, Entry):
+        row = db.session.query(
+            db.func.count(model.id), db.func.max(model.id),
+            db.func.max(db.func.coalesce(model.updated_at, model.created_at))
+        ).filter(model.user_id == user_id).one()
+        total += row[0]
+        parts.extend(str(value) for value in row)
+    etag = hashlib.sha1(':'.join(parts).encode('utf-8')).hexdigest()
+    return total, etag
+
+
+def parse_range(header, total):
+    """Returns (start, stop) of a rows range, None to send everything"""
+    match = RANGE.match(header.replace(' ', '')) if header else None
+    if not match:
+        return None
+    start = int(match.group(1))
+    stop = int(match.group(2)) + 1 if match.group(2) else total
+    if start >= total or stop <= start:
+        raise RangeNotSatisfiable()
+    return start, min(stop, total)
+
+
+def to_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def rows(query, batch_size):
+    """Yields lists of record dicts, read with a server side cursor"""
+    session = db.create_session({})()
+    try:
+        result = session.connection(
+            execution_options={'stream_results': True}).execute(query)
+        while True:
+            batch = result.fetchmany(batch_size)
+            if not batch:
+                break
+            yield [dict((name, to_value(value))
+                        for name, value in zip(COLUMNS, row))
+                   for row in batch]
+        result.close()
+    finally:
+        session.close()
+
+
+def ndjson(batches, header):
+    """Encodes batches as json lines, ndjson has no header"""
+    dumps = get_backend(current_app.config.get('JSON_BACKEND', 'json'))
+    for batch in batches:
+        lines = []
+        for record in batch:
+            line = dumps(record, False)
+            lines.append(
+                line if isinstance(line, bytes) else line.encode('utf-8'))
+        yield b'\n'.join(lines) + b'\n'
+
+
+def csv_lines(batches, header):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, COLUMNS, lineterminator='\n')
+    if header:
+        writer.writeheader()
+    for batch in batches:
+        writer.writerows(batch)
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode('utf-8')
+
+
+def export_response(user_id, fmt, range_header=None, if_range=None):
+    """Streams a user's export, a 416 when the range is past the end"""
+    app = current_app._get_current_object()
+    total, etag = summary(user_id)
+    span = None
+    if range_header and (not if_range or if_range.strip('"') == etag):
+        try:
+            span = parse_range(range_header, total)
+        except RangeNotSatisfiable:
+            response = app.response_class(status=416)
+            response.headers['Content-Range'] = 'rows */{}'.format(total)
+            return response
+
+    query = export_query(user_id)
+    if span:
+        query = query.offset(span[0]).limit(span[1] - span[0])
+    encode = csv_lines if fmt == 'csv' else ndjson
+    body = encode(rows(query, app.config['EXPORT_BATCH_SIZE']),
+                  header=span is None)
+
+    response = app.response_class(
+        stream_with_context(body), mimetype=FORMATS[fmt])
+    response.set_etag(etag)
+    response.headers['Accept-Ranges'] = 'rows'
+    response.headers['X-Total-Count'] = str(total)
+    response.headers['Content-Disposition'] = (
+        'attachment; filename="diaries-{}.{}"'.format(user_id, fmt))
+    if span:
+        response.status_code = 206
+        response.headers['Content-Range'] = 'rows {}-{}/{}'.format(
+            span[0], span[1] - 1, total)
+    return response
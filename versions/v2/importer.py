@@ -0,0 +1,346 @@
+"""Bulk import of diaries and entries, POST /api/v2/imports
+Takes the NDJSON or CSV written by the user export (versions/v2/export.py),
+one record per line:
+    kind        diary or entry
+    id          a diary's id in the file, entries point at it
+    diary_id    the diary of an entry: a diary id from the same file or
+                one of the importing user's diaries
+    title       diary name or entry title, required
+    text        diary bio or entry text, required for entries
+    location, category, logo    optional, diaries only
+    created_at  optional ISO 8601, defaults to the time of the import
+Anything else (updated_at, unknown keys) is ignored.
+
+The upload is spooled to a file and the job runs in a background thread
+(IMPORT_ASYNC), in three steps, status tracks which one it is in:
+    staging     records are validated as they are read and written to
+                import_rows in IMPORT_BATCH_SIZE batches, with COPY on
+                Postgres; rows counts the records read so far
+    merging     references and diary names are checked, then in one
+                transaction the names are checked again, the diaries
+                inserted (their new ids kept in import_rows), the
+                entries inserted with one INSERT .. SELECT and the
+                user's diary and entry counters recomputed
+    done        diaries and entries hold what was created
+A single invalid record fails the job (status failed) and nothing is
+created. The first IMPORT_MAX_ERRORS problems are kept in errors, with
+the line they were found on.
+
+Jobs run in the process that received the upload. One interrupted by
+a restart is left in staging or merging, with its rows in import_rows.
+"""
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from versions import db
+from versions.bulk import chunks, write_rows
+from versions.utils import parse_datetime
+from versions.v2.models import Diary, Entry, ImportJob, ImportRow
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('ndjson', 'csv')
+STAGING_COLUMNS = (
+    'job_id', 'line', 'kind', 'ref', 'diary_ref', 'diary_id', 'title',
+    'text', 'location', 'category', 'logo', 'created_at'
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def records(stream, fmt):
+    """Yields (line, record dict or InvalidRecord) of an upload"""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line, raw in enumerate(text, 1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError:
+            yield line, InvalidRecord('not valid json')
+            continue
+        if not isinstance(record, dict):
+            yield line, InvalidRecord('not a json object')
+            continue
+        yield line, record
+
+
+def string(record, key, required=False):
+    value = record.get(key)
+    if value is None or value == '':
+        if required:
+            raise InvalidRecord('{} is required'.format(key))
+        return None
+    if isinstance(value, (dict, list, bool)):
+        raise InvalidRecord('{} must be a string'.format(key))
+    return str(value).strip()
+
+
+def timestamp(record):
+    value = string(record, 'created_at')
+    if value is None:
+        return None
+    try:
+        # timestamps are stored as naive UTC
+        return parse_datetime(value)
+    except ValueError:
+        raise InvalidRecord('created_at is not an ISO 8601 date')
+
+
+def validate(job_id, line, record):
+    """Returns the import_rows tuple of a record, raises InvalidRecord"""
+    if isinstance(record, InvalidRecord):
+        raise record
+    kind = record.get('kind')
+    if kind == 'diary':
+        return (job_id, line, kind, string(record, 'id', True), None, None,
+                string(record, 'title', True), string(record, 'text'),
+                string(record, 'location'), string(record, 'category'),
+                string(record, 'logo'), timestamp(record))
+    if kind == 'entry':
+        diary_ref = string(record, 'diary_id', True)
+        return (job_id, line, kind, None, diary_ref,
+                int(diary_ref) if diary_ref.isdigit() else None,
+                string(record, 'title', True), string(record, 'text', True),
+                None, None, None, timestamp(record))
+    raise InvalidRecord('kind must be diary or entry')
+
+
+class Problems(object):
+    """Counts invalid records, keeps the first `limit` of them"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+        self.kept = []
+
+    def add(self, line, error):
+        self.count += 1
+        if len(self.kept) < self.limit:
+            self.kept.append({'line': line, 'error': str(error)})
+
+    def __bool__(self):
+        return self.count > 0
+
+
+def update(job, **values):
+    for key, value in values.items():
+        setattr(job, key, value)
+    db.session.commit()
+
+
+def stage(job, path, problems):
+    """Validates the upload into import_rows
+    returns (diary ids, diary names, diary ids used by entries)
+    """
+    config = current_app.config
+    refs, names, used = set(), set(), set()
+
+    def valid_rows():
+        for line, record in records(stream, job.format):
+            job.rows += 1
+            try:
+                row = validate(job.id, line, record)
+            except InvalidRecord as error:
+                problems.add(line, error)
+                continue
+            if row[2] == 'diary':
+                if row[3] in refs:
+                    problems.add(line, 'diary id {} is repeated'.format(row[3]))
+                if row[6] in names:
+                    problems.add(line, 'diary name {} is repeated'.format(
+                        row[6]))
+                refs.add(row[3])
+                names.add(row[6])
+            else:
+                used.add(row[4])
+            yield row
+
+    with open(path, 'rb') as stream:
+        for chunk in chunks(valid_rows(), config['IMPORT_BATCH_SIZE']):
+            # keep validating after the first problem, but stop staging
+            if not problems:
+                write_rows(ImportRow.__table__, STAGING_COLUMNS, chunk,
+                           len(chunk))
+            update(job, invalid=problems.count)
+    update(job, invalid=problems.count)
+    return refs, names, used
+
+
+def check_references(job, refs, names, used, problems):
+    """Entries must point at a diary of the file or one the user owns,
+    new diary names must not be taken
+    """
+    external = used - refs
+    ids = set()
+    for ref in external:
+        if ref.isdigit():
+            ids.add(int(ref))
+        else:
+            problems.add(None, 'diary {} is not in the file'.format(ref))
+    for chunk in chunks(sorted(ids), 1000):
+        owned = set(diary_id for diary_id, in db.session.query(
+            Diary.id).filter(Diary.id.in_(chunk), Diary.user_id == job.user_id))
+        for diary_id in chunk:
+            if diary_id not in owned:
+                problems.add(None, 'diary {} is not in the file or not yours'
+                             .format(diary_id))
+    taken_names(db.session, names, problems)
+
+
+def taken_names(bind, names, problems):
+    """Adds a problem for every name of names a diary already has"""
+    diaries = Diary.__table__
+    for chunk in chunks(sorted(names), 1000):
+        for name, in bind.execute(db.select([diaries.c.name]).where(
+                diaries.c.name.in_(chunk))):
+            problems.add(None, 'diary name {} is already taken'.format(name))
+
+
+def insert_diaries(conn, job):
+    """Inserts the staged diaries, returns {file id: new diary id}
+    with RETURNING on Postgres, one insert per diary elsewhere
+    """
+    rows = ImportRow.__table__
+    diaries = Diary.__table__
+    columns = ['name', 'logo', 'location', 'category', 'bio', 'user_id',
+               'created_at']
+    staged = db.select([
+        rows.c.title, rows.c.logo, rows.c.location, rows.c.category,
+        rows.c.text, db.literal(job.user_id),
+        db.func.coalesce(rows.c.created_at, db.func.current_timestamp())
+    ]).where(db.and_(
+        rows.c.job_id == job.id, rows.c.kind == 'diary'
+    )).order_by(rows.c.line)
+
+    refs = dict(conn.execute(db.select([rows.c.title, rows.c.ref]).where(
+        db.and_(rows.c.job_id == job.id, rows.c.kind == 'diary'))).fetchall())
+    if conn.dialect.name == 'postgresql':
+        # names are unique within the file, they tell the returned ids apart
+        return dict(
+            (refs[name], diary_id) for diary_id, name in conn.execute(
+                diaries.insert().from_select(columns, staged).returning(
+                    diaries.c.id, diaries.c.name)))
+    return dict(
+        (refs[row[0]], conn.execute(diaries.insert().values(
+            dict(zip(columns, row)))).inserted_primary_key[0])
+        for row in conn.execute(staged).fetchall())
+
+
+def merge(job, names, problems):
+    """Inserts the staged diaries and entries in one transaction
+    diary names are checked again in it, adding problems and creating
+    nothing when one was taken since check_references
+    """
+    rows = ImportRow.__table__
+    entries = Entry.__table__
+
+    entry, diary_row = rows.alias('entry'), rows.alias('diary_row')
+    new_entries = db.select([
+        entry.c.title, entry.c.text, db.literal(job.user_id),
+        # diary_id of a staged diary row is the id it was created with
+        db.func.coalesce(diary_row.c.diary_id, entry.c.diary_id),
+        db.func.coalesce(entry.c.created_at, db.func.current_timestamp())
+    ]).select_from(
+        entry.outerjoin(diary_row, db.and_(
+            diary_row.c.job_id == entry.c.job_id,
+            diary_row.c.kind == 'diary',
+            diary_row.c.ref == entry.c.diary_ref
+        ))
+    ).where(db.and_(
+        entry.c.job_id == job.id, entry.c.kind == 'entry'
+    )).order_by(entry.c.line)
+
+    jobs = ImportJob.__table__
+    with db.engine.begin() as conn:
+        taken_names(conn, names, problems)
+        if problems:
+            return
+        created = insert_diaries(conn, job)
+        if created:
+            conn.execute(
+                rows.update().where(db.and_(
+                    rows.c.job_id == job.id, rows.c.kind == 'diary',
+                    rows.c.ref == db.bindparam('file_id')
+                )).values(diary_id=db.bindparam('new_id')),
+                [{'file_id': ref, 'new_id': diary_id}
+                 for ref, diary_id in created.items()])
+        written = conn.execute(entries.insert().from_select(
+            ['title', 'desc', 'user_id', 'diary_id', 'created_at'],
+            new_entries)).rowcount
+        # the inserts bypass the ORM counter cache, entries only go to
+        # the importing user's diaries
+        Diary.reconcile_counts(conn, job.user_id)
+        conn.execute(rows.delete().where(rows.c.job_id == job.id))
+        conn.execute(jobs.update().where(jobs.c.id == job.id).values(
+            status='done', diaries=len(created), entries=written,
+            finished_at=datetime.datetime.utcnow()))
+
+
+def fail(job, problems):
+    ImportRow.query.filter_by(job_id=job.id).delete(synchronize_session=False)
+    update(job, status='failed', invalid=problems.count,
+           errors=json.dumps(problems.kept),
+           finished_at=datetime.datetime.utcnow())
+
+
+def run(job_id, path):
+    """Runs an import job, the upload at path is removed afterwards"""
+    job = ImportJob.query.get(job_id)
+    problems = Problems(current_app.config['IMPORT_MAX_ERRORS'])
+    try:
+        update(job, status='staging')
+        refs, names, used = stage(job, path, problems)
+        if not problems:
+            update(job, status='merging')
+            check_references(job, refs, names, used, problems)
+        if not problems:
+            merge(job, names, problems)
+        if problems:
+            fail(job, problems)
+    except Exception:
+        logger.exception('import %s failed', job_id)
+        db.session.rollback()
+        problems.add(None, 'import failed, nothing was created')
+        fail(job, problems)
+    finally:
+        os.remove(path)
+
+
+def run_in_app(app, job_id, path):
+    with app.app_context():
+        try:
+            run(job_id, path)
+        finally:
+            db.session.remove()
+
+
+def submit(job_id, path):
+    """Runs the job now, or in the background with IMPORT_ASYNC"""
+    global _executor
+    app = current_app._get_current_object()
+    if not app.config['IMPORT_ASYNC']:
+        return run(job_id, path)
+
+    with _executor_lock:
+        if _executor is None:
+            # thread_name_prefix is Python 3.6+
+            _executor = ThreadPoolExecutor(app.config['IMPORT_WORKERS'])
+    return _executor.submit(run_in_app, app, job_id, path)
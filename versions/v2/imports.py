@@ -0,0 +1,83 @@
+"""defines bulk import routes, see versions/v2/importer.py
+upload NDJSON or CSV of diaries and entries
+    the body is the file, ?format= or the content type says which
+    answers 202 with the job, Location points at its status
+get the status of an import job
+"""
+import os
+import tempfile
+from flask import Blueprint, jsonify, request, current_app
+from versions import db, login_required
+from versions.v2 import serializers
+from versions.v2.importer import FORMATS, submit
+from versions.v2.models import ImportJob
+from versions.v2.serializers import json_response
+
+mod = Blueprint('imports_v2', __name__)
+
+CONTENT_TYPES = {
+    'application/x-ndjson': 'ndjson',
+    'application/jsonlines': 'ndjson',
+    'text/csv': 'csv',
+}
+
+
+def spool(stream, limit):
+    """Copies the request body to a temporary file
+    returns its path, None when the body is larger than limit
+    """
+    fd, path = tempfile.mkstemp(prefix='import-', suffix='.upload')
+    size = 0
+    with os.fdopen(fd, 'wb') as f:
+        while True:
+            chunk = stream.read(64 * 1024)
+            if not chunk:
+                return path
+            size += len(chunk)
+            if size > limit:
+                break
+            f.write(chunk)
+    os.remove(path)
+    return None
+
+
+@mod.route('', methods=['POST'])
+@login_required
+def create_import(current_user):
+    """Starts an import of the uploaded file"""
+    fmt = request.args.get('format') or CONTENT_TYPES.get(request.mimetype)
+    if fmt not in FORMATS:
+        return jsonify({
+            'warning': 'Send ndjson or csv, as the content type or ?format='
+        }), 400
+
+    limit = current_app.config['IMPORT_MAX_BYTES']
+    if request.content_length and request.content_length > limit:
+        return jsonify({'warning': 'Upload is too large'}), 413
+    path = spool(request.stream, limit)
+    if path is None:
+        return jsonify({'warning': 'Upload is too large'}), 413
+
+    job = ImportJob(current_user, fmt)
+    db.session.add(job)
+    # the job runs outside this request, it has to be visible to it now
+    db.session.commit()
+    submit(job.id, path)
+    db.session.refresh(job)
+
+    response = json_response({'job': serializers.import_job.dump(job)}, 202)
+    response.headers['Location'] = '/api/v2/imports/{}'.format(job.id)
+    return response
+
+
+@mod.route('/<int:job_id>', methods=['GET'])
+@login_required
+def read_import(current_user, job_id):
+    """Reports the progress of an import job"""
+    job = ImportJob.query.get(job_id)
+    if not job:
+        return jsonify({'warning': 'Import Not Found'}), 404
+    if job.user_id != current_user:
+        return jsonify({'warning': 'Not Allowed, you are not owner'}), 401
+
+    return json_response({'job': serializers.import_job.dump(job)}), 200
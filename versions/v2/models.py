@@ -1,5 +1,10 @@
+import datetime
 import uuid
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.util import identity_key
 from versions import db
+from versions.transaction import commit
 from passlib.hash import sha256_crypt
 
 
@@ -9,8 +14,11 @@ class User(db.Model):
     User has many diariess
     User has many entries
     delete-orphan to delete any attached child
+    unread_count and diary_count are counter caches
     """
     __tablename__ = 'users'
+    # created_at/updated_at come back in the INSERT/UPDATE .. RETURNING
+    __mapper_args__ = {'eager_defaults': True}
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     username = db.Column(db.String(), unique=True, nullable=False)
@@ -19,10 +27,15 @@ class User(db.Model):
     password = db.Column(db.String(), nullable=False)
     hash_key = db.Column(db.String(), unique=True, nullable=False)
     activate = db.Column(db.String(), nullable=False)
-    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    unread_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    diary_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    created_at = db.Column(
+        db.DateTime, server_default=db.func.current_timestamp())
     updated_at = db.Column(
         db.DateTime,
-        default=db.func.current_timestamp(),
+        server_default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp()
     )
     diaries = db.relationship(
@@ -58,7 +71,7 @@ class User(db.Model):
     def save(self):
         """Commits user instance to the database"""
         db.session.add(self)
-        db.session.commit()
+        commit()
 
 
 class Diary(db.Model):
@@ -66,8 +79,11 @@ class Diary(db.Model):
     One-to-Many relationship with entry and user
     diary belongs to user
     diary has many entries
+    entry_count and last_entry_at are a counter cache kept by the
+    entry events below, reconcile_counts repairs drift
     """
     __tablename__ = 'diaries'
+    __mapper_args__ = {'eager_defaults': True}
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(), index=True)
@@ -75,11 +91,16 @@ class Diary(db.Model):
     location = db.Column(db.String(), index=True)
     category = db.Column(db.String(), index=True)
     bio = db.Column(db.String())
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    user_id = db.Column(
+        db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    entry_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    last_entry_at = db.Column(db.DateTime)
+    created_at = db.Column(
+        db.DateTime, server_default=db.func.current_timestamp())
     updated_at = db.Column(
         db.DateTime,
-        default=db.func.current_timestamp(),
+        server_default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp()
     )
     entries = db.relationship(
@@ -145,12 +166,48 @@ class Diary(db.Model):
     def save(self):
         """Save a diary to the database"""
         db.session.add(self)
-        db.session.commit()
+        commit()
 
     def delete(self):
         """Delete a given diary"""
         db.session.delete(self)
-        db.session.commit()
+        commit()
+
+    @staticmethod
+    def reconcile_counts(connection=None, user_id=None):
+        """Recomputes diaries.entry_count, diaries.last_entry_at and
+        users.diary_count from the entries and diaries tables
+        runs on connection without committing when given, for bulk
+        writes that fix the counters in their own transaction
+        user_id limits it to that user and their diaries
+        returns (diaries corrected, users corrected)
+        """
+        diaries, users = Diary.__table__, User.__table__
+        entries = Entry.__table__
+        count = db.select([db.func.count(entries.c.id)]).where(
+            entries.c.diary_id == diaries.c.id).as_scalar()
+        latest = latest_entry_at(diaries)
+        owned = db.select([db.func.count(diaries.c.id)]).where(
+            diaries.c.user_id == users.c.id).as_scalar()
+
+        fix_diaries = diaries.update().where(db.or_(
+            diaries.c.entry_count != count,
+            diaries.c.last_entry_at.is_distinct_from(latest)
+        )).values(entry_count=count, last_entry_at=latest,
+                  updated_at=diaries.c.updated_at)
+        fix_users = users.update().where(
+            users.c.diary_count != owned
+        ).values(diary_count=owned, updated_at=users.c.updated_at)
+        if user_id is not None:
+            fix_diaries = fix_diaries.where(diaries.c.user_id == user_id)
+            fix_users = fix_users.where(users.c.id == user_id)
+
+        bind = db.session if connection is None else connection
+        fixed = (bind.execute(fix_diaries).rowcount,
+                 bind.execute(fix_users).rowcount)
+        if connection is None:
+            db.session.commit()
+        return fixed
 
 
 class Entry(db.Model):
@@ -160,15 +217,27 @@ class Entry(db.Model):
     entry belongs to user
     """
     __tablename__ = 'entries'
+    __mapper_args__ = {'eager_defaults': True}
+    # entries are appended in created_at order, on Postgres a BRIN index
+    # is a fraction of the size of a btree and date ranges only read the
+    # block ranges holding them; other databases get a btree
+    __table_args__ = (
+        db.Index('ix_entries_created_at', 'created_at',
+                 postgresql_using='brin',
+                 postgresql_with={'pages_per_range': 32}),
+        db.Index('ix_entries_diary_id_created_at', 'diary_id', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     title = db.Column(db.String())
     desc = db.Column(db.String())
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    user_id = db.Column(
+        db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    created_at = db.Column(
+        db.DateTime, server_default=db.func.current_timestamp())
     updated_at = db.Column(
         db.DateTime,
-        default=db.func.current_timestamp(),
+        server_default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp()
     )
     diary_id = db.Column(
@@ -186,17 +255,18 @@ class Entry(db.Model):
     def save(self):
         """Save a entry to the database"""
         db.session.add(self)
-        db.session.commit()
+        commit()
 
     def delete(self):
         """Delete a given entry."""
         db.session.delete(self)
-        db.session.commit()
+        commit()
 
 
 class Notification(db.Model):
     """Handles notifications when user entries on a diary"""
     __tablename__ = 'notifications'
+    __mapper_args__ = {'eager_defaults': True}
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     recipient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -204,8 +274,9 @@ class Notification(db.Model):
     diary_id = db.Column(db.Integer, nullable=False)
     entry_id = db.Column(db.Integer, nullable=False)
     action = db.Column(db.String(), nullable=False)
-    read_at = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    read_at = db.Column(db.DateTime, index=True)
+    created_at = db.Column(
+        db.DateTime, server_default=db.func.current_timestamp())
 
     def __init__(self, recipient, actor, diary_id, entry_id, read_at=None):
         self.recipient = recipient
@@ -215,25 +286,321 @@ class Notification(db.Model):
         self.read_at = read_at
         self.action = ' entryed one of your diaries'
 
+    def mark_read(self):
+        """Marks notification as read
+        decrements the recipient's unread counter only when
+        the notification was unread before
+        """
+        if self.read_at is None:
+            User.query.filter_by(id=self.recipient_id).update(
+                {User.unread_count: User.unread_count - 1},
+                synchronize_session=False
+            )
+        self.read_at = db.func.current_timestamp()
+        self.save()
+
+    @staticmethod
+    def mark_many_read(user_id, ids):
+        """Marks the given unread notifications of a user read
+        one UPDATE for the notifications and one for the counter
+        returns how many were marked
+        """
+        marked = Notification.query.filter(
+            Notification.recipient_id == user_id,
+            Notification.id.in_(ids),
+            Notification.read_at == None
+        ).update(
+            {Notification.read_at: db.func.current_timestamp()},
+            synchronize_session=False
+        )
+        if marked:
+            User.query.filter_by(id=user_id).update(
+                {User.unread_count: User.unread_count - marked},
+                synchronize_session=False
+            )
+        commit()
+        return marked
+
+    @staticmethod
+    def mark_all_read(user_id):
+        """Marks every unread notification of a user read
+        one UPDATE for the notifications and one for the counter
+        returns how many were marked
+        """
+        marked = Notification.query.filter(
+            Notification.recipient_id == user_id,
+            Notification.read_at == None
+        ).update(
+            {Notification.read_at: db.func.current_timestamp()},
+            synchronize_session=False
+        )
+        if marked:
+            User.query.filter_by(id=user_id).update(
+                {User.unread_count: User.unread_count - marked},
+                synchronize_session=False
+            )
+        commit()
+        return marked
+
+    @staticmethod
+    def reconcile_unread_counts():
+        """Recomputes users.unread_count from the notifications table
+        fixes any drift in the counter cache
+        returns number of users whose counter was corrected
+        """
+        unread = db.select([db.func.count(Notification.id)]).where(
+            db.and_(
+                Notification.recipient_id == User.id,
+                Notification.read_at == None
+            )
+        ).as_scalar()
+        fixed = User.query.filter(User.unread_count != unread).update(
+            {User.unread_count: unread},
+            synchronize_session=False
+        )
+        db.session.commit()
+        return fixed
+
+    @staticmethod
+    def prune_read(before, batch_size=1000, archive=True):
+        """Moves read notifications older than `before` out of the table
+        works in batches of `batch_size` rows, each batch is its own
+        transaction so locks are only held for one batch
+        copies rows to notifications_archive first when archive is set
+        yields number of rows removed per batch
+        """
+        columns = [
+            'id', 'recipient_id', 'actor', 'diary_id',
+            'entry_id', 'action', 'read_at', 'created_at'
+        ]
+        notifications = Notification.__table__
+        while True:
+            ids = [row.id for row in db.session.query(Notification.id).filter(
+                Notification.read_at != None,
+                Notification.read_at < before
+            ).order_by(Notification.id).limit(batch_size)]
+
+            if not ids:
+                break
+
+            if archive:
+                db.session.execute(
+                    NotificationArchive.__table__.insert().from_select(
+                        columns,
+                        db.select(
+                            [notifications.c[name] for name in columns]
+                        ).where(notifications.c.id.in_(ids))
+                    )
+                )
+            Notification.query.filter(
+                Notification.id.in_(ids)
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            yield len(ids)
+
     def save(self):
         """Save a entry to the database"""
         db.session.add(self)
-        db.session.commit()
+        commit()
+
+
+class NotificationArchive(db.Model):
+    """Read notifications moved out of notifications by retention"""
+    __tablename__ = 'notifications_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    recipient_id = db.Column(db.Integer, nullable=False, index=True)
+    actor = db.Column(db.String(), nullable=False)
+    diary_id = db.Column(db.Integer, nullable=False)
+    entry_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(), nullable=False)
+    read_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(
+        db.DateTime, default=db.func.current_timestamp())
+
+
+@event.listens_for(Notification, 'after_insert')
+def increment_unread_count(mapper, connection, target):
+    """Counter cache, every unread notification bumps users.unread_count"""
+    if target.read_at is None:
+        users = User.__table__
+        connection.execute(
+            users.update().where(
+                users.c.id == target.recipient_id
+            ).values(unread_count=users.c.unread_count + 1)
+        )
+
+
+def latest_entry_at(diaries):
+    """created_at of the newest entry of the diaries row being updated"""
+    entries = Entry.__table__
+    return db.select([db.func.max(entries.c.created_at)]).where(
+        entries.c.diary_id == diaries.c.id).as_scalar()
+
+
+def expire_counts(target, parent, model, pk, *keys):
+    """The counters are changed in SQL, the copy the session holds
+    (it does not expire on commit) reloads them on next access
+    parent is the relationship to it, the identity map only holds
+    rows inserted in the same flush once the flush is done
+    """
+    session = object_session(target)
+    obj = (target.__dict__.get(parent) or
+           session.identity_map.get(identity_key(model, pk)))
+    if obj is not None:
+        session.info.setdefault('expire_counts', []).append((obj, keys))
+
+
+@event.listens_for(db.session, 'after_flush_postexec')
+def expire_changed_counts(session, flush_context):
+    for obj, keys in session.info.pop('expire_counts', ()):
+        if obj in session and obj not in session.deleted:
+            session.expire(obj, keys)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_counts(session):
+    session.info.pop('expire_counts', None)
+
+
+def count_entries(connection, target, change):
+    diaries = Diary.__table__
+    connection.execute(
+        diaries.update().where(
+            diaries.c.id == target.diary_id
+        ).values(entry_count=diaries.c.entry_count + change,
+                 last_entry_at=latest_entry_at(diaries),
+                 # a new entry is not an edit of the diary
+                 updated_at=diaries.c.updated_at)
+    )
+    expire_counts(target, 'diary', Diary, target.diary_id,
+                  'entry_count', 'last_entry_at')
+
+
+@event.listens_for(Entry, 'after_insert')
+def count_new_entry(mapper, connection, target):
+    """Counter cache, diaries.entry_count and last_entry_at follow
+    their entries in the transaction that writes them
+    """
+    count_entries(connection, target, 1)
+
+
+@event.listens_for(Entry, 'after_delete')
+def count_deleted_entry(mapper, connection, target):
+    count_entries(connection, target, -1)
+
+
+def count_diaries(connection, target, change):
+    users = User.__table__
+    connection.execute(
+        users.update().where(
+            users.c.id == target.user_id
+        ).values(diary_count=users.c.diary_count + change,
+                 updated_at=users.c.updated_at)
+    )
+    expire_counts(target, 'owner', User, target.user_id, 'diary_count')
+
+
+@event.listens_for(Diary, 'after_insert')
+def count_new_diary(mapper, connection, target):
+    """Counter cache, users.diary_count"""
+    count_diaries(connection, target, 1)
+
+
+@event.listens_for(Diary, 'after_delete')
+def count_deleted_diary(mapper, connection, target):
+    count_diaries(connection, target, -1)
+
+
+class ImportJob(db.Model):
+    """A bulk import of diaries and entries, see versions/v2/importer.py
+    status moves from pending to staging, merging and then done or failed
+    """
+    __tablename__ = 'import_jobs'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    format = db.Column(db.String(), nullable=False)
+    status = db.Column(db.String(), nullable=False, default='pending')
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    invalid = db.Column(db.Integer, nullable=False, default=0)
+    diaries = db.Column(db.Integer, nullable=False, default=0)
+    entries = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text)
+    created_at = db.Column(
+        db.DateTime, server_default=db.func.current_timestamp())
+    finished_at = db.Column(db.DateTime)
+
+    def __init__(self, user_id, format):
+        self.user_id = user_id
+        self.format = format
+        self.status = 'pending'
+        self.rows = self.invalid = self.diaries = self.entries = 0
+
+    def save(self):
+        """Save a job to the database"""
+        db.session.add(self)
+        commit()
+
+
+class ImportRow(db.Model):
+    """Staging table, validated rows of an import waiting to be merged
+    ref is the id a diary has in the imported file, diary_ref the one
+    an entry points at, diary_id the same when it is a number
+    """
+    __tablename__ = 'import_rows'
+    __table_args__ = (db.Index('ix_import_rows_job_id_ref', 'job_id', 'ref'),)
+
+    job_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    line = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    kind = db.Column(db.String(), nullable=False)
+    ref = db.Column(db.String())
+    diary_ref = db.Column(db.String())
+    diary_id = db.Column(db.Integer)
+    title = db.Column(db.String())
+    text = db.Column(db.String())
+    location = db.Column(db.String())
+    category = db.Column(db.String())
+    logo = db.Column(db.String())
+    created_at = db.Column(db.DateTime)
+
 
 class AuthToken(db.Model):
     """Stores all tokens during login"""
     __tablename__ = 'authtokens'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    token = db.Column(db.String(), nullable=False)
+    token = db.Column(db.String(), nullable=False, index=True)
     valid = db.Column(db.Boolean, nullable=False)
+    # requests with this token read from the primary until then,
+    # set after they write while read replicas are configured
+    primary_until = db.Column(db.DateTime)
 
     def __init__(self, token, valid=True):
         self.token = token
         self.valid = valid
 
+    @staticmethod
+    def stick_to_primary(token, seconds):
+        """Sends reads made with token to the primary for seconds"""
+        until = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=seconds)
+        AuthToken.query.filter_by(token=token).update(
+            {AuthToken.primary_until: until}, synchronize_session=False)
+        db.session.commit()
+
+    @staticmethod
+    def reads_primary(token):
+        """True while reads made with token go to the primary"""
+        return db.session.query(db.exists().where(db.and_(
+            AuthToken.token == token,
+            AuthToken.primary_until > datetime.datetime.utcnow()
+        ))).scalar()
+
     def save(self):
         """Save a entry to the database"""
         db.session.add(self)
-        db.session.commit()
+        commit()
     
\ No newline at end of file
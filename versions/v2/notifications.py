@@ -1,6 +1,8 @@
 from flask import Blueprint, jsonify
 from versions.v2.models import db, Notification, User
 from versions import login_required
+from versions.v2 import serializers
+from versions.v2.serializers import json_response, stream_response
 
 mod = Blueprint('notification_v2', __name__)
 
@@ -15,53 +17,52 @@ def get_notifications(current_user):
     ).all()
 
     if unread:
-        for notification in unread:
-            notification.read_at = db.func.current_timestamp()
-            notification.save()
+        ids = [notification.id for notification in unread]
+        Notification.mark_many_read(current_user, ids)
+        # reload once so the response carries read_at
+        unread = Notification.query.filter(
+            Notification.id.in_(ids)
+        ).populate_existing().all()
 
-        return jsonify({'notifications': [
-                {
-                    'id': notification.id,
-                    'recipient_id': notification.recipient.username,
-                    'actor': notification.actor,
-                    'diary_id': notification.diary_id,
-                    'entry_id': notification.entry_id,
-                    'action': notification.action,
-                    'created_at': notification.created_at,
-                    'read_at': notification.read_at,
-                    'act': notification.actor + notification.action,
-                    'url': '/diary/{}#entry-{}'.format(notification.diary_id, notification.entry_id)
-                } for notification in unread
-            ]}), 200
+        return json_response({
+            'notifications': serializers.notification.dump_many(unread)
+        }), 200
 
     return jsonify({'warning': 'user has no notifications'}), 200
 
 @mod.route('/all', methods=['GET'])
 @login_required
 def get_all_notifications(current_user):
-    """Fetch all unread notifications of current user"""
-    all_notifications = db.session.query(Notification).join(User).filter(
-        User.id==current_user
-    ).all()
+    """Fetch all notifications of current user, streamed
+    marks the unread ones read
+    """
+    history = Notification.query.filter(
+        Notification.recipient_id==current_user
+    ).order_by(Notification.id)
 
-    if all_notifications:
-        for notification in all_notifications:
-            notification.read_at = db.func.current_timestamp()
-            notification.save()
+    if db.session.query(history.exists()).scalar():
+        Notification.mark_all_read(current_user)
 
-        return jsonify({'notifications': [
-                {
-                    'id': notification.id,
-                    'recipient_id': notification.recipient.username,
-                    'actor': notification.actor,
-                    'diary_id': notification.diary_id,
-                    'entry_id': notification.entry_id,
-                    'action': notification.action,
-                    'created_at': notification.created_at,
-                    'read_at': notification.read_at,
-                    'act': notification.actor + notification.action,
-                    'url': '/diary/{}#entry-{}'.format(notification.diary_id, notification.entry_id)
-                } for notification in all_notifications
-            ]}), 200
+        return stream_response(
+            history.options(
+                db.joinedload(Notification.recipient).load_only('username')),
+            serializers.notification, 'notifications'
+        ), 200
 
     return jsonify({'warning': 'No New Notifications'}), 200
+
+
+@mod.route('/unread-count', methods=['GET'])
+@login_required
+def get_unread_count(current_user):
+    """Fetch number of unread notifications of current user
+    served from the users.unread_count counter cache
+    """
+    unread_count = db.session.query(User.unread_count).filter(
+        User.id==current_user
+    ).scalar()
+
+    if unread_count is None:
+        return jsonify({'warning': 'user does not exist'}), 404
+
+    return jsonify({'unread': max(unread_count, 0)}), 200
@@ -0,0 +1,257 @@
+"""Full-text search over entry titles and texts
+On Postgres entries are matched with plainto_tsquery against
+
+    setweight(to_tsvector('english', title), 'A') ||
+    setweight(to_tsvector('english', desc), 'B')
+
+the expression of the GIN index ix_entries_search (migration
+7e4a1c9b2f60), ranked with ts_rank and highlighted with ts_headline.
+The expression here and in the migration have to stay identical for
+the index to be used.
+
+Other databases (sqlite in tests) use InvertedIndex, built in process
+from the entries table. It is rebuilt when a commit wrote entries
+through the ORM, or when the entry count, max id or last update time
+changed (bulk writes like imports bypass the ORM). It matches whole
+lowercased words without stemming, so "running" does not find "run"
+like Postgres does. Ranks are not comparable between the two.
+
+Every query word has to match (AND). Results are ordered by rank, then
+newest id first, and paginated with a cursor, "<rank>:<id>" of the last
+result of the previous page.
+"""
+import collections
+import re
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from versions import db
+from versions.v2.models import Entry
+
+TS_CONFIG = 'english'
+START_SEL, STOP_SEL = '<mark>', '</mark>'
+# title matches weigh like Postgres' default weights for A and B
+TITLE_WEIGHT, TEXT_WEIGHT = 1.0, 0.4
+HEADLINE_WORDS = 35
+WORD = re.compile(r'\w+', re.UNICODE)
+STOPWORDS = frozenset((
+    'a an and are as at be but by for if in into is it no not of on or '
+    'such that the their then there these they this to was will with'
+).split())
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def parse_cursor(cursor):
+    """Returns (rank, id) of a cursor, None for the first page"""
+    if not cursor:
+        return None
+    try:
+        rank, entry_id = cursor.rsplit(':', 1)
+        return float(rank), int(entry_id)
+    except ValueError:
+        raise InvalidCursor(cursor)
+
+
+def make_cursor(rank, entry_id):
+    return '{!r}:{}'.format(rank, entry_id)
+
+
+def terms(text):
+    return [word for word in WORD.findall((text or '').lower())
+            if word not in STOPWORDS]
+
+
+def highlight(text, words, whole=False):
+    """Marks the words of text found in words, like ts_headline
+    only HEADLINE_WORDS words around the first match are kept
+    unless whole is set
+    """
+    if not text:
+        return text
+    matches = list(WORD.finditer(text))
+    hits = [i for i, match in enumerate(matches)
+            if match.group().lower() in words]
+    first, last = 0, len(matches)
+    if not whole and len(matches) > HEADLINE_WORDS:
+        first = max(0, (hits[0] if hits else 0) - 5)
+        last = min(len(matches), first + HEADLINE_WORDS)
+        first = max(0, last - HEADLINE_WORDS)
+
+    parts = []
+    position = matches[first].start() if first else 0
+    hits = set(hits)
+    for i in range(first, last):
+        match = matches[i]
+        parts.append(text[position:match.start()])
+        if i in hits:
+            parts.append(START_SEL + match.group() + STOP_SEL)
+        else:
+            parts.append(match.group())
+        position = match.end()
+    if last == len(matches):
+        parts.append(text[position:])
+    return ''.join(parts)
+
+
+class InvertedIndex(object):
+    """Word -> {entry id: weight} postings of the entries table"""
+
+    def __init__(self):
+        self.postings = collections.defaultdict(dict)
+        self.scopes = {}
+
+    def add(self, entry_id, title, text, user_id, diary_id):
+        self.scopes[entry_id] = (user_id, diary_id)
+        for weight, value in ((TITLE_WEIGHT, title), (TEXT_WEIGHT, text)):
+            for word in terms(value):
+                postings = self.postings[word]
+                postings[entry_id] = postings.get(entry_id, 0) + weight
+
+    def search(self, words, user_id=None, diary_id=None):
+        """Returns [(rank, id)] of entries holding every word, best first"""
+        words = set(words)
+        if not words:
+            return []
+        lists = sorted((self.postings.get(word, {}) for word in words),
+                       key=len)
+        ids = set(lists[0])
+        for postings in lists[1:]:
+            ids.intersection_update(postings)
+
+        results = []
+        for entry_id in ids:
+            scope = self.scopes[entry_id]
+            if user_id is not None and scope[0] != user_id:
+                continue
+            if diary_id is not None and scope[1] != diary_id:
+                continue
+            rank = sum(postings[entry_id] for postings in lists)
+            results.append((rank, entry_id))
+        results.sort(reverse=True)
+        return results
+
+
+_index = {'version': None, 'index': None}
+_index_lock = threading.Lock()
+
+
+def table_version():
+    """Changes whenever an entry is added, removed or updated"""
+    return tuple(db.session.query(
+        db.func.count(Entry.id), db.func.max(Entry.id),
+        db.func.max(Entry.updated_at)
+    ).one())
+
+
+def current_index():
+    """The InvertedIndex of the entries table, rebuilt when stale"""
+    version = table_version()
+    with _index_lock:
+        if _index['version'] != version:
+            index = InvertedIndex()
+            for row in db.session.query(
+                    Entry.id, Entry.title, Entry.desc, Entry.user_id,
+                    Entry.diary_id).yield_per(1000):
+                index.add(*row)
+            _index.update(version=version, index=index)
+        return _index['index']
+
+
+@event.listens_for(Entry, 'after_insert')
+@event.listens_for(Entry, 'after_update')
+@event.listens_for(Entry, 'after_delete')
+def entries_changed(mapper, connection, target):
+    object_session(target).info['entries_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def drop_stale_index(session):
+    if session.info.pop('entries_changed', False):
+        _index['version'] = None
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_changes(session):
+    session.info.pop('entries_changed', None)
+
+
+def document():
+    """The tsvector of an entry, as indexed by ix_entries_search"""
+    config = db.literal_column("'{}'".format(TS_CONFIG))
+    empty = db.literal_column("''")
+    return db.func.setweight(
+        db.func.to_tsvector(config, db.func.coalesce(Entry.title, empty)),
+        db.literal_column("'A'")
+    ).op('||')(db.func.setweight(
+        db.func.to_tsvector(config, db.func.coalesce(Entry.desc, empty)),
+        db.literal_column("'B'")))
+
+
+def search_postgres(q, user_id, diary_id, limit, after):
+    config = db.literal_column("'{}'".format(TS_CONFIG))
+    query = db.func.plainto_tsquery(config, q)
+    vector = document()
+    # ts_rank is a float4, compared with the float8 the cursor binds it
+    # rarely equals itself; as double precision the value round-trips
+    # through repr() in the cursor exactly
+    rank = db.cast(db.func.ts_rank(vector, query), db.Float(precision=53))
+    options = 'StartSel={}, StopSel={}'.format(START_SEL, STOP_SEL)
+
+    rows = db.session.query(
+        Entry, rank,
+        db.func.ts_headline(config, Entry.title, query,
+                            options + ', HighlightAll=true'),
+        db.func.ts_headline(config, Entry.desc, query, options)
+    ).options(
+        db.joinedload(Entry.entryer).load_only('username'),
+        db.joinedload(Entry.diary).load_only('name')
+    ).filter(vector.op('@@')(query))
+    if user_id is not None:
+        rows = rows.filter(Entry.user_id == user_id)
+    if diary_id is not None:
+        rows = rows.filter(Entry.diary_id == diary_id)
+    if after is not None:
+        rows = rows.filter(db.or_(
+            rank < after[0], db.and_(rank == after[0], Entry.id < after[1])))
+    return [
+        (entry, rank, {'title': title, 'desc': desc})
+        for entry, rank, title, desc in
+        rows.order_by(rank.desc(), Entry.id.desc()).limit(limit)
+    ]
+
+
+def search_index(q, user_id, diary_id, limit, after):
+    words = set(terms(q))
+    results = current_index().search(words, user_id, diary_id)
+    if after is not None:
+        results = [result for result in results if result < after]
+    page = results[:limit]
+
+    entries = dict((entry.id, entry) for entry in Entry.query.options(
+        db.joinedload(Entry.entryer).load_only('username'),
+        db.joinedload(Entry.diary).load_only('name')
+    ).filter(Entry.id.in_([entry_id for _, entry_id in page])))
+    return [
+        (entries[entry_id], rank, {
+            'title': highlight(entries[entry_id].title, words, whole=True),
+            'desc': highlight(entries[entry_id].desc, words)
+        })
+        for rank, entry_id in page if entry_id in entries
+    ]
+
+
+def search_entries(q, user_id=None, diary_id=None, limit=20, cursor=None):
+    """Returns ([(entry, rank, highlight)], next cursor or None)
+    raises InvalidCursor
+    """
+    after = parse_cursor(cursor)
+    search = (search_postgres if db.engine.dialect.name == 'postgresql'
+              else search_index)
+    results = search(q, user_id, diary_id, limit + 1, after)
+    if len(results) > limit:
+        entry, rank, _ = results[limit - 1]
+        return results[:limit], make_cursor(rank, entry.id)
+    return results, None
@@ -0,0 +1,222 @@
+"""Turns models into response dicts and dicts into json
+Each response shape is a Serializer built once at import time from a
+field list: a single operator.attrgetter fetches every attribute of a row
+in one call and datetimes are formatted as http dates (what jsonify
+renders) so the dicts hold nothing but json primitives.
+
+JSON_BACKEND config picks the encoder: json (stdlib), simplejson, ujson
+(5.4+, for default=), python-rapidjson or orjson, falling back to json
+when it is not installed or not one of these.
+Output is only indented when JSONIFY_PRETTYPRINT_REGULAR is on.
+
+stream_response sends large listings as they are read instead of
+building the whole list and body first.
+"""
+import datetime
+import json
+from operator import attrgetter
+from flask import current_app, stream_with_context
+from werkzeug.utils import import_string
+from versions import db
+
+_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+           'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def http_date(value):
+    """Formats a datetime like werkzeug.http.http_date"""
+    if value is None:
+        return None
+    return '{}, {:02d} {} {:04d} {:02d}:{:02d}:{:02d} GMT'.format(
+        _DAYS[value.weekday()], value.day, _MONTHS[value.month - 1],
+        value.year, value.hour, value.minute, value.second)
+
+
+class Serializer(object):
+    """Serializes rows to dicts
+    fields are attribute names or (key, dotted.attribute.path) pairs
+    dates lists the keys holding datetimes
+    extra(obj, data) may add computed keys
+    """
+
+    def __init__(self, fields, dates=(), extra=None):
+        pairs = [
+            (field, field) if isinstance(field, str) else field
+            for field in fields
+        ]
+        self.keys = tuple(key for key, _ in pairs)
+        paths = [path for _, path in pairs]
+        getter = attrgetter(*paths)
+        self._get = getter if len(paths) > 1 else (lambda obj: (getter(obj),))
+        self._dates = tuple(self.keys.index(key) for key in dates)
+        self._extra = extra
+
+    def dump(self, obj):
+        """Returns the dict for one row"""
+        values = self._get(obj)
+        if self._dates:
+            values = list(values)
+            for i in self._dates:
+                values[i] = http_date(values[i])
+        data = dict(zip(self.keys, values))
+        if self._extra is not None:
+            self._extra(obj, data)
+        return data
+
+    def dump_many(self, rows):
+        """Returns the list of dicts for many rows"""
+        return [self.dump(obj) for obj in rows]
+
+
+def _notification_extra(notification, data):
+    data['act'] = notification.actor + notification.action
+    data['url'] = '/diary/{}#entry-{}'.format(
+        notification.diary_id, notification.entry_id)
+
+
+def _import_job_extra(job, data):
+    data['errors'] = json.loads(job.errors) if job.errors else []
+
+
+TIMESTAMPS = ('created_at', 'updated_at')
+
+DIARY_DATES = TIMESTAMPS + ('last_entry_at',)
+
+diary = Serializer(
+    ['id', 'name', 'logo', 'location', 'category', 'bio',
+     ('owner', 'owner.username'), 'entry_count', 'last_entry_at',
+     'created_at', 'updated_at'],
+    dates=DIARY_DATES)
+new_diary = Serializer(
+    ['id', 'name', 'location', 'category', 'bio',
+     ('owner', 'owner.username')])
+user_diary = Serializer(
+    ['id', 'name', 'logo', 'location', 'category', 'bio',
+     'entry_count', 'last_entry_at', 'created_at', 'updated_at'],
+    dates=DIARY_DATES)
+diary_stub = Serializer(['id', 'name', 'entry_count'])
+
+entry = Serializer(
+    ['id', 'title', 'desc', ('entryer', 'entryer.username'),
+     ('diary', 'diary.name'), 'created_at', 'updated_at'],
+    dates=TIMESTAMPS)
+new_entry = Serializer(
+    ['id', 'title', ('entryer', 'entryer.username'), 'desc'])
+
+user = Serializer(
+    ['username', 'fullname', 'id', 'activate', 'email', 'diary_count'])
+user_stub = Serializer(['id', 'username', 'diary_count'])
+
+notification = Serializer(
+    ['id', ('recipient_id', 'recipient.username'), 'actor', 'diary_id',
+     'entry_id', 'action', 'created_at', 'read_at'],
+    dates=('created_at', 'read_at'),
+    extra=_notification_extra)
+
+import_job = Serializer(
+    ['id', 'format', 'status', 'rows', 'invalid', 'diaries', 'entries',
+     'created_at', 'finished_at'],
+    dates=('created_at', 'finished_at'),
+    extra=_import_job_extra)
+
+
+def _default(value):
+    if isinstance(value, datetime.datetime):
+        return http_date(value)
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+BACKENDS = ('json', 'simplejson', 'ujson', 'rapidjson', 'orjson')
+_backends = {}
+
+
+def get_backend(name):
+    """Returns dumps(data, pretty) for a JSON_BACKEND name
+    every backend renders datetimes with http_date through _default
+    """
+    if name in _backends:
+        return _backends[name]
+
+    requested = name
+    try:
+        module = import_string(name) if name in BACKENDS else json
+    except ImportError:
+        module = json
+    name = module.__name__
+
+    if name == 'orjson':
+        def dumps(data, pretty):
+            # datetimes go to _default instead of orjson's ISO format
+            option = module.OPT_PASSTHROUGH_DATETIME
+            if pretty:
+                option |= module.OPT_INDENT_2
+            return module.dumps(data, default=_default, option=option)
+    elif name == 'ujson':
+        def dumps(data, pretty):
+            return module.dumps(data, default=_default,
+                                indent=2 if pretty else 0,
+                                escape_forward_slashes=False)
+    elif name == 'rapidjson':
+        def dumps(data, pretty):
+            # compact unless indented, it takes no separators
+            return module.dumps(data, default=_default,
+                                indent=2 if pretty else None)
+    else:
+        def dumps(data, pretty):
+            if pretty:
+                return module.dumps(data, default=_default, indent=2)
+            return module.dumps(data, default=_default, separators=(',', ':'))
+
+    _backends[requested] = dumps
+    return dumps
+
+
+def json_response(data, status=200):
+    """Like jsonify but encoded with the configured JSON_BACKEND"""
+    config = current_app.config
+    dumps = get_backend(config.get('JSON_BACKEND', 'json'))
+    body = dumps(data, config.get('JSONIFY_PRETTYPRINT_REGULAR', False))
+    return current_app.response_class(
+        body, status=status, mimetype='application/json')
+
+
+def stream_response(query, serializer, key=None):
+    """Streams the rows of query as a json array, or {key: [...]}
+    Rows are fetched STREAM_BATCH_SIZE at a time with yield_per (a server
+    side cursor on Postgres) and each batch is sent as soon as it is
+    encoded, so memory stays flat however many rows there are.
+
+    The query runs on a session of its own, closed when the stream ends:
+    the body is sent after the request's after_request hooks, which may
+    commit the request session. It sees what the request committed.
+    Relations used by the serializer should be joinedload-ed, yield_per
+    drops rows of earlier batches and lazy loads would query per row.
+    """
+    app = current_app._get_current_object()
+    batch_size = app.config.get('STREAM_BATCH_SIZE', 500)
+    dumps = get_backend(app.config.get('JSON_BACKEND', 'json'))
+
+    def encode(row):
+        body = dumps(serializer.dump(row), False)
+        return body if isinstance(body, bytes) else body.encode('utf-8')
+
+    def generate():
+        session = db.create_session({'expire_on_commit': False})()
+        try:
+            yield b'{"' + key.encode('utf-8') + b'":[' if key else b'['
+            separator = b''
+            batch = []
+            for row in query.with_session(session).yield_per(batch_size):
+                batch.append(encode(row))
+                if len(batch) == batch_size:
+                    yield separator + b','.join(batch)
+                    separator, batch = b',', []
+            if batch:
+                yield separator + b','.join(batch)
+            yield b']}' if key else b']'
+        finally:
+            session.close()
+
+    return app.response_class(
+        stream_with_context(generate()), mimetype='application/json')
@@ -1,11 +1,17 @@
 """defines user routes
 get all users
+    cursor paginated on user id, next cursor is sent in X-Next-Cursor
 get all diaries that belongs to a user
 get all entries that belongs to a user
 get one user information
+export all diaries and entries of a user, see versions/v2/export.py
 """
-from flask import Blueprint, jsonify
-from versions.v2.models import User
+from flask import Blueprint, jsonify, request, current_app
+from versions.v2.models import User, Diary, db
+from versions import login_required
+from versions.v2 import serializers
+from versions.v2.export import FORMATS, export_response
+from versions.v2.serializers import json_response, stream_response
 
 
 mod = Blueprint('users_v2', __name__)
@@ -13,23 +19,33 @@ mod = Blueprint('users_v2', __name__)
 
 @mod.route('', methods=['GET'])
 def get_all_users():
-    """Read all users"""
-    users = User.query.all()
+    """Read all users
+    ?cursor= is the last user id of the previous page
+    ?limit= is capped at USERS_PAGE_SIZE_MAX
+    diary stubs are loaded for the whole page in one extra query
+    counts come from the diary_count and entry_count counter caches
+    """
+    cursor = request.args.get('cursor', default=0, type=int)
+    limit = request.args.get(
+        'limit', default=current_app.config['USERS_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['USERS_PAGE_SIZE_MAX']))
+
+    users = User.query.options(
+        db.load_only('id', 'username', 'diary_count'),
+        db.selectinload(User.diaries).load_only('id', 'name', 'entry_count')
+    ).filter(User.id > cursor).order_by(User.id).limit(limit + 1).all()
+
     if users:
-        return jsonify(
-            [
-                {
-                    'id': user.id,
-                    'username': user.username,
-                    'email': user.email,
-                    'diaries': [
-                        {
-                            'id': b.id,
-                            'name': b.name
-                        } for b in user.diaries] if user.diaries else None
-                } for user in users
-            ]
-        ), 200
+        has_next = len(users) > limit
+        users = users[:limit]
+        page = serializers.user_stub.dump_many(users)
+        for data, user in zip(page, users):
+            data['diaries'] = serializers.diary_stub.dump_many(
+                user.diaries) if user.diaries else None
+        response = json_response(page)
+        if has_next:
+            response.headers['X-Next-Cursor'] = str(users[-1].id)
+        return response, 200
     return jsonify({'warning': 'No Users'}), 200
 
 
@@ -38,35 +54,39 @@ def read_user(user_id):
     """Reads user given an ID"""
     user = User.query.get(user_id)
     if user:
-        return jsonify({'user': {
-            'username': user.username,
-            'fullname': user.fullname,
-            'id': user.id,
-            'activate': user.activate,
-            'email': user.email
-        }}), 200
+        return json_response({'user': serializers.user.dump(user)}), 200
 
     return jsonify({'warning': 'user does not exist'}), 404
 
 
 @mod.route('/<user_id>/diaries', methods=['GET'])
 def read_user_diaries(user_id):
-    """Read all diaries owned by this user"""
+    """Read all diaries owned by this user, streamed"""
     user = User.query.get(user_id)
     if user:
-        return jsonify(
-            [
-                {
-                    'id': diary.id,
-                    'name': diary.name,
-                    'logo': diary.logo,
-                    'location': diary.location,
-                    'category': diary.category,
-                    'bio': diary.bio,
-                    'created_at': diary.created_at,
-                    'updated_at': diary.updated_at
-                } for diary in user.diaries
-            ] if user.diaries else None
-        ), 200
+        diaries = Diary.query.filter_by(user_id=user.id).order_by(Diary.id)
+        if db.session.query(diaries.exists()).scalar():
+            return stream_response(diaries, serializers.user_diary), 200
+        return json_response(None), 200
 
     return jsonify({'warning': 'user does not own a diary'}), 200
+
+
+@mod.route('/<int:user_id>/export', methods=['GET'])
+@login_required
+def export_user(current_user, user_id):
+    """Streams the diaries and entries of the logged in user
+    ?format= is ndjson or csv
+    """
+    if current_user != user_id:
+        return jsonify({'warning': 'Not Allowed, you are not owner'}), 401
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({
+            'warning': 'format must be one of ' + ', '.join(sorted(FORMATS))
+        }), 400
+
+    return export_response(
+        user_id, fmt, request.headers.get('Range'),
+        request.headers.get('If-Range'))